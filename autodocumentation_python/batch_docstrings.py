@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import ast
+from autodocumentation_python.gptapi import gptapi
+from autodocumentation_python.run_metrics import stage
+from autodocumentation_python.tokens import count_tokens, OUTPUT_RATIO
+from autodocumentation_python.create_docstrings import (request_mode, code_budget, clean_code_answer,
+                                                        CHEAP_MODEL, COMMAND_WHOLE_CODE)
+
+FILE_START = '#### start of file:'
+FILE_END = '#### end of file:'
+MAX_BATCH_FILES = 10 #max. number of files per request
+
+#used for several small files in cheap mode (the answer is the code of all files with docstrings)
+COMMAND_BATCH = f"""
+{COMMAND_WHOLE_CODE}
+The code below "code to be edited:" consists of several python files. Every file starts with a
+line "{FILE_START} <path>" and ends with a line "{FILE_END} <path>".
+Output all files in the same order and keep these start and end lines exactly as they are,
+since your answer will be split into the single files again.
+"""
+
+
+def batch_code(files: dict) -> str:
+    """
+    Joins the code of several files, each enclosed by a start and an end line with its path.
+
+    Args:
+        files (dict): The relative paths of the files mapped to their code.
+
+    Returns:
+        str: The code of all files with delimiters.
+    """
+    parts = []
+    for rel_path, code in files.items():
+        parts.append(f'{FILE_START} {rel_path}\n{code.rstrip()}\n{FILE_END} {rel_path}\n')
+    return '\n'.join(parts)
+
+
+def split_batch_answer(answer: str, rel_paths: list) -> dict:
+    """
+    Splits the answer to a batch request into the code of the single files. Files which are
+    missing in the answer (or not closed by their end line) or whose code is not valid python are
+    left out, so they can be sent again on their own.
+
+    Args:
+        answer (str): The answer of the model.
+        rel_paths (list): The relative paths of the files of the batch.
+
+    Returns:
+        dict: The relative paths mapped to the code with docstrings.
+    """
+    starts = {f'{FILE_START} {rel_path}': rel_path for rel_path in rel_paths}
+    files = {}
+    current = None #relative path of the file which is read at the moment
+    lines = []
+    for line in answer.split('\n'):
+        stripped = line.strip()
+        if stripped in starts:
+            current, lines = starts[stripped], []
+        elif current is not None and stripped == f'{FILE_END} {current}':
+            code = clean_code_answer('\n'.join(lines)) + '\n'
+            try:
+                ast.parse(code)
+                files[current] = code
+            except SyntaxError:
+                pass
+            current = None
+        elif current is not None:
+            lines.append(line)
+    return files
+
+
+def pack_files(files: list, budget: int, max_files: int = MAX_BATCH_FILES) -> list:
+    """
+    Packs files into as few batches as possible (first fit, largest files first), so that the
+    tokens of every batch stay within the budget.
+
+    Args:
+        files (list): Tuples (key, tokens) of the files.
+        budget (int): The maximum number of tokens per batch.
+        max_files (int, optional): The maximum number of files per batch. Defaults to MAX_BATCH_FILES.
+
+    Returns:
+        list: The batches (lists of keys).
+    """
+    batches = [] #[tokens, keys]
+    for key, tokens in sorted(files, key=lambda file: file[1], reverse=True):
+        for batch in batches:
+            if batch[0] + tokens <= budget and len(batch[1]) < max_files:
+                batch[0] += tokens
+                batch[1].append(key)
+                break
+        else:
+            batches.append([tokens, [key]])
+    return [keys for _, keys in batches]
+
+
+def plan_batches(entries: list, Model: str, max_lno: int = None, info_tokens: int = 0) -> list:
+    """
+    Selects the files which would be sent as a whole to the cheap model (see `request_mode`) and
+    packs them into batches that fit into its context window together with the command, the
+    additional info and the expected answer (the code with docstrings).
+
+    Args:
+        entries (list): The entries of the .py files (see `scan_repository`).
+        Model (str): The GPT model used for docstring generation.
+        max_lno (int, optional): The maximum number of lines from which a code is split into snippets.
+            Defaults to None.
+        info_tokens (int, optional): Tokens of the additional info (summary of the repository). Defaults to 0.
+
+    Returns:
+        list: The batches (lists of entries) with at least two files. Files which are not part of a
+            batch are documented on their own.
+    """
+    budget = code_budget(CHEAP_MODEL, COMMAND_BATCH, info_tokens=info_tokens, output_ratio=1 + OUTPUT_RATIO)
+    candidates = {}
+    for entry in entries:
+        source = entry['source']
+        if source is None or not source.has_definitions:
+            continue
+        if request_mode(source.code, Model, 'cheap', max_lno=max_lno, info_tokens=info_tokens) == 'whole_code':
+            candidates[entry['path']] = entry
+    files = [(path, count_tokens(batch_code({entry['rel_path']: entry['source'].code}), CHEAP_MODEL))
+             for path, entry in candidates.items()]
+    return [[candidates[path] for path in batch] for batch in pack_files(files, budget) if len(batch) > 1]
+
+
+@stage('generate')
+def create_docstrings_batch(files: list, additional_info: str = None, write_gpt_output: bool = True) -> dict:
+    """
+    Generates docstrings for several small files with a single request to the cheap model (the
+    answer is the code of all files with docstrings, like `create_docstrings` in cheap mode).
+
+    Args:
+        files (list): Tuples (file_path, rel_path, gpt_path, code) of the files.
+        additional_info (str, optional): Additional information about the repository. Defaults to None.
+        write_gpt_output (bool, optional): Whether to write the GPT output of every file to its
+            gpt_path. Defaults to True.
+
+    Returns:
+        dict: The file paths mapped to the code with docstrings (only files which could be split
+            from the answer).
+    """
+    print(f'Analyze {len(files)} files in one request using {CHEAP_MODEL}:')
+    for file_path, _, _, _ in files:
+        print(f'    {file_path}')
+    print("    Docstrings are generated. Waiting for a gpt response...")
+    code = batch_code({rel_path: code for _, rel_path, _, code in files})
+    answer = gptapi(code, COMMAND_BATCH, additional_info=additional_info, Model=CHEAP_MODEL)
+    answers = split_batch_answer(clean_code_answer(answer), [rel_path for _, rel_path, _, _ in files])
+
+    edited = {}
+    for file_path, rel_path, gpt_path, _ in files:
+        if rel_path not in answers:
+            print(f'    No valid answer for {rel_path}, the file is sent again on its own.')
+            continue
+        edited[file_path] = answers[rel_path]
+        if write_gpt_output:
+            os.makedirs(os.path.dirname(gpt_path), exist_ok=True)
+            with open(gpt_path, "w") as file:
+                file.write(answers[rel_path])
+    return edited
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import re
+import sys
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import yaml
+from autodocumentation_python.main import main
+from autodocumentation_python.check_config import load_config, config_path
+from autodocumentation_python.clone_source import is_valid_url
+from autodocumentation_python.cost_estimator import rate_limits
+from autodocumentation_python.rate_limiter import RateLimiter
+from autodocumentation_python.response_cache import write_json_atomic
+
+#options of `main` which can be set per repository (or for all under 'defaults')
+OPTIONS = {'cost', 'write_gpt_output', 'max_lno', 'Model', 'summarize_repository', 'workers', 'base_url',
+           'use_cache', 'refresh_cache', 'incremental', 'full_context', 'stream', 'resume',
+           'quality_threshold'}
+DEFAULTS = {'cost': 'expensive', 'write_gpt_output': True, 'max_lno': None, 'Model': 'gpt-4-1106-preview',
+            'summarize_repository': True, 'workers': 4}
+
+
+def load_jobs(sources: list, defaults: dict = None) -> list:
+    """
+    Builds the list of repositories of a batch run. A source is a URL/path or a .yaml/.json file of
+    the form {'defaults': {option: value}, 'repositories': [{'source': URL/path, option: value}]}
+    (a repository may also be given as a plain string).
+
+    Args:
+        sources (list): The URLs/paths and spec files.
+        defaults (dict, optional): Options for all repositories (overridden by the spec files). Defaults to None.
+
+    Returns:
+        list: The jobs ({'source': ..., 'options': {...}}).
+
+    Raises:
+        ValueError: If a spec file contains an unknown option.
+    """
+    jobs = []
+    for source in sources:
+        if source.endswith(('.yaml', '.yml', '.json')) and os.path.isfile(source):
+            with open(source, "r") as file:
+                spec = yaml.safe_load(file) or {} #json is valid yaml
+            spec_dir = os.path.dirname(os.path.abspath(source))
+            spec_defaults = {**(defaults or {}), **spec.get('defaults', {})}
+            for repository in spec.get('repositories', []):
+                if isinstance(repository, str):
+                    repository = {'source': repository}
+                repository = dict(repository)
+                path = repository.pop('source')
+                if not is_valid_url(path) and not os.path.isabs(path):
+                    path = os.path.join(spec_dir, path) #local paths are relative to the spec file
+                jobs.append({'source': path, 'options': {**spec_defaults, **repository}})
+        else:
+            jobs.append({'source': source, 'options': dict(defaults or {})})
+
+    for job in jobs:
+        unknown = set(job['options']) - OPTIONS
+        if unknown:
+            raise ValueError(f"Unknown option(s) for {job['source']}: {', '.join(sorted(unknown))}")
+        if not is_valid_url(job['source']):
+            job['source'] = os.path.abspath(job['source'])
+        job['options'] = {**DEFAULTS, **job['options']}
+    return jobs
+
+
+def work_dir_name(index: int, source: str) -> str:
+    """
+    Returns the name of the work directory of a repository, e.g. '03_autodoc'.
+    """
+    name = os.path.basename(source.rstrip('/\\')) or 'source'
+    name = re.sub(r'\.git$', '', name)
+    return f'{index:02d}_' + re.sub(r'[^\w.-]', '_', name)
+
+
+def run_repository(job: dict) -> dict:
+    """
+    Documents one repository in its own work directory (called in a worker process). The console
+    output is written to 'autodoc.log' in the work directory, the run does not ask any questions
+    and never edits the source files.
+
+    Returns:
+        dict: The record of the repository for the report.
+    """
+    os.makedirs(job['work_dir'], exist_ok=True)
+    record = {'source': job['source'], 'work_dir': job['work_dir'], 'log': os.path.join(job['work_dir'], 'autodoc.log'),
+              'options': job['options'], 'status': 'ok', 'error': None}
+    start = time.time()
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(record['log'], "w") as log:
+        sys.stdout = sys.stderr = log
+        try:
+            result = main(job['source'], work_dir=job['work_dir'], assume_yes=True, edit_in_file=False,
+                          limiter=job['limiter'], **job['options'])
+            record.update(result or {})
+        except BaseException as err: #also SystemExit, a failed repository must not stop the batch
+            traceback.print_exc()
+            record['status'] = 'failed'
+            record['error'] = f'{type(err).__name__}: {err}'
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+    record['duration'] = round(time.time() - start, 1)
+    return record
+
+
+def run_batch(jobs: list, output_dir: str, processes: int = 2, rpm: float = None, tpm: float = None) -> dict:
+    """
+    Documents several repositories with a pool of processes. Every repository gets its own work
+    directory in `output_dir`. All processes share one rate limiter (requests and tokens per minute
+    of the API key) and the on-disk response cache, and a consolidated report is written to
+    `output_dir`/report.json.
+
+    Args:
+        jobs (list): The repositories (see `load_jobs`).
+        output_dir (str): The directory of the work directories and the report.
+        processes (int, optional): The number of repositories documented at the same time. Defaults to 2.
+        rpm (float, optional): Requests per minute of all processes together. Defaults to None (rate
+            limit of the model of the first repository, see `rate_limits`).
+        tpm (float, optional): Tokens per minute of all processes together. Defaults to None (as rpm).
+
+    Returns:
+        dict: The report.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    limits = rate_limits(jobs[0]['options']['Model']) if jobs else {}
+    rpm = rpm or limits.get('rpm')
+    tpm = tpm or limits.get('tpm')
+    print(f'Documenting {len(jobs)} repositories with {processes} processes (shared limit: {rpm} requests, {tpm} tokens per minute).')
+
+    start = time.time()
+    records = []
+    with multiprocessing.Manager() as manager:
+        limiter = RateLimiter.shared(manager, rpm, tpm)
+        for index, job in enumerate(jobs, start=1):
+            job['work_dir'] = os.path.join(os.path.abspath(output_dir), work_dir_name(index, job['source']))
+            job['limiter'] = limiter
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(run_repository, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    record = future.result()
+                except Exception as err: #e.g. the worker process died
+                    record = {'source': job['source'], 'work_dir': job['work_dir'], 'status': 'failed',
+                              'error': f'{type(err).__name__}: {err}'}
+                records.append(record)
+                print(f"    [{len(records)}/{len(jobs)}] {record['status']}: {record['source']}"
+                      + (f" ({record['error']})" if record['error'] else f" ({record.get('duration')}s)"))
+
+    order = {job['source']: i for i, job in enumerate(jobs)}
+    records.sort(key=lambda record: order.get(record['source'], 0))
+    report = {
+        'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start)),
+        'duration': round(time.time() - start, 1),
+        'processes': processes,
+        'rate_limit': {'rpm': rpm, 'tpm': tpm},
+        'succeeded': sum(record['status'] == 'ok' for record in records),
+        'failed': sum(record['status'] != 'ok' for record in records),
+        'repositories': records,
+    }
+    report_path = os.path.join(output_dir, 'report.json')
+    write_json_atomic(report_path, report)
+
+    print(f"\nFinished {report['succeeded']}/{len(jobs)} repositories in {report['duration']}s:")
+    for record in records:
+        files = f"{record['files']} files" if record.get('files') is not None else ''
+        print(f"    {record['status']:<7}{files:>10}  {record['source']}")
+    print(f'Report: {report_path}')
+    return report
+
+
+def execute():
+    """
+    Command line entry point of the batch runner ('autodoc-batch').
+    """
+    parser = argparse.ArgumentParser(description="Document several repositories/folders in one non-interactive run.")
+    parser.add_argument("sources", nargs='+', help="URLs/paths of the repositories and/or .yaml/.json files listing them (with per-repository options)")
+    parser.add_argument("--output", type=str, default='autodoc_batch', help="directory of the work directories (one per repository) and of report.json")
+    parser.add_argument("--processes", type=int, default=2, help="number of repositories documented at the same time")
+    parser.add_argument("--rpm", type=float, default=None, help="requests per minute of all processes together (default: rate limit of the model)")
+    parser.add_argument("--tpm", type=float, default=None, help="tokens per minute of all processes together (default: rate limit of the model)")
+    parser.add_argument("--cost", type=str, help="default 'cost' of the repositories")
+    parser.add_argument("--Model", type=str, help="default 'Model' of the repositories")
+    parser.add_argument("--workers", type=int, help="default number of files documented at the same time per repository")
+    parser.add_argument("--resume", action='store_true', help="continue the interrupted runs in the work directories of the same --output")
+    args = parser.parse_args()
+
+    if not load_config().get('api_key'):
+        print(f'No API key found in {config_path()}. Run autodoc once or create the file with the key "api_key".')
+        sys.exit(1)
+    defaults = {key: value for key, value in (('cost', args.cost), ('Model', args.Model), ('workers', args.workers),
+                                              ('resume', args.resume or None)) if value is not None}
+    report = run_batch(load_jobs(args.sources, defaults), args.output, processes=args.processes, rpm=args.rpm, tpm=args.tpm)
+    sys.exit(1 if report['failed'] else 0)
+
+
+if __name__ == "__main__":
+    execute()
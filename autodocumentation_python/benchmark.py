@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import traceback
+import yaml
+from autodocumentation_python.main import main
+from autodocumentation_python.mock_server import MockServer, LATENCIES
+from autodocumentation_python.response_cache import write_json_atomic
+
+SIZES = (10, 100, 1000) #numbers of files of the synthetic repositories
+FILES_PER_PACKAGE = 25
+WORDS = ('data', 'value', 'item', 'node', 'path', 'config', 'result', 'count', 'name', 'index',
+         'buffer', 'record', 'token', 'window', 'weight', 'score', 'batch', 'cache', 'limit', 'shape')
+
+
+def make_module(rng: random.Random) -> str:
+    """
+    Returns the code of a synthetic module: functions and classes of varying size, some with
+    (partial) docstrings, so generation and comparison are both exercised.
+    """
+    parts = ['import os\nimport math\n']
+    for _ in range(rng.randint(2, 6)):
+        name = '_'.join(rng.sample(WORDS, 2))
+        params = rng.sample(WORDS, rng.randint(0, 3))
+        body = [f'    {param}_{i} = {param} if {param} is not None else {i}' for i, param in enumerate(params)]
+        body += [f'    total = math.sqrt({rng.randint(1, 100)}) + len(os.sep)'] * rng.randint(1, 8)
+        docstring = [f'    """\n    Computes the {name.replace("_", " ")}.\n    """'] if rng.random() < 0.3 else []
+        if rng.random() < 0.3:
+            body_lines = [f'    def {name}(self, {", ".join(params)}):' if params else f'    def {name}(self):']
+            body_lines += ['    ' + line for line in docstring + body + ['    return total']]
+            parts.append(f'class {name.title().replace("_", "")}:\n\n' + '\n'.join(body_lines) + '\n')
+        else:
+            parts.append(f'def {name}({", ".join(params)}):\n' + '\n'.join(docstring + body + ['    return total']) + '\n')
+    return '\n\n'.join(parts)
+
+
+def make_repository(directory: str, files: int, seed: int = 0) -> str:
+    """
+    Writes a synthetic repository (packages of FILES_PER_PACKAGE modules and a README.md).
+
+    Args:
+        directory (str): The directory of the repository (created).
+        files (int): The number of python files.
+        seed (int, optional): Seed of the generated code. Defaults to 0.
+
+    Returns:
+        str: The directory.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'README.md'), "w") as file:
+        file.write(f'# Synthetic repository\n\n{files} generated python modules to benchmark autodoc.\n')
+    for i in range(files):
+        package = os.path.join(directory, f'package_{i // FILES_PER_PACKAGE:03d}')
+        if not os.path.exists(package):
+            os.makedirs(package)
+            open(os.path.join(package, '__init__.py'), "w").close()
+        with open(os.path.join(package, f'module_{i:04d}.py'), "w") as file:
+            file.write(make_module(rng))
+    return directory
+
+
+def run_benchmark(sizes: tuple = SIZES, output_dir: str = None, repeat_cached: bool = False, server_options: dict = None,
+                  **options) -> dict:
+    """
+    Documents synthetic repositories of the given sizes end to end against a local mock API (see
+    `MockServer`) and measures the throughput in files, requests and tokens per second. The runs
+    use a temporary home directory (config, response cache and summaries), so neither the API key
+    nor the cache of the user are touched, and nothing is paid.
+
+    Args:
+        sizes (tuple, optional): The numbers of files. Defaults to SIZES.
+        output_dir (str, optional): The directory of the repositories, work directories, logs and
+            report.json. Defaults to None (a temporary directory, deleted afterwards).
+        repeat_cached (bool, optional): Runs every size a second time, answered by the response
+            cache. Defaults to False.
+        server_options (dict, optional): Arguments of `MockServer` (latency, errors, ...). Defaults to None.
+        **options: Arguments of `main` (e.g. cost, Model, workers, stream).
+
+    Returns:
+        dict: The report (one record per run).
+    """
+    keep = output_dir is not None
+    output_dir = os.path.abspath(output_dir or tempfile.mkdtemp(prefix='autodoc_benchmark_'))
+    os.makedirs(output_dir, exist_ok=True)
+    options = {'cost': 'expensive', 'write_gpt_output': False, 'max_lno': None, 'Model': 'gpt-4-1106-preview',
+               'summarize_repository': True, 'workers': 4, **options}
+    home = os.path.join(output_dir, 'home')
+    os.makedirs(home, exist_ok=True)
+    with open(os.path.join(home, 'config_autodoc.yaml'), "w") as file:
+        yaml.dump({'api_key': 'mock', 'cache_dir': os.path.join(home, 'cache')}, file)
+
+    records = []
+    home_before = os.environ.get('HOME')
+    os.environ['HOME'] = home #the config is read from the home directory
+    try:
+        for size in sizes:
+            repository = make_repository(os.path.join(output_dir, f'repository_{size}'), size)
+            for cached in (False, True) if repeat_cached else (False,):
+                records.append(run_once(repository, size, output_dir, cached, server_options or {}, options))
+                record = records[-1]
+                print(f"    {size:>5} files{' (cached)' if cached else '':<9} {record['status']:<7}"
+                      f"{record['duration']:>8.1f}s {record['files_per_second']:>8.2f} files/s "
+                      f"{record['requests_per_second']:>8.2f} requests/s {record['tokens_per_second']:>10.0f} tokens/s")
+    finally:
+        if home_before is None:
+            os.environ.pop('HOME', None)
+        else:
+            os.environ['HOME'] = home_before
+
+    report = {'started': records[0]['started'] if records else None, 'options': options,
+              'server': server_options or {}, 'runs': records}
+    if keep:
+        write_json_atomic(os.path.join(output_dir, 'report.json'), report)
+        print(f"Report: {os.path.join(output_dir, 'report.json')}")
+    else:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return report
+
+
+def run_once(repository: str, size: int, output_dir: str, cached: bool, server_options: dict, options: dict) -> dict:
+    """
+    Documents one synthetic repository with a new mock server (console output in a log file).
+
+    Returns:
+        dict: The record of the run.
+    """
+    name = f'{size}_cached' if cached else str(size)
+    work_dir = os.path.join(output_dir, f'work_{name}')
+    record = {'files': size, 'cached': cached, 'status': 'ok', 'error': None,
+              'started': time.strftime('%Y-%m-%d %H:%M:%S'), 'log': os.path.join(output_dir, f'autodoc_{name}.log')}
+    with MockServer(**server_options) as server:
+        stdout, stderr = sys.stdout, sys.stderr
+        start = time.perf_counter()
+        with open(record['log'], "w") as log:
+            sys.stdout = sys.stderr = log
+            try:
+                result = main(repository, work_dir=work_dir, assume_yes=True, edit_in_file=False,
+                              base_url=server.base_url, **options)
+                record['documented_files'] = (result or {}).get('files')
+                record['metrics'] = (result or {}).get('metrics') #per stage, see run_metrics
+            except BaseException as err: #also SystemExit, the other sizes are still measured
+                traceback.print_exc()
+                record['status'] = 'failed'
+                record['error'] = f'{type(err).__name__}: {err}'
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+        duration = time.perf_counter() - start
+        stats = dict(server.stats)
+
+    tokens = stats['prompt_tokens'] + stats['completion_tokens']
+    record.update({'duration': round(duration, 2), 'server': stats,
+                   'files_per_second': round(size / duration, 3),
+                   'requests_per_second': round(stats['requests'] / duration, 3),
+                   'tokens_per_second': round(tokens / duration, 1)})
+    return record
+
+
+def execute():
+    """
+    Command line entry point of the benchmark ('autodoc-benchmark').
+    """
+    parser = argparse.ArgumentParser(description="Measure the throughput of autodoc end to end against a local mock API (no costs).")
+    parser.add_argument("--sizes", type=int, nargs='+', default=list(SIZES), help="numbers of files of the synthetic repositories")
+    parser.add_argument("--output", type=str, default=None, help="directory of the repositories, logs and report.json (default: temporary, deleted afterwards)")
+    parser.add_argument("--cached", dest='repeat_cached', action='store_true', help="run every size a second time (answered by the response cache)")
+    parser.add_argument("--cost", type=str, default='expensive', help="'cost' of the runs")
+    parser.add_argument("--Model", type=str, default='gpt-4-1106-preview', help="'Model' of the runs")
+    parser.add_argument("--workers", type=int, default=4, help="number of files documented at the same time")
+    parser.add_argument("--no_stream", dest='stream', action='store_false', help="wait for complete answers instead of streaming them")
+    parser.add_argument("--latency", type=str, default='lognormal', choices=LATENCIES, help="distribution of the time to the first token")
+    parser.add_argument("--latency_mean", dest='latency_mean', type=float, default=0.2, help="mean time to the first token [s]")
+    parser.add_argument("--tokens_per_second", dest='tokens_per_second', type=float, default=None, help="speed of the generation (default: instantly)")
+    parser.add_argument("--error_rate", dest='error_rate', type=float, default=0.0, help="probability of an error 500")
+    parser.add_argument("--rate_limit_rate", dest='rate_limit_rate', type=float, default=0.0, help="probability of an error 429")
+    args = parser.parse_args()
+
+    server_options = {name: getattr(args, name) for name in ('latency', 'latency_mean', 'tokens_per_second',
+                                                             'error_rate', 'rate_limit_rate')}
+    print(f'Benchmark with {", ".join(map(str, args.sizes))} files (mock API: {server_options}):')
+    report = run_benchmark(tuple(args.sizes), output_dir=args.output, repeat_cached=args.repeat_cached,
+                           server_options=server_options, cost=args.cost, Model=args.Model, workers=args.workers,
+                           stream=args.stream)
+    sys.exit(1 if any(record['status'] != 'ok' for record in report['runs']) else 0)
+
+
+if __name__ == "__main__":
+    execute()
@@ -7,23 +7,57 @@
 
 import os
 import yaml
-import openai
+from autodocumentation_python.llm_client import configure_client
+from autodocumentation_python.response_cache import ResponseCache
+from autodocumentation_python.resilience import RetryPolicy
 
-def check_config():
+def config_path():
+    return os.path.join(os.path.expanduser("~"), "config_autodoc.yaml")
+
+
+def load_config() -> dict:
+    """
+    Reads the optional settings of 'config_autodoc.yaml' (e.g. 'prices' or 'rate_limits') without
+    asking for an API key.
+
+    Returns:
+        dict: The content of the config file (empty if there is none).
+    """
+    if not os.path.exists(config_path()):
+        return {}
+    with open(config_path(), "r") as config_file:
+        return yaml.safe_load(config_file) or {}
+
+
+def check_config(base_url: str = None, max_connections: int = 20, use_cache: bool = True, refresh_cache: bool = False,
+                 limiter=None):
     """
     This function checks for the existence of a configuration file named 'config_autodoc.yaml' in the
     home directory. If the file does not exist, it prompts the user to input their OpenAI API key and
-    creates a new configuration file with this key. If the file exists, it reads the API key from the
-    file and sets it as the OpenAI API key.
+    creates a new configuration file with this key. If the file exists, it reads the API key (and the
+    optional 'base_url') from the file and configures the client shared by all API calls with it.
     
     Args:
-        None
+        base_url (str, optional): Base URL of an OpenAI compatible API. Overrides 'base_url' of the
+            config file. Defaults to None (OpenAI API).
+        max_connections (int, optional): Size of the connection pool of the client. Defaults to 20.
+        use_cache (bool, optional): If True, the responses of the API are cached on disk (directory,
+            size and age can be set with 'cache_dir', 'cache_max_mb' and 'cache_max_age_days' in the
+            config file). Defaults to True.
+        refresh_cache (bool, optional): If True, cached responses are ignored and replaced by new
+            ones. Defaults to False.
+        limiter (RateLimiter, optional): Rate limiter of all API calls (e.g. shared by the processes of
+            a batch run). Defaults to None.
+
+    The resilience of the API calls can be set in the config file as well: 'timeout' (seconds per
+    request, default 600), 'max_retries' (default 6) and 'fallback_models' (e.g.
+    {'gpt-4-1106-preview': ['gpt-4']}).
     
     Returns:
-        None
+        dict: The content of the config file.
     """
     home_directory = os.path.expanduser("~")
-    config_file_path = os.path.join(home_directory, "config_autodoc.yaml")
+    config_file_path = config_path()
 
     if not os.path.exists(config_file_path):
         print(f'No config_autodoc.yaml found in {home_directory}. You can create it yourself (path: {config_file_path}) or we can do it for you.')
@@ -38,5 +72,14 @@ def check_config():
 
     with open(config_file_path, "r") as config_file:
         config = yaml.safe_load(config_file)
-    openai.api_key = config["api_key"]
+    cache = None
+    if use_cache:
+        cache = ResponseCache(config.get("cache_dir"), max_mb=config.get("cache_max_mb", 500),
+                              max_age_days=config.get("cache_max_age_days", 30), refresh=refresh_cache)
+        cache.evict()
+    configure_client(config["api_key"], base_url=base_url or config.get("base_url"), max_connections=max_connections,
+                     cache=cache, timeout=config.get("timeout", 600), retry=RetryPolicy(retries=config.get("max_retries", 6)),
+                     fallback_models=config.get("fallback_models"), limiter=limiter)
+
+    return config
 
@@ -7,27 +7,64 @@
 
 import os
 import shutil
-import urllib.request
+import re
 import sys
-from git import Repo
+import pathlib
+import urllib.parse
+import urllib.request
+from git import Repo, GitCommandError
+
+SPARSE_PATTERNS = ['*.py', '*.md', '*.rst'] #the only files used by autodoc
 
 
 def is_valid_url(url: str) -> bool:
     """
-    Checks if a given URL is valid by attempting to open it. This function is used to validate 
-    the URL of a GitHub repository before cloning it.
+    Checks if a given source is the URL of a git repository (http(s)://, git://, ssh://, file:// 
+    or scp-like user@host:path). Only the form of the URL is checked - nothing is downloaded, an 
+    unreachable repository is reported by the clone itself.
     
     Args:
         url (str): The URL to be checked.
     
     Returns:
-        bool: Returns True if the URL is valid and can be opened, otherwise returns False.
+        bool: Returns True if the source is a repository URL, otherwise returns False.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme in ('http', 'https', 'git', 'ssh'):
+        return bool(parsed.netloc)
+    if parsed.scheme == 'file':
+        return os.path.isdir(urllib.request.url2pathname(parsed.path))
+    return re.match(r'^[\w.-]+@[\w.-]+:[^/]', url) is not None and not os.path.exists(url)
+
+
+def is_bare_repository(path: str) -> bool:
     """
+    Checks if a local directory is a bare git repository (no working tree, e.g. a mirror). Such a
+    repository is cloned like a remote one instead of being copied.
+    """
+    return (os.path.isfile(os.path.join(path, 'HEAD')) and os.path.isdir(os.path.join(path, 'objects'))
+            and os.path.isdir(os.path.join(path, 'refs')))
+
+
+def clone_repository(url: str, target_dir: str) -> None:
+    """
+    Clones a repository as cheap as possible: only the latest commit (depth 1), without downloading
+    file contents upfront (partial clone, --filter=blob:none) and with a sparse checkout of the
+    file types used by autodoc (SPARSE_PATTERNS). Large histories and binary assets are therefore
+    never downloaded. If the server or the local git does not support partial clones/sparse
+    checkouts, git falls back to a normal (shallow) checkout.
+    
+    Args:
+        url (str): The URL of the repository.
+        target_dir (str): The (empty) directory the repository is cloned into.
+    """
+    repo = Repo.clone_from(url, target_dir, depth=1, multi_options=['--filter=blob:none', '--no-checkout'])
     try:
-        response = urllib.request.urlopen(url)
-        return True
-    except Exception:
-        return False
+        repo.git.sparse_checkout('set', '--no-cone', *SPARSE_PATTERNS)
+    except GitCommandError:
+        print('    Sparse checkout not supported by your git version, checking out all files.')
+    repo.git.checkout()
+
 
 def check_path(source_path):
     if not os.path.exists(source_path):
@@ -36,23 +73,25 @@ def check_path(source_path):
     else:
         return source_path
 
-def clone_source(source_path: str, target_dir: str) -> None:
+def clone_source(source_path: str, target_dir: str, assume_yes: bool = False) -> None:
     """
     Clones a source from a given input (URL or local path) into a target directory. If the input is a valid
-    URL, it clones the repository into the target directory. If the source is a valid local directory, it copies
+    URL or a local bare repository, it clones the repository (shallow and sparse, see `clone_repository`) into 
+    the target directory. If the source is a valid local directory, it copies
     the directory into the target directory. If the input is a valid local file, it copies the file into the
     target directory. If the input is neither a valid URL nor a valid local path, it raises a ValueError.
     
     Args:
         source_path (str): The input source to be cloned. It can be a URL or a local path.
         target_dir (str): The target directory where the source will be cloned.
+        assume_yes (bool, optional): If True, an existing target directory is deleted without asking. Defaults to False.
     
     Raises:
         ValueError: If source_path is neither a valid URL nor a valid local path.
     """
 
     if os.path.isdir(target_dir):
-        confirmation = input(f"The path {target_dir} already exists. Do you want to delete it and continue? (yes[y]/no[n]): ")
+        confirmation = 'y' if assume_yes else input(f"The path {target_dir} already exists. Do you want to delete it and continue? (yes[y]/no[n]): ")
 
         if confirmation.lower() in ("yes", 'y'):
             shutil.rmtree(target_dir) # delete the already existing folder
@@ -68,8 +107,12 @@ def clone_source(source_path: str, target_dir: str) -> None:
 
     if is_valid_url(source_path):
         os.makedirs(target_dir)
-        Repo.clone_from(source_path, target_dir)
+        clone_repository(source_path, target_dir)
         print(f"Cloned repository into {target_dir} \n")
+    elif os.path.isdir(path) and is_bare_repository(path):
+        os.makedirs(target_dir)
+        clone_repository(pathlib.Path(path).resolve().as_uri(), target_dir) #file:// URL, otherwise git ignores --depth
+        print(f"Cloned repository {path} into {target_dir} \n")
     elif os.path.isdir(path):
         shutil.copytree(path, target_dir)
         print(f"Copied folder {path} into {target_dir} \n")
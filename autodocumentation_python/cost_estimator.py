@@ -5,122 +5,344 @@
 # Max-Planck-Institute of biological Intelligence, Munich, Germany
 # Authors: Karl Heggenberger, Joergen Kornfeld
 
-import os
-import re
+import ast
 import sys
 import shutil
-import subprocess
+from autodocumentation_python.scan_repository import scan_repository, python_files, doc_files
+from autodocumentation_python.tokens import count_tokens, count_message_tokens
+from autodocumentation_python.gptapi import gptapi_messages
+from autodocumentation_python.make_snippets import make_snippets
+from autodocumentation_python.check_config import load_config
+from autodocumentation_python.create_docstrings import (request_mode, code_budget, CHEAP_MODEL, COMMAND_WHOLE_CODE,
+                                                        COMMAND_DOCSTRINGS, COMMAND_SNIPPETS)
+from autodocumentation_python.insert_docstrings import (COMMAND_COMPARE, COMMAND_COMPARE_BATCH, COMPARE_BATCH_SIZE,
+                                                        DOCSTRING_START, DOCSTRING_END, compare_model)
+from autodocumentation_python.batch_docstrings import plan_batches, batch_code, COMMAND_BATCH
+from autodocumentation_python.repo_context import MAX_CONTEXT_TOKENS
+from autodocumentation_python.parsed_source import ParsedSource
+from autodocumentation_python.summarize_repo import (document_chunks, chunk_budget, reduce_levels,
+                                                     SUMMARY_TOKENS, PROMPT_TOKENS)
 
-def count_lines(file_path):
+# $ per 1000 tokens; can be extended/overwritten with 'prices' in config_autodoc.yaml, e.g.
+# prices: {gpt-4: {input: 0.03, output: 0.06}}
+MODEL_PRICES = {
+    'gpt-4-1106-preview': {'input': 0.01, 'output': 0.03},
+    'gpt-4': {'input': 0.03, 'output': 0.06},
+    'gpt-4-32k': {'input': 0.06, 'output': 0.12},
+    'gpt-3.5-turbo-16k': {'input': 0.003, 'output': 0.004},
+    'gpt-3.5-turbo': {'input': 0.0015, 'output': 0.002},
+}
+# requests/tokens per minute and generated tokens per second (per model); can be overwritten with
+# 'rate_limits' in config_autodoc.yaml, e.g. rate_limits: {default: {rpm: 500}, gpt-4: {tpm: 40000}} (0: unlimited)
+DEFAULT_RATE_LIMITS = {'rpm': 500, 'tpm': 150000, 'tokens_per_second': 30}
+
+SUMMARY_MODEL = 'gpt-4-1106-preview' #model used by summarize_repo
+DOCSTRING_TOKENS = 150 #average length of a generated docstring
+
+
+def load_prices(config: dict = None) -> dict:
+    """
+    Returns the price table (MODEL_PRICES updated with 'prices' of the config file).
+    """
+    config = load_config() if config is None else config
+    prices = {model: dict(price) for model, price in MODEL_PRICES.items()}
+    for model, price in (config.get('prices') or {}).items():
+        prices.setdefault(model, {}).update(price)
+    return prices
+
+
+def rate_limits(model: str, config: dict = None) -> dict:
     """
-    Counts the number of non-empty lines in a file.
-    
+    Returns the rate limits of a model (DEFAULT_RATE_LIMITS updated with 'rate_limits' of the config file).
+    A limit of 0 (or null) in the config file is returned as None (not limited).
+    """
+    config = load_config() if config is None else config
+    limits = dict(DEFAULT_RATE_LIMITS)
+    configured = config.get('rate_limits') or {}
+    limits.update(configured.get('default') or {})
+    limits.update(configured.get(model) or {})
+    return {name: limit or None for name, limit in limits.items()}
+
+
+def price(model: str, input_tokens: int, output_tokens: int, prices: dict = None) -> float:
+    """
+    Calculates the price [$] of tokens of a model (None if the model is not in the price table).
+    """
+    prices = load_prices() if prices is None else prices
+    if model not in prices:
+        return None
+    return (input_tokens * prices[model]['input'] + output_tokens * prices[model]['output']) / 1000
+
+
+def estimate_file(entry: dict, max_lno: int, Model: str, cost: str, info_tokens: int, batched: bool = False,
+                  nodes: list = None) -> list:
+    """
+    Builds the prompts that `create_docstrings` and `insert_docstrings` would send for a file (same
+    commands, same split into snippets) and counts their tokens.
+
     Args:
-        file_path (str): The path to the file.
-        
+        entry (dict): The entry of the file in the manifest of the repository (see `scan_repository`).
+        max_lno (int): The maximum number of lines from which a code is split into snippets (None: token budget).
+        Model (str): The GPT model used for docstring generation.
+        cost (str): 'cheap' or 'expensive'.
+        info_tokens (int): The number of tokens of the summary of the repository.
+        batched (bool, optional): If the docstrings of the file are generated by a batch request (see
+            `estimate_batch`), only the comparisons are estimated. Defaults to False.
+        nodes (list, optional): Qualified names of the classes/functions which are sent to the model (the
+            new or modified ones in incremental mode, see `RunManifest.plan`). Defaults to None (all).
+
+    Returns:
+        list: The estimated requests, dicts with the keys 'stage', 'model', 'input' and 'output' (tokens).
+    """
+    source = entry['source']
+    if source is None or not source.has_definitions:
+        return []
+    info_file = f'info about file: \n{source.skeleton}'
+    file_tokens = 0 #tokens of the skeleton if it is part of the additional info
+    documented = entry.get('documented')
+    if (documented or nodes is not None) and not batched: #only the other classes/functions are sent (see `docstring_quality`) with the skeleton of the file
+        file_tokens = count_tokens(info_file, Model)
+        info_tokens += file_tokens
+        nodes = [qualname for qualname in (nodes if nodes is not None else source.definitions) if qualname not in (documented or ())]
+        if not nodes:
+            return []
+        source = ParsedSource(source.code_of_nodes(nodes), entry['path'])
+    code = source.code
+    requests = []
+
+    def generated_tokens(defs, model):
+        #the answer consists of the definition lines and the generated docstrings
+        return sum(count_tokens(source.lines[node.lineno-1].strip(), model) for node in defs) + len(defs) * DOCSTRING_TOKENS
+
+    mode = 'batched' if batched else request_mode(code, Model, cost, max_lno=max_lno, info_tokens=info_tokens)
+    if mode == 'batched':
+        pass
+    elif mode == 'whole_code':
+        prompt = count_message_tokens(gptapi_messages(code, COMMAND_WHOLE_CODE, ''), CHEAP_MODEL) + info_tokens
+        output = count_tokens(code, CHEAP_MODEL) + len(source.nodes) * DOCSTRING_TOKENS
+        requests.append({'stage': 'generate', 'model': CHEAP_MODEL, 'input': prompt, 'output': output})
+    elif mode == 'docstrings':
+        prompt = count_message_tokens(gptapi_messages(code, COMMAND_DOCSTRINGS, ''), Model) + info_tokens
+        requests.append({'stage': 'generate', 'model': Model, 'input': prompt, 'output': generated_tokens(source.nodes, Model)})
+    elif mode == 'snippets':
+        info_tokens -= file_tokens #the skeleton is attached to every snippet anyway
+        max_tokens = code_budget(Model, COMMAND_SNIPPETS, info_file, info_tokens) if max_lno is None else None
+        line_start = 1
+        for snippet in make_snippets(entry['path'], max_lno=max_lno, max_tokens=max_tokens, model=Model, source=source):
+            defs = source.nodes_between(line_start, line_start + snippet['lines'] - 1)
+            line_start += snippet['lines']
+            if not defs:
+                continue
+            prompt = count_message_tokens(gptapi_messages(snippet['code'], COMMAND_SNIPPETS, info_file), Model) + info_tokens
+            requests.append({'stage': 'generate', 'model': Model, 'input': prompt, 'output': generated_tokens(defs, Model)})
+
+    #existing docstrings are compared to the generated ones (COMPARE_BATCH_SIZE pairs per request)
+    pairs = sum(1 for qualname, node in source.definitions.items()
+                if ast.get_docstring(node) is not None and qualname not in (documented or ()))
+    for start in range(0, pairs, COMPARE_BATCH_SIZE):
+        number = min(COMPARE_BATCH_SIZE, pairs - start)
+        if number == 1:
+            command = COMMAND_COMPARE.format(old_docstring='', new_docstring='')
+        else:
+            command = COMMAND_COMPARE_BATCH.format(start=DOCSTRING_START, end=DOCSTRING_END, pairs='')
+        requests.append({'stage': 'compare', 'model': compare_model(Model),
+                         'input': count_tokens(command, compare_model(Model)) + number * (2 * DOCSTRING_TOKENS + 20),
+                         'output': number * (DOCSTRING_TOKENS + 10)})
+    return requests
+
+
+def estimate_batch(entries: list, info_tokens: int) -> dict:
+    """
+    Estimates a batch request for several small files (see `batch_docstrings`).
+
+    Returns:
+        dict: The estimated request (see `estimate_file`).
+    """
+    code = batch_code({entry['rel_path']: entry['source'].code for entry in entries})
+    prompt = count_message_tokens(gptapi_messages(code, COMMAND_BATCH, ''), CHEAP_MODEL) + info_tokens
+    output = count_tokens(code, CHEAP_MODEL) + sum(len(entry['source'].nodes) for entry in entries) * DOCSTRING_TOKENS
+    return {'stage': 'generate', 'model': CHEAP_MODEL, 'input': prompt, 'output': output}
+
+
+def estimate_summary(repo_files: dict) -> list:
+    """
+    Estimates the requests of `summarize_repo` (same chunks; the tree reduction is estimated with
+    summaries of SUMMARY_TOKENS tokens).
+
     Returns:
-        int: The number of non-empty lines in the file.
+        list: The estimated requests (see `estimate_file`).
     """
-    with open(file_path, "r") as file:
-        return sum(1 for line in file if line.strip() != "")
+    budget = chunk_budget(SUMMARY_MODEL)
+    chunks = document_chunks(doc_files(repo_files), budget, SUMMARY_MODEL)
+    if not chunks:
+        return []
+    requests = [{'stage': 'summarize', 'model': SUMMARY_MODEL, 'input': count_tokens(chunk, SUMMARY_MODEL) + PROMPT_TOKENS,
+                 'output': SUMMARY_TOKENS} for chunk in chunks]
+    if len(chunks) == 1:
+        return requests
+    number = len(chunks)
+    for requests_level in reduce_levels(number, budget):
+        input_tokens = number * SUMMARY_TOKENS // requests_level + PROMPT_TOKENS
+        requests += [{'stage': 'summarize', 'model': SUMMARY_MODEL, 'input': input_tokens, 'output': SUMMARY_TOKENS}
+                     for _ in range(requests_level)]
+        number = requests_level
+    return requests
+
 
-def count_words(file_path):
+def estimate_run(repo_files: dict, max_lno: int, Model: str, cost: str, summarize_repository: bool = True,
+                 full_context: bool = False, summary_cached: bool = False, manifest=None) -> list:
     """
-    Counts the number of words in a file. A word is defined as a sequence of alphanumeric characters.
-    
+    Estimates all requests of a run.
+
     Args:
-        file_path (str): The path to the file.
-        
+        repo_files (dict): The manifest of the repository (see `scan_repository`).
+        max_lno (int): The maximum number of lines from which a code is split into snippets (None: token budget).
+        Model (str): The GPT model used for docstring generation.
+        cost (str): 'cheap' or 'expensive'.
+        summarize_repository (bool, optional): If the .md/.rst files are summarized. Defaults to True.
+        full_context (bool, optional): If the whole summary is attached to every request (otherwise at
+            most MAX_CONTEXT_TOKENS of relevant passages, see `RepoContext`). Defaults to False.
+        summary_cached (bool, optional): If the summary is reused from the cache (no summary requests).
+            Defaults to False.
+        manifest (RunManifest, optional): The manifest of the last run in incremental mode; only the new or
+            modified classes/functions are estimated (see `RunManifest.plan`). Defaults to None (all).
+
     Returns:
-        int: The number of words in the file.
+        list: The estimated requests (see `estimate_file`).
     """
-    with open(file_path, "r") as file:
-        content = file.read()
-        words = re.findall(r'\w+', content)
-        return len(words)
+    requests = []
+    info_tokens = 0
+    summary_requests = estimate_summary(repo_files) if summarize_repository else []
+    if summary_requests:
+        if not summary_cached:
+            requests += summary_requests
+        info_tokens = SUMMARY_TOKENS + 20 if full_context else MAX_CONTEXT_TOKENS
+    batched = set()
+    if cost == 'cheap' and manifest is None: #no batches in incremental mode (see `main`)
+        for batch in plan_batches(python_files(repo_files), Model, max_lno, info_tokens):
+            requests.append(estimate_batch(batch, info_tokens))
+            batched.update(entry['path'] for entry in batch)
+    for entry in python_files(repo_files):
+        nodes = None
+        if manifest is not None and entry['source'] is not None:
+            nodes, _ = manifest.plan(entry['rel_path'], entry['source'])
+        requests += estimate_file(entry, max_lno, Model, cost, info_tokens, batched=entry['path'] in batched, nodes=nodes)
+    return requests
+
 
-def count_code_and_words(directory, max_lno):
+def summarize_requests(requests: list, prices: dict, config: dict, workers: int = 4) -> dict:
     """
-    Counts the total lines of code and words in all Python, .rst, and .md files in a directory.
-    Also counts the number of files with lines of code above a maximum limit and the total lines in these files.
-    
+    Sums up estimated requests per stage and model, prices them and estimates the duration of the run.
+    The duration is limited by the rate limits (requests and tokens per minute of each model) and by
+    the generation speed of the model divided by the number of workers.
+
+    Returns:
+        dict: 'rows' (stage, model, requests, input tokens, output tokens, costs), 'total' [$],
+            'unknown_models' (models without price) and 'eta' [s].
+    """
+    rows = {}
+    for request in requests:
+        row = rows.setdefault((request['stage'], request['model']), [0, 0, 0])
+        row[0] += 1
+        row[1] += request['input']
+        row[2] += request['output']
+
+    table = []
+    total = 0
+    unknown_models = set()
+    per_model = {}
+    for (stage, model), (number, input_tokens, output_tokens) in rows.items():
+        costs = price(model, input_tokens, output_tokens, prices)
+        if costs is None:
+            unknown_models.add(model)
+        else:
+            total += costs
+        table.append((stage, model, number, input_tokens, output_tokens, costs))
+        model_totals = per_model.setdefault(model, [0, 0, 0])
+        model_totals[0] += number
+        model_totals[1] += input_tokens + output_tokens
+        model_totals[2] += output_tokens
+
+    eta_rate_limit = 0
+    generation_time = 0
+    for model, (number, tokens, output_tokens) in per_model.items():
+        limits = rate_limits(model, config)
+        if limits['rpm']: #None: not limited
+            eta_rate_limit = max(eta_rate_limit, 60 * number / limits['rpm'])
+        if limits['tpm']:
+            eta_rate_limit = max(eta_rate_limit, 60 * tokens / limits['tpm'])
+        generation_time += 1.0 * number
+        if limits['tokens_per_second']:
+            generation_time += output_tokens / limits['tokens_per_second']
+    eta = max(eta_rate_limit, generation_time / max(1, workers))
+    return {'rows': table, 'total': total, 'unknown_models': unknown_models, 'eta': eta}
+
+
+def format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    return f'{hours}h {rest // 60:02d}min' if hours else f'{rest // 60}min {rest % 60:02d}s'
+
+
+def cost_estimator(max_lno: int, target_dir: str, model, cost, repo_files: dict = None,
+                   summarize_repository: bool = True, workers: int = 4, full_context: bool = False,
+                   summary_cached: bool = False, assume_yes: bool = False, cleanup: bool = True, manifest=None):
+    """
+    Estimates the costs and the duration of a run and asks the user for confirmation. The tokens of
+    the prompts each file would produce (commands, summary of the repository, file skeleton and
+    snippets with the same split as `make_snippets`) are counted with the tokenizer of the model,
+    the length of the answers is estimated from the number of classes/functions.
+
     Args:
-        directory (str): The path to the directory.
-        max_lno (int): The maximum limit for lines of code in a file.
-        
+        max_lno (int): The maximum number of lines from which a code is split into snippets (None: token budget).
+        target_dir (str): The path of the repository.
+        model (str): The GPT model used for docstring generation.
+        cost (str): 'cheap' or 'expensive'.
+        repo_files (dict, optional): The manifest of the repository. Defaults to None (scanned).
+        summarize_repository (bool, optional): If the .md/.rst files are summarized. Defaults to True.
+        workers (int, optional): The number of files documented at the same time. Defaults to 4.
+        full_context (bool, optional): If the whole summary is attached to every request. Defaults to False.
+        summary_cached (bool, optional): If the summary is reused from the cache. Defaults to False.
+        assume_yes (bool, optional): If True, the run continues without asking. Defaults to False.
+        cleanup (bool, optional): If True, `target_dir` is deleted when the user does not continue (it was
+            cloned by this run). Defaults to True (False for a resumed run, whose work is kept).
+        manifest (RunManifest, optional): The manifest of the last run in incremental mode (see `estimate_run`).
+            Defaults to None.
+
     Returns:
-        tuple: The total lines of code, total words, number of files with lines of code above max_lno, 
-               and total lines in these files.
-    """
-    total_lines = 0
-    total_words = 0
-    num_files_above_max = 0
-    lines_above_max = 0
-    
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file.endswith(".py"):
-                lines = count_lines(file_path)
-                total_lines += lines
-                if lines > max_lno:
-                    num_files_above_max += 1
-                    lines_above_max += lines
-            elif file.endswith((".rst", ".md")):
-                total_words += count_words(file_path)
-    
-    return total_lines, total_words, num_files_above_max, lines_above_max
-
-def cost_estimator(max_lno: int, target_dir: str, model, cost):
-    # print(f"Total lines of code: {total_lines} -> {total_lines * 20} tokens")
-    # print(f"Total words in .rst and .md files: {total_words} -> {total_words * 1.25} tokens (< 16k tokens!!! else detailed == False)")
-    # print(f"Number of files with more than {max_lno} lines: {num_files_above_max}")
-    # print(f"Total lines in files above {max_lno} lines: {lines_above_max} -> {lines_above_max * 20} tokens (with gpt4)")
-    
-    total_lines, total_words, num_files_above_max, lines_above_max = count_code_and_words(target_dir, 300)
-    expensive_gpt4_32k = (total_lines * 20 * 0.12 + total_words * 1.25 * 0.004) / 1000
-    cheap_gpt4_32k = ((((total_lines - lines_above_max)*20*2) + (total_words *1.25)) * 0.004 + (lines_above_max * 20) * 0.12) / 1000
-    expensive_gpt4= (total_lines * 20 * 0.06 + total_words * 1.25 * 0.004) / 1000
-    cheap_gpt4 = ((((total_lines - lines_above_max)*20*2) + (total_words *1.25)) * 0.004 + (lines_above_max * 20) * 0.06) / 1000
-
-#a file with 3597 lines has 36455 tokens, a file summary of 14321 tokens and produces an gpt output of 12016 tokens -> input 36455+14321 = 50776 tokens; output 12016 tokens
-                                                                                                                    #input 14.116 tokens per line; output 3.34 tokens per line
-    #comparison of docstrings: 14321+12016 = 26337 -> 26337/3597 = 7.32 tokens per line for comparison input and 12016/3597 = 3.34 tokens per line for comparison output
-    expensive_gpt_4_1106_preview = (((total_lines * (14.116+7.32) + total_words * 1.25) * 0.01 + (total_lines) *2* 3.34 * 0.03)/ 1000)*2    #*2 because the price actually seems to be like this
-
-    print('To estimate the costs, we assume that one line of code corresponds to 20 tokens.')
-    print(f'Estimated costs with settings...')
-    print(f"    --cost 'expensive' --Model 'gpt-4-1106-preview':        {expensive_gpt_4_1106_preview:.2f}$")
-    print(f"    --cost 'expensive' --Model 'gpt-4':                     {expensive_gpt4:.2f}$")
-    print(f"    --cost 'expensive' --Model 'gpt-4-32k':                 {expensive_gpt4_32k:.2f}$")
-    print(f"    --cost 'cheap' --Model 'gpt-4':                         {cheap_gpt4:.2f}$")
-    print(f"    --cost 'cheap' --Model 'gpt-4-32k':                     {cheap_gpt4_32k:.2f}$")
-    print('Keep in mind: these are just rough estimates!!!\n')
-
-    if cost == 'expensive' and model == 'gpt-4':
-        print(f'Your are going to spent about {expensive_gpt4:.2f}$')
-    elif cost == 'expensive' and model == 'gpt-4-32k':
-        print(f'Your are going to spent about {expensive_gpt4_32k:.2f}$')
-    elif cost == 'cheap' and model == 'gpt-4':
-        print(f'Your are going to spent about {cheap_gpt4:.2f}$')
-    elif cost == 'cheap' and model == 'gpt-4-32k':
-        print(f'Your are going to spent about {cheap_gpt4_32k:.2f}$')
-    elif cost == 'expensive' and model == 'gpt-4-1106-preview':
-        print(f'Your are going to spent about {expensive_gpt_4_1106_preview:.2f}$')
-    else:
-        print('You have chooses a combination of setting I havent calculated the price for (probably cheap and gpt-4-1106-preview).')
-
-    confirmation = input("\nDo you want to continue with the program? (yes[y]/no[n]): ")
+        dict: The estimate (see `summarize_requests`).
+    """
+    if repo_files is None:
+        repo_files = scan_repository(target_dir)
+    config = load_config()
+    prices = load_prices(config)
+
+    requests = estimate_run(repo_files, max_lno, model, cost, summarize_repository, full_context, summary_cached, manifest)
+    estimate = summarize_requests(requests, prices, config, workers)
+    if not requests:
+        print('Estimated costs: no requests to the API are needed (0.00$).')
+        return estimate
+
+    print('Estimated costs (tokens counted with the tokenizer of each model):')
+    print(f'    {"stage":<11}{"model":<22}{"requests":>9}{"input tokens":>14}{"output tokens":>15}{"costs":>10}')
+    for stage, model_name, number, input_tokens, output_tokens, costs in estimate['rows']:
+        costs = f'{costs:.2f}$' if costs is not None else '?'
+        print(f'    {stage:<11}{model_name:<22}{number:>9}{input_tokens:>14}{output_tokens:>15}{costs:>10}')
+    for model_name in estimate['unknown_models']:
+        print(f"    No price known for '{model_name}' (add it under 'prices' in ~/config_autodoc.yaml).")
+    other_cost = 'cheap' if cost == 'expensive' else 'expensive'
+    other = summarize_requests(estimate_run(repo_files, max_lno, model, other_cost, summarize_repository, full_context, summary_cached,
+                                            manifest), prices, config, workers)
+    print(f"    (with --cost '{other_cost}': {other['total']:.2f}$)")
+    print('Keep in mind: the length of the answers is estimated!\n')
+    print(f'Your are going to spent about {estimate["total"]:.2f}$')
+    print(f'Estimated duration: {format_duration(estimate["eta"])} (workers: {workers})')
+
+    confirmation = 'y' if assume_yes else input("\nDo you want to continue with the program? (yes[y]/no[n]): ")
 
     if confirmation.lower() not in ("yes", 'y'):
-        shutil.rmtree(target_dir) # Clean up the cloned repository
+        if cleanup:
+            shutil.rmtree(target_dir) # Clean up the cloned repository
         print("Program terminated.")
         sys.exit(0)
 
-
-    if total_words * 1.25 < 120000:
-        detailed_repo_summary = True
-    else:
-        detailed_repo_summary = False
-
-    return detailed_repo_summary
+    return estimate
@@ -5,32 +5,173 @@
 # Max-Planck-Institute of biological Intelligence, Munich, Germany
 # Authors: Karl Heggenberger, Joergen Kornfeld
 
-import ast
 import os
-from autodocumentation_python.gptapi import gptapi
-from autodocumentation_python.summarize_file import code_info, node_info
+from autodocumentation_python.gptapi import gptapi, gptapi_messages
+from autodocumentation_python.docstring_stream import gptapi_blocks, replay_blocks
+from autodocumentation_python.parsed_source import ParsedSource
+from autodocumentation_python.repo_context import RepoContext
 from autodocumentation_python.make_snippets import make_snippets
+from autodocumentation_python.run_metrics import stage
+from autodocumentation_python.tokens import count_tokens, count_message_tokens, code_token_budget, OUTPUT_RATIO
 
 
-def class_or_func_present(code):
+CHEAP_MODEL = 'gpt-3.5-turbo-16k' #used for small files if cost == 'cheap'
+CHEAP_MAX_LNO = 300 #max. number of lines of a "small" file
+
+#used for small files in cheap mode (the answer is the whole code with docstrings)
+COMMAND_WHOLE_CODE = """
+Output this same code with DETAILED docstrings (or try to improve if one already exists)
+in google format for all 
+function and class. Never try to generate docstrings for the imports.
+Begin a new line if an individual line of the docstring is longer than 90 characters.
+Additional information is provided by the summary
+of the repository this code is embedded in.
+As an answer, only output the expanded code as a string, since your answer will be 
+directly inserted into a python file which must be executable.
+And keep any white spaces, indentation, and new lines in the code.
+Just print out the source code with the generated docstrings.
+"""
+COMMAND_WHOLE_CODE = ' '.join(line.strip() for line in COMMAND_WHOLE_CODE.split('\n')).strip()
+
+#used if the file is not split into snippets
+COMMAND_DOCSTRINGS = '''
+For the given python file below "code to be edited:" output ONLY the newly defined classes and functions
+(keeping the structure/indention!!!) as they are in the original code but with detailed generated
+docstrings and without the code inside. Hence the rules are:
+1. generate detailed docstrings in google format (max 90 characters per line)
+2. for every newly defined functions and classes - if not existing: output the string: " "
+3. not for imports or called functions/classes
+4. if function/class already has a docstring, try to improve or if already very well written reuse it
+5. format: only output docstrings with corresponding name of function/class 
+    and empty brackets: def/class name(args):\n"""\ndocstring\n""" . So dont print the code
+6. your output must be readable to the ast module!
+7. if no code provided, output an empty string ""
+8. Start your output with "start" and end with "end". Dont indent the main output.
+
+Maybe you be given additional information about the repository this code is embedded in
+under "additional information:" to better construe the variables and context of the code snippet.
+Dont create docstrings for this part.
+In the end check if all rules are fulfilled and adjust if necessary.
+'''
+
+#used for the snippets of files which do not fit into one request
+COMMAND_SNIPPETS = '''
+For the given python file below "code to be edited:" output the newly defined classes and functions
+(keeping the structure/indention!!!) as they are in the original code but with detailed generated
+docstrings and without the code inside. The rules are:
+1. Generate detailed docstrings in google format for ALL defined functions and classes 
+2. output format: output the the name and args of the function/class and below its generated docstring, also meaning
+that you should not print the code. Like this:
+def/class name(args):
+    """
+    Generated docstring
+    """
+3. Indent (bullet point 2.) the answers as they are in "code to be edited" -> keep the indention!
+4. A line of a docstring should not have more than 90 characters
+5. If a function/class already has a docstring, try to improve or if already very well written reuse i
+6. your output must be readable to the ast module
+7. Start your output with "start" and end with "end". Dont indent the main output!
+
+Maybe you be given additional information about the repository this code is embedded in
+under "additional information:" to better construe the variables and context of the code snippet.
+Dont create docstrings for this part.
+
+In the end check if all rules are fulfilled and adjust if necessary.
+'''
+
+
+def code_budget(Model: str, command: str, additional_info: str = None, info_tokens: int = 0,
+                output_ratio: float = OUTPUT_RATIO) -> int:
+    """
+    Calculates how many tokens of code fit into one request with the given command and additional info.
+    
+    Args:
+        Model (str): The GPT model.
+        command (str): The command of the request.
+        additional_info (str, optional): The additional info sent with the code. Defaults to None.
+        info_tokens (int, optional): Tokens of further additional info (e.g. the summary of the repository). Defaults to 0.
+        output_ratio (float, optional): Expected length of the answer relative to the code. Defaults to OUTPUT_RATIO.
+    
+    Returns:
+        int: The maximum number of tokens of code.
+    """
+    prompt_tokens = count_message_tokens(gptapi_messages('', command, additional_info), Model) + info_tokens
+    return code_token_budget(Model, prompt_tokens, output_ratio)
+
+
+def request_mode(code: str, Model: str, cost: str, max_lno: int = None, info_tokens: int = 0) -> str:
     """
-    This function checks if a Python file contains any class or function definitions.
+    Decides how a file is sent to the model (also used by the cost estimator). A file is only sent
+    as a whole if its tokens fit into the context window of the model together with the prompt and
+    the expected answer.
     
     Args:
-        code (str): The code to be analyzed.
+        code (str): The code.
+        Model (str): The GPT model used for docstring generation.
+        cost (str): 'cheap' or 'expensive'.
+        max_lno (int, optional): The maximum number of lines from which a code is split into snippets. 
+            Defaults to None (decided by the token budget of the model).
+        info_tokens (int, optional): Tokens of the additional info (summary of the repository). Defaults to 0.
     
     Returns:
-        bool: Returns True if the code contains class or function definitions, otherwise False.
+        str: 'whole_code' (small file in cheap mode, answer is the code with docstrings), 'docstrings' 
+            (answer are only the definitions with docstrings) or 'snippets' (file is split into snippets).
+    """
+    no_lines = len(code.splitlines())
+    if no_lines <= CHEAP_MAX_LNO and cost == 'cheap':
+        #the answer contains the whole code
+        if count_tokens(code, CHEAP_MODEL) <= code_budget(CHEAP_MODEL, COMMAND_WHOLE_CODE, info_tokens=info_tokens,
+                                                          output_ratio=1 + OUTPUT_RATIO):
+            return 'whole_code'
+    if max_lno is not None:
+        return 'docstrings' if no_lines <= max_lno else 'snippets'
+    if count_tokens(code, Model) <= code_budget(Model, COMMAND_DOCSTRINGS, info_tokens=info_tokens):
+        return 'docstrings'
+    return 'snippets'
+
+
+def clean_code_answer(edited_code: str) -> str:
+    """
+    Removes the markdown code fence (e.g. ```python) around code returned by the model.
+    """
+    code_lines = edited_code.split('\n')
+    if code_lines[0].startswith(('\'\'\'python', '```')):
+        del code_lines[0]
+    if code_lines and code_lines[-1].startswith(('\'\'\'', '```')):
+        del code_lines[-1]
+    return '\n'.join(code_lines)
+
+
+@stage('generate')
+def generate(code: str, command: str, Model: str, additional_info: str = None, temperature: float = 0.2,
+             on_block=None, journal=None, part: str = None) -> str:
+    """
+    Sends a request (see `gptapi`). If `on_block` is given, the answer is streamed and every complete
+    class/function is passed to `on_block` while the rest is still generated (see `gptapi_blocks`).
+    If a journal is given, the answer is recorded in it; an answer to the same request recorded by an
+    earlier (interrupted) run is replayed instead of sending the request again.
     """
-    tree = ast.parse(code)
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
-            return True
-    return False
+    key = None
+    if journal is not None:
+        key = journal.key(Model, gptapi_messages(code, command, additional_info), temperature)
+        answer = journal.answer(key)
+        if answer is not None:
+            print('    Answer replayed from the journal of the interrupted run.')
+            if on_block is not None:
+                replay_blocks(answer, on_block)
+            return answer
+    if on_block is None:
+        answer = gptapi(code, command, additional_info=additional_info, Model=Model, temperature=temperature)
+    else:
+        answer = gptapi_blocks(code, command, Model, on_block, additional_info=additional_info, temperature=temperature)
+    if journal is not None:
+        journal.generated(key, answer, part)
+    return answer
 
 
-def create_docstrings(file_path: str, gpt_path: str, additional_info: str = None, max_lno: int = 300, Model: str = "gpt-4-32k", 
-                 cost: str = 'cheap', write_gpt_output: bool = True):
+def create_docstrings(file_path: str, gpt_path: str, additional_info: str = None, max_lno: int = None, Model: str = "gpt-4-32k", 
+                 cost: str = 'cheap', write_gpt_output: bool = True, nodes: list = None, code: str = None,
+                 source: ParsedSource = None, context: RepoContext = None, on_block=None, journal=None):
     """
     This function generates detailed Google format docstrings for each function and class in a given Python file using the 
     gptapi. It handles large files by splitting them into smaller snippets and generating docstrings for each snippet separately. 
@@ -41,49 +182,57 @@ def create_docstrings(file_path: str, gpt_path: str, additional_info: str = None
         additional_info (str, optional): Additional information about the repository that the code is embedded in. 
                                           This can help in generating more accurate docstrings. Defaults to None.
         max_lno (int, optional): The maximum number of lines that the function can handle in a single file. If the file 
-                                  is larger than this, it will be split into smaller snippets. Defaults to 500.
+                                  is larger than this, it will be split into smaller snippets. Defaults to None (files 
+                                  and snippets are sized by the token budget of the context window of the model).
         Model (str, optional): The model to use for generating the docstrings. Defaults to "gpt-3.5-turbo".
         cost (str, optional): The cost of generating the docstrings, if the file is not split into snippets. 'cheap' 
                                will use gpt-3.5-turbo and the output will be the whole file (code+docstrings). 
                                'expensive' will use gpt-4 and the output will be only the docstrings. Defaults to 'cheap'.
         write_gpt_output (bool, optional): Whether to write the GPT output/docstrings to a file. Defaults to True.
+        nodes (list, optional): Qualified names of the classes/functions which should be documented (e.g. only 
+                                the new or modified ones in incremental mode). Only the code of these nodes is sent 
+                                to the model (see `code_of_nodes`), together with the skeleton of the whole file. 
+                                Defaults to None (whole file).
+        code (str, optional): The code of the file, if it was already read. Defaults to None (the file is read).
+        source (ParsedSource, optional): The parsed code of the file, if it was already parsed. Defaults to None.
+        context (RepoContext, optional): If given, every request gets only the information about the repository 
+                                         which is relevant to its code (instead of `additional_info`). Defaults to None.
+        on_block (callable, optional): If given, the answers are streamed and every complete class/function is 
+                                       passed to it at once (e.g. `DocstringInserter.add`). Defaults to None.
+        journal (FileJournal, optional): If given, the answers are recorded in the journal of the run, and answers 
+                                         recorded by an interrupted run are replayed. Defaults to None.
     
     Returns:
         str: The generated docstrings.
     """
-    with open(file_path, "r") as file:
-        code = file.read()
-        file.seek(0)
-        no_lines = len(file.readlines())
+    if source is None:
+        if code is None:
+            with open(file_path, "r") as file:
+                code = file.read()
+        source = ParsedSource(code, file_path)
+    full_source = source
+    if nodes is not None:
+        source = ParsedSource(source.code_of_nodes(nodes), file_path)
+    code = source.code
+    if context is not None:
+        additional_info = context.for_code(code)
+    info_file = f'info about file: \n{full_source.skeleton}'
+    repo_info = additional_info
+    if nodes is not None: #the skeleton shows the rest of the file (other classes/functions, nesting)
+        additional_info = (repo_info + '\n' + info_file) if repo_info else info_file
 
-
-    if no_lines <= 300 and cost == 'cheap':
-        Model = 'gpt-3.5-turbo-16k'
+    info_tokens = count_tokens(additional_info, Model) if additional_info else 0
+    mode = request_mode(code, Model, cost, max_lno=max_lno, info_tokens=info_tokens)
+    if mode == 'whole_code':
+        Model = CHEAP_MODEL
         print(f'Analyze file directly using {Model}: ', file_path)
-        if not class_or_func_present(code):
+        if not source.has_definitions:
             print('    No class- or function-definitions found. No docstrings are generated.')
             return ''
-        command = """
-Output this same code with DETAILED docstrings (or try to improve if one already exists)
-in google format for all 
-function and class. Never try to generate docstrings for the imports.
-Begin a new line if an individual line of the docstring is longer than 90 characters.
-Additional information is provided by the summary
-of the repository this code is embedded in.
-As an answer, only output the expanded code as a string, since your answer will be 
-directly inserted into a python file which must be executable.
-And keep any white spaces, indentation, and new lines in the code.
-Just print out the source code with the generated docstrings.
-"""
-        command = ' '.join(line.strip() for line in command.split('\n')).strip()
         print("    Docstrings are generated. Waiting for a gpt response...")
-        edited_code = gptapi(code, command, additional_info=additional_info, Model=Model) #gptapi(code, command, additional_info=additional_info, Model = 'gpt-3.5-turbo')
-        code_lines = edited_code.split('\n')
-        if code_lines[0].startswith('\'\'\'python'):
-            del code_lines[0]
-        if code_lines[-1].startswith('\'\'\''):
-            del code_lines[-1]
-        edited_code = '\n'.join(code_lines)
+        edited_code = generate(code, COMMAND_WHOLE_CODE, additional_info=additional_info, Model=Model, on_block=on_block,
+                               journal=journal, part='file') #gptapi(code, command, additional_info=additional_info, Model = 'gpt-3.5-turbo')
+        edited_code = clean_code_answer(edited_code)
 
         if write_gpt_output:
             os.makedirs(os.path.dirname(gpt_path), exist_ok=True)
@@ -93,34 +242,15 @@ Just print out the source code with the generated docstrings.
         return edited_code
 
     
-    if (no_lines <= max_lno and cost == 'expensive') or (300<no_lines<=max_lno and cost == 'cheap'):
+    if mode == 'docstrings':
         print(f'Analyze file directly using {Model}: ', file_path)
-        if not class_or_func_present(code):
+        if not source.has_definitions:
             print('    No class- or function-definitions found. No docstrings are generated.')
             return ''
 
-        command = '''
-For the given python file below "code to be edited:" output ONLY the newly defined classes and functions
-(keeping the structure/indention!!!) as they are in the original code but with detailed generated
-docstrings and without the code inside. Hence the rules are:
-1. generate detailed docstrings in google format (max 90 characters per line)
-2. for every newly defined functions and classes - if not existing: output the string: " "
-3. not for imports or called functions/classes
-4. if function/class already has a docstring, try to improve or if already very well written reuse it
-5. format: only output docstrings with corresponding name of function/class 
-    and empty brackets: def/class name(args):\n"""\ndocstring\n""" . So dont print the code
-6. your output must be readable to the ast module!
-7. if no code provided, output an empty string ""
-8. Start your output with "start" and end with "end". Dont indent the main output.
-
-Maybe you be given additional information about the repository this code is embedded in
-under "additional information:" to better construe the variables and context of the code snippet.
-Dont create docstrings for this part.
-In the end check if all rules are fulfilled and adjust if necessary.
-'''
-        #command = '\n'.join(line.strip() for line in command.split('\n')).strip()
         print("    Docstrings are generated. Waiting for a gpt response...")
-        docstrings = gptapi(code, command, additional_info=additional_info, Model=Model)
+        docstrings = generate(code, COMMAND_DOCSTRINGS, additional_info=additional_info, Model=Model, on_block=on_block,
+                              journal=journal, part='file')
         if write_gpt_output:
             os.makedirs(os.path.dirname(gpt_path), exist_ok=True)
             with open(gpt_path, "w") as file:
@@ -128,58 +258,42 @@ In the end check if all rules are fulfilled and adjust if necessary.
 
         return docstrings
 
-    elif no_lines > max_lno:
+    elif mode == 'snippets':
         print(f'analyzing file by splitting it into snippets (Model: {Model}): ', file_path)
 
-        info_file = f'info about file: \n{code_info(file_path)}'
-        info = (additional_info + '\n' + info_file) if additional_info else info_file
-        code_snippets = make_snippets(file_path, max_lno=max_lno)
+        info = (repo_info + '\n' + info_file) if repo_info else info_file
+        if context is not None: #the information about the repository is selected for every snippet (at most context.max_tokens)
+            max_tokens = code_budget(Model, COMMAND_SNIPPETS, info_file, info_tokens=context.max_tokens)
+        else:
+            max_tokens = code_budget(Model, COMMAND_SNIPPETS, info)
+        max_tokens = max_tokens if max_lno is None else None
+        with stage('snippet'):
+            code_snippets = make_snippets(file_path, max_lno=max_lno, max_tokens=max_tokens, model=Model, source=source)
         #See how code is divided into snippets
         # for i, snippet in enumerate(code_snippets):
         #     print(f"{i+1}; lines: {snippet['lines']} ----------------------------")
         #     print(snippet['code'])
 
-        command = '''
-For the given python file below "code to be edited:" output the newly defined classes and functions
-(keeping the structure/indention!!!) as they are in the original code but with detailed generated
-docstrings and without the code inside. The rules are:
-1. Generate detailed docstrings in google format for ALL defined functions and classes 
-2. output format: output the the name and args of the function/class and below its generated docstring, also meaning
-that you should not print the code. Like this:
-def/class name(args):
-    """
-    Generated docstring
-    """
-3. Indent (bullet point 2.) the answers as they are in "code to be edited" -> keep the indention!
-4. A line of a docstring should not have more than 90 characters
-5. If a function/class already has a docstring, try to improve or if already very well written reuse i
-6. your output must be readable to the ast module
-7. Start your output with "start" and end with "end". Dont indent the main output!
-
-Maybe you be given additional information about the repository this code is embedded in
-under "additional information:" to better construe the variables and context of the code snippet.
-Dont create docstrings for this part.
-
-In the end check if all rules are fulfilled and adjust if necessary.
-'''
-        #command = ' '.join(line.strip() for line in command.split('\n')).strip()
+        if write_gpt_output and os.path.isfile(gpt_path):
+            os.remove(gpt_path) #the answers of the snippets are appended (e.g. left over by an interrupted run)
         docstrings = '' #this will be a str of the edited func/classes
         line_start = 1
         for i, code_snippet in enumerate(code_snippets):
             print(f'    Docstrings are generated for snippet {i+1} (line {line_start}-{line_start+code_snippet["lines"]}) ...')
-            try:
-                if not class_or_func_present(code_snippet['code']):
-                    print('    '*2 + 'No class- or function-definitions found in snippet. No docstrings are generated.')
-                    line_start += code_snippet['lines']
-                    continue
-            except Exception:
-                pass
+            if not source.nodes_between(line_start, line_start + code_snippet['lines'] - 1):
+                print('    '*2 + 'No class- or function-definitions found in snippet. No docstrings are generated.')
+                line_start += code_snippet['lines']
+                continue
             # if i+1 != 2: #to examine a specific snippet
             #     print(f'    skipped snippet {i+1} (line {line_start}-{line_start+code_snippet["lines"]})')
             #     line_start += code_snippet['lines']
             #     continue
             temperature = 0.2
-            docstring = gptapi(code_snippet['code'], command, additional_info=info, Model=Model, temperature=temperature) + '\n'
+            if context is not None:
+                snippet_info = context.for_code(code_snippet['code'])
+                info = (snippet_info + '\n' + info_file) if snippet_info else info_file
+            docstring = generate(code_snippet['code'], COMMAND_SNIPPETS, additional_info=info, Model=Model, temperature=temperature,
+                                 on_block=on_block, journal=journal, part=f'snippet {i+1}') + '\n'
             if write_gpt_output:
                 os.makedirs(os.path.dirname(gpt_path), exist_ok=True)
                 with open(gpt_path, "a") as file:
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import re
+import textwrap
+from autodocumentation_python.docstring_quality import SECTIONS, DOCUMENTED_PARAM, parse_sections
+
+ENTRY_SECTIONS = {'Args', 'Raises', 'Attributes'} #sections which list names (parameters, exceptions, attributes)
+KEYED_SECTIONS = ENTRY_SECTIONS | {'Returns', 'Yields', 'Examples'} #rendered with their google name
+COVERAGE = 0.6 #share of the words of a text which must occur in the other one, so it does not conflict
+STOPWORDS = {'the', 'and', 'for', 'with', 'this', 'that', 'from', 'are', 'its', 'into', 'which', 'will',
+             'given', 'not', 'all', 'can', 'has', 'have', 'been', 'was', 'were', 'each', 'used', 'also'}
+
+NUMPY_ENTRY = re.compile(r'^\*{0,2}(\w+)\s*(?::\s*(.*))?$')
+
+
+def section_key(title: str) -> str:
+    """
+    Returns the key of a section: its google name for the sections which are merged entry by entry
+    or replaced as a whole (e.g. 'Parameters' -> 'Args'), otherwise the title itself.
+    """
+    name = SECTIONS.get(title.strip().lower())
+    return name if name in KEYED_SECTIONS else title.strip()
+
+
+def keyed_sections(docstring: str) -> tuple:
+    """
+    Splits a docstring into its free text and its sections (see `docstring_quality.parse_sections`)
+    and groups the sections by their key (see `section_key`).
+
+    Returns:
+        tuple: The free text (str) and the sections (dict: key mapped to a dict with the keys 'title',
+            'lines' and 'numpy').
+    """
+    text, parsed = parse_sections(docstring)
+    sections = {}
+    for section in parsed:
+        current = sections.setdefault(section_key(section['title']),
+                                      {'title': section['title'], 'lines': [], 'numpy': section['numpy']})
+        current['lines'] += section['lines']
+    return text, sections
+
+
+def parse_entries(section: dict) -> list:
+    """
+    Splits an Args/Raises/Attributes section into its entries and converts numpy entries to the
+    google format ('name (type): description').
+
+    Returns:
+        list: The entries (name, lines) or None, if the section does not consist of entries.
+    """
+    entries = []
+    for line in section['lines']:
+        if line.strip() and not line[0].isspace():
+            match = (NUMPY_ENTRY if section['numpy'] else DOCUMENTED_PARAM).match(line.strip())
+            if match is None:
+                return None
+            if section['numpy']:
+                kind = f' ({match.group(2).strip()})' if match.group(2) else ''
+                line = f'{line.strip().split(":")[0].strip()}{kind}:'
+            entries.append((match.group(1), [line]))
+        elif entries:
+            entries[-1][1].append(line)
+        elif line.strip():
+            return None
+    if section['numpy']: #the description is on the lines below the name
+        entries = [(name, [(lines[0] + ' ' + textwrap.dedent('\n'.join(lines[1:])).strip().split('\n')[0]).rstrip()]
+                    + ['    ' + line.strip() for line in textwrap.dedent('\n'.join(lines[1:])).strip().split('\n')[1:]])
+                   for name, lines in entries]
+    return entries
+
+
+def section_lines(section: dict, key: str) -> list:
+    """
+    Returns the lines of a section in google format (numpy entries are converted, see `parse_entries`).
+    """
+    if section['numpy'] and key in ENTRY_SECTIONS | {'Returns', 'Yields'}:
+        entries = parse_entries(section)
+        if entries is not None:
+            return [line for _, lines in entries for line in lines]
+    return section['lines']
+
+
+def content_words(text: str) -> set:
+    words = re.findall(r'[a-z0-9_]+', text.lower())
+    return {word.rstrip('s') for word in words if len(word) > 2 and word not in STOPWORDS}
+
+
+def covers(text: str, other: str) -> bool:
+    """
+    Returns True if `text` contains (nearly) all the information of `other` (COVERAGE of its words).
+    """
+    words = content_words(other)
+    return not words or len(words & content_words(text)) / len(words) >= COVERAGE
+
+
+def merge_docstrings(old_docstring: str, new_docstring: str, params: list = None) -> str:
+    """
+    Merges an existing and a generated docstring without a model. The sections are combined entry
+    by entry: for parameters, exceptions and attributes documented in both, the old entry is kept,
+    the ones documented only in the generated docstring are added (old ones are only dropped if they
+    are no parameters of the function). Other sections (e.g. Returns) are taken from the old
+    docstring if it has them. The free text (summary and description) of the generated docstring is
+    used if it covers the old one (or the old one is used if it covers the generated one). The
+    result is in google format.
+
+    Args:
+        old_docstring (str): The existing docstring (google or numpy format).
+        new_docstring (str): The generated docstring.
+        params (list, optional): The parameters of the function; old Args entries of other names are
+            dropped. Defaults to None (all old entries are kept).
+
+    Returns:
+        str: The merged docstring or None, if the free texts conflict (the model has to compare them).
+    """
+    old_text, old_sections = keyed_sections(old_docstring)
+    new_text, new_sections = keyed_sections(new_docstring)
+    if covers(new_text, old_text):
+        text = new_text or old_text
+    elif covers(old_text, new_text):
+        text = old_text
+    else:
+        return None
+
+    merged = {}
+    for key in list(new_sections) + [key for key in old_sections if key not in new_sections]:
+        old, new = old_sections.get(key), new_sections.get(key)
+        if old is None or new is None:
+            lines = section_lines(old or new, key)
+        elif key in ENTRY_SECTIONS and parse_entries(old) is not None and parse_entries(new) is not None:
+            old_entries, new_entries = dict(parse_entries(old)), parse_entries(new)
+            names = [name for name, _ in new_entries]
+            entries = [old_entries.get(name, lines) for name, lines in new_entries]
+            entries += [lines for name, lines in old_entries.items()
+                        if name not in names and (key != 'Args' or params is None or name in params)]
+            lines = [line for entry in entries for line in entry]
+        else:
+            lines = section_lines(old, key)
+        title = key if key in KEYED_SECTIONS else (old or new)['title']
+        merged[title] = lines
+
+    parts = [text] if text else []
+    for title, lines in merged.items():
+        parts.append(f'{title}:\n' + '\n'.join(('    ' + line).rstrip() for line in lines))
+    return '\n\n'.join(parts)
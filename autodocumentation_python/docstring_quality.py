@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import re
+import ast
+import textwrap
+
+QUALITY_THRESHOLD = 0.8 #classes/functions whose docstring scores at least this are not sent to the model
+MIN_SUMMARY_WORDS = 3
+MIN_WORDS = 6 #shorter docstrings get a lower score for their length
+
+#google style section headers (and common aliases) -> name of the section
+SECTIONS = {'args': 'Args', 'arguments': 'Args', 'parameters': 'Args', 'params': 'Args',
+            'keyword args': 'Args', 'keyword arguments': 'Args', 'other parameters': 'Args',
+            'returns': 'Returns', 'return': 'Returns', 'yields': 'Yields', 'yield': 'Yields',
+            'raises': 'Raises', 'exceptions': 'Raises', 'attributes': 'Attributes',
+            'example': 'Examples', 'examples': 'Examples', 'note': 'Note', 'notes': 'Note',
+            'warning': 'Note', 'warnings': 'Note', 'see also': 'Note', 'todo': 'Note'}
+SECTION_HEADER = re.compile(r'^([A-Za-z][A-Za-z ]*):\s*$') #google style, e.g. 'Args:'
+NUMPY_UNDERLINE = re.compile(r'^\s*-{3,}\s*$') #numpy style, the title is underlined
+DOCUMENTED_PARAM = re.compile(r'^\s*\*{0,2}(\w+)\s*(\([^)]*\))?\s*:')
+
+
+def parse_sections(docstring: str) -> tuple:
+    """
+    Splits a google or numpy style docstring into its free text (summary and description) and its
+    sections. This is the parser shared by the scoring and the merging of docstrings.
+
+    Args:
+        docstring (str): The docstring (as returned by `ast.get_docstring`).
+
+    Returns:
+        tuple: The free text (str) and the sections (list of dicts with the keys 'title', 'name' (the
+            name of the section, see SECTIONS), 'lines' (dedented lines of the section) and 'numpy').
+    """
+    lines = docstring.expandtabs().strip('\n').splitlines()
+    text = []
+    sections = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        google = SECTION_HEADER.match(line)
+        numpy = (i + 1 < len(lines) and NUMPY_UNDERLINE.match(lines[i+1]) and line.strip()
+                 and line.strip().lower() in SECTIONS and not line[0].isspace())
+        if numpy or (google and google.group(1).strip().lower() in SECTIONS):
+            title = line.strip().rstrip(':')
+            sections.append({'title': title, 'name': SECTIONS[title.strip().lower()], 'lines': [], 'numpy': bool(numpy)})
+            i += 2 if numpy else 1
+            continue
+        (sections[-1]['lines'] if sections else text).append(line)
+        i += 1
+    for section in sections:
+        section['lines'] = textwrap.dedent('\n'.join(section['lines'])).strip('\n').splitlines()
+    return '\n'.join(text).strip(), sections
+
+
+def parse_docstring(docstring: str) -> tuple:
+    """
+    Splits a google or numpy style docstring into its summary and its sections (see `parse_sections`).
+
+    Returns:
+        tuple: The summary (first paragraph, str) and the sections (dict: name of the section, e.g.
+            'Args', mapped to its lines).
+    """
+    text, parsed = parse_sections(docstring)
+    summary = ' '.join(line.strip() for line in re.split(r'\n\s*\n', text)[0].splitlines() if line.strip())
+    sections = {}
+    for section in parsed:
+        sections.setdefault(section['name'], []).extend(section['lines'])
+    return summary, sections
+
+
+def documented_params(lines: list) -> set:
+    """
+    Returns the names documented in an Args section (the least indented entries, so the
+    continuation lines of a description are not mistaken for parameters).
+    """
+    entries = [line for line in lines if line.strip()]
+    if not entries:
+        return set()
+    indent = min(len(line) - len(line.lstrip()) for line in entries)
+    names = set()
+    for line in entries:
+        match = DOCUMENTED_PARAM.match(line)
+        if match and len(line) - len(line.lstrip()) == indent:
+            names.add(match.group(1))
+    return names
+
+
+def parameters(node) -> list:
+    """
+    Returns the names of the parameters of a function (without self/cls).
+    """
+    args = node.args
+    names = [arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs]
+    names += [arg.arg for arg in (args.vararg, args.kwarg) if arg is not None]
+    if names and names[0] in ('self', 'cls'):
+        names = names[1:]
+    return names
+
+
+def documented_parameters(node) -> list:
+    """
+    Returns the parameters which the docstring of a class/function should document: those of the
+    function, for a class those of its __init__ (if __init__ has no docstring of its own). None for
+    a class without such an __init__ (there is no signature to check its Args against).
+    """
+    function = node
+    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        function = next((child for child in node.body if isinstance(child, ast.FunctionDef)
+                         and child.name == '__init__' and not ast.get_docstring(child)), None)
+    return parameters(function) if function is not None else None
+
+
+def own_nodes(node):
+    """
+    Yields the nodes of the body of a function, but not those of nested classes/functions/lambdas.
+    """
+    stack = list(node.body)
+    while stack:
+        child = stack.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        yield child
+        stack.extend(ast.iter_child_nodes(child))
+
+
+def score_docstring(node) -> float:
+    """
+    Scores the existing docstring of a class/function without a model: a summary, enough words,
+    all parameters documented in Args (and no parameters which do not exist), a Returns/Yields
+    section if a value is returned/yielded and a Raises section if exceptions are raised. The
+    parameters of a class are those of its __init__ (if __init__ has no docstring of its own).
+
+    Args:
+        node (ast.ClassDef | ast.FunctionDef): The class/function.
+
+    Returns:
+        float: The score between 0 (no docstring) and 1 (complete).
+    """
+    docstring = ast.get_docstring(node)
+    if not docstring or not docstring.strip():
+        return 0.0
+    summary, sections = parse_docstring(docstring)
+    checks = [(1, min(1.0, len(summary.split()) / MIN_SUMMARY_WORDS)), #(weight, score)
+              (1, min(1.0, len(docstring.split()) / MIN_WORDS))]
+
+    params = documented_parameters(node)
+    if params:
+        documented = documented_params(sections.get('Args', []))
+        checks.append((2, len(documented & set(params)) / len(documented | set(params))))
+
+    if isinstance(node, ast.FunctionDef):
+        body = list(own_nodes(node))
+        returns = any(isinstance(child, ast.Return) and child.value is not None
+                      and not (isinstance(child.value, ast.Constant) and child.value.value is None) for child in body)
+        yields = any(isinstance(child, (ast.Yield, ast.YieldFrom)) for child in body)
+        raises = any(isinstance(child, ast.Raise) and child.exc is not None for child in body)
+        if returns or yields:
+            described = ('Returns' in sections or 'Yields' in sections
+                         or summary.lower().startswith(('return', 'yield'))) #e.g. "Returns the name of ..."
+            checks.append((1, float(described)))
+        if raises:
+            checks.append((0.5, float('Raises' in sections)))
+
+    return round(sum(weight * score for weight, score in checks) / sum(weight for weight, _ in checks), 2)
+
+
+def well_documented(source, threshold: float = QUALITY_THRESHOLD) -> set:
+    """
+    Returns the classes/functions of a file whose docstrings are good enough to be kept as they
+    are (see `score_docstring`). They are neither sent to the model nor compared.
+
+    Args:
+        source (ParsedSource): The parsed code of the file.
+        threshold (float, optional): The minimal score. Defaults to QUALITY_THRESHOLD.
+
+    Returns:
+        set: The qualified names of the well documented classes/functions.
+    """
+    if threshold is None:
+        return set()
+    return {qualname for qualname, node in source.definitions.items() if score_docstring(node) >= threshold}
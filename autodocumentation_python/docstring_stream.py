@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import re
+import ast
+import httpx
+from autodocumentation_python.gptapi import gptapi_stream
+
+BLOCK_START = re.compile(r'^(def |async def |class |@)') #top level lines which can start a new class/function
+MARKER = re.compile(r'^(start|end|```\w*|\'\'\'python)\s*$') #lines around the answer (see the commands)
+RESTARTS = 2 #requests sent again if the connection breaks while the answer is streamed
+
+
+class BlockParser:
+    """
+    Splits a streamed answer (docstrings or code) into its top level blocks while it arrives. A block
+    is complete as soon as the next top level class/function starts and everything before is valid
+    python, so it can be inserted while the rest of the answer is still generated. The lines
+    "start"/"end" and markdown code fences are dropped.
+    """
+    def __init__(self):
+        self.rest = '' #incomplete last line
+        self.lines = [] #lines of the current block
+
+    def feed(self, text: str) -> list:
+        """
+        Adds the next part of the answer.
+
+        Returns:
+            list: The blocks (str) which are complete now.
+        """
+        lines = (self.rest + text).split('\n')
+        self.rest = lines.pop()
+        blocks = []
+        for line in lines:
+            if MARKER.match(line):
+                continue
+            if BLOCK_START.match(line) and self.pending():
+                blocks.append(self.pop())
+            self.lines.append(line + '\n')
+        return blocks
+
+    def close(self) -> list:
+        """
+        Ends the answer.
+
+        Returns:
+            list: The last block (if any, even if it is not valid python).
+        """
+        if self.rest and not MARKER.match(self.rest):
+            self.lines.append(self.rest + '\n')
+        self.rest = ''
+        block = ''.join(self.lines)
+        self.lines = []
+        return [block] if block.strip() else []
+
+    def pending(self) -> bool:
+        """
+        Returns True if the lines read so far form a complete block (not empty and valid python;
+        e.g. a decorator is only complete together with its function).
+        """
+        block = ''.join(self.lines)
+        if not block.strip():
+            return False
+        try:
+            ast.parse(block)
+        except SyntaxError:
+            return False
+        return True
+
+    def pop(self) -> str:
+        block = ''.join(self.lines)
+        self.lines = []
+        return block
+
+
+def gptapi_blocks(code: str, command: str, Model: str, on_block, additional_info: str = None,
+                  temperature: float = 0.2) -> str:
+    """
+    Sends a request like `gptapi`, but streams the answer and passes every complete top level block
+    to `on_block` as soon as it has arrived (see `BlockParser`).
+
+    Args:
+        code (str): The code sent to the model.
+        command (str): The command of the request.
+        Model (str): The GPT model.
+        on_block (callable): Called with every block (str) of the answer.
+        additional_info (str, optional): Additional information about the repository. Defaults to None.
+        temperature (float, optional): The sampling temperature. Defaults to 0.2.
+
+    Returns:
+        str: The complete answer.
+
+    Note:
+        Failed requests are retried by the client until the answer starts. If the connection breaks
+        while the answer is streamed, the request is sent again (at most RESTARTS times) and the
+        blocks of the new answer replace the ones already passed to `on_block`.
+    """
+    for restart in range(RESTARTS + 1):
+        parser = BlockParser()
+        answer = []
+        try:
+            for text in gptapi_stream(code, command, Model=Model, additional_info=additional_info, temperature=temperature):
+                answer.append(text)
+                for block in parser.feed(text):
+                    on_block(block)
+        except httpx.TransportError as err:
+            if not answer or restart == RESTARTS:
+                raise
+            print(f'    The answer was interrupted ({type(err).__name__}), the request is sent again ...')
+            continue
+        for block in parser.close():
+            on_block(block)
+        return ''.join(answer)
+
+
+def replay_blocks(answer: str, on_block) -> None:
+    """
+    Passes the blocks of a complete answer (e.g. replayed from the journal of a run) to `on_block`
+    like `gptapi_blocks` does.
+    """
+    parser = BlockParser()
+    for block in parser.feed(answer) + parser.close():
+        on_block(block)
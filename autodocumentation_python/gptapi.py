@@ -5,7 +5,7 @@
 # Max-Planck-Institute of biological Intelligence, Munich, Germany
 # Authors: Karl Heggenberger, Joergen Kornfeld
 
-import openai
+from autodocumentation_python.llm_client import get_client
 
 
 def gptapi(code: str, command: str, Model: str, additional_info: str = None, 
@@ -31,6 +31,40 @@ def gptapi(code: str, command: str, Model: str, additional_info: str = None,
         command provided.
     """
 
+    messages = gptapi_messages(code, command, additional_info)
+    answer = get_client().chat(Model, messages, temperature=temperature)
+
+    return answer
+
+
+async def agptapi(code: str, command: str, Model: str, additional_info: str = None,
+                  temperature: float = 0.2) -> str:
+    """
+    Asyncio version of `gptapi` (same arguments and return value). Several calls can be awaited
+    concurrently, e.g. with `asyncio.gather`.
+    """
+    messages = gptapi_messages(code, command, additional_info)
+    return await get_client().achat(Model, messages, temperature=temperature)
+
+
+def gptapi_stream(code: str, command: str, Model: str, additional_info: str = None,
+                  temperature: float = 0.2):
+    """
+    Streaming version of `gptapi` (same arguments): yields the answer piece by piece while it is
+    generated.
+    """
+    messages = gptapi_messages(code, command, additional_info)
+    yield from get_client().stream(Model, messages, temperature=temperature)
+
+
+def gptapi_messages(code: str, command: str, additional_info: str = None) -> list:
+    """
+    Builds the messages sent by `gptapi`: a system message, the command, the additional info
+    (if provided) and the code to be edited.
+
+    Returns:
+        list: The messages of the request.
+    """
     messages = [
         {"role": "system", "content": "We aim to edit the docstrings of a repository."},
         {"role": "user", "content": command},
@@ -41,14 +75,7 @@ def gptapi(code: str, command: str, Model: str, additional_info: str = None,
         full_additional_info = f"additional_info: \n {additional_info} \nend of additional_info"
         messages.insert(2, {"role": "user", "content": full_additional_info})
 
-    response = openai.ChatCompletion.create(
-        model=Model,
-        messages=messages,
-        temperature=temperature,
-    )
-    answer = response['choices'][0]['message']['content']
-
-    return answer
+    return messages
 
 
 def gpt_compare(command: str, Model: str,temperature: float = 0.2):
@@ -58,11 +85,36 @@ def gpt_compare(command: str, Model: str,temperature: float = 0.2):
         {"role": "user", "content": command},
     ]
 
-    response = openai.ChatCompletion.create(
-        model=Model,
-        messages=messages,
-        temperature=temperature,
-    )
-    answer = response['choices'][0]['message']['content']
+    answer = get_client().chat(Model, messages, temperature=temperature)
 
     return answer
+
+
+def gpt_chat(messages: list, Model: str, temperature: float = 0.2) -> str:
+    """
+    Sends arbitrary messages to the shared client (used e.g. by `summarize_repo`).
+
+    Args:
+        messages (list): The messages ({"role": ..., "content": ...}) of the request.
+        Model (str): The GPT model.
+        temperature (float, optional): The sampling temperature. Defaults to 0.2.
+
+    Returns:
+        str: The content of the answer.
+    """
+    return get_client().chat(Model, messages, temperature=temperature)
+
+
+async def agpt_chat(messages: list, Model: str, temperature: float = 0.2) -> str:
+    """
+    Asyncio version of `gpt_chat`.
+    """
+    return await get_client().achat(Model, messages, temperature=temperature)
+
+
+def run_async(coroutine):
+    """
+    Runs a coroutine which uses the asyncio calls (e.g. `agpt_chat`) in a new event loop and closes
+    its connections afterwards (see `LLMClient.run`).
+    """
+    return get_client().run(coroutine)
@@ -8,10 +8,17 @@
 import re
 import os
 import ast
-import astunparse
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from autodocumentation_python.gptapi import gpt_compare
 from autodocumentation_python.check_config import check_config
+from autodocumentation_python.response_cache import write_file_atomic
+from autodocumentation_python.summarize_file import definitions
+from autodocumentation_python.parsed_source import ParsedSource
+from autodocumentation_python.docstring_merge import merge_docstrings
+from autodocumentation_python.docstring_quality import documented_parameters
+from autodocumentation_python.run_metrics import stage
+from autodocumentation_python.parallel import in_output_group
 
 def shift_docstring(docstring, indent):
     """
@@ -52,74 +59,6 @@ def remove_start_end_lines(docstrings: str):
 
     return cleaned_code
 
-#next 3 definitions are used to find the parent nodes of a node in the ast
-class ParentAssigner(ast.NodeVisitor):
-    def visit(self, node):
-        for child in ast.iter_child_nodes(node):
-            child.parent = node
-            self.visit(child)
-
-def assign_parent_to_nodes(tree):
-    """
-    Assigns parent nodes to each node in an AST.
-    
-    Args:
-        tree (ast.AST): The AST to which parent nodes are to be assigned.
-    """
-    # Create an instance of the ParentAssigner and visit the tree
-    parent_assigner = ParentAssigner()
-    parent_assigner.visit(tree)
-
-
-def find_parent_nodes(node, tree):
-    """
-    Finds the parent nodes of a given node in an AST.
-    
-    Args:
-        node (ast.AST): The node whose parent nodes are to be found.
-        tree (ast.AST): The AST in which the node exists.
-    
-    Returns:
-        list: A list of parent nodes of the given node.
-    """
-    #assign_parent_to_nodes(tree) #must be called before this function is called
-    parents = []
-
-    while isinstance(node, ast.Module) is False:
-        node = node.parent
-        if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
-            parents.insert(0,node.name)
-
-    return parents
-
-
-def get_name_args(node):
-    """
-    Gets the name and arguments of a class or function definition node.
-    
-    Args:
-        node (ast.AST): The class or function definition node.
-    
-    Returns:
-        tuple: A tuple containing the name and arguments of the node.
-    """
-    if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
-        name = node.name
-        if isinstance(node, ast.FunctionDef):
-            args = f"{astunparse.unparse(node.args).strip()}"
-        if isinstance(node, ast.ClassDef):
-            bases = [base for base in node.bases]
-            #args = f"{', '.join([base.id for base in bases])}" if bases else ''
-            
-            try:
-                args = f"{', '.join([base.id for base in bases])}" if bases else ''
-            except AttributeError:
-                try:
-                    args = f"{', '.join([base.value.id for base in bases])}" if bases else ''
-                except AttributeError:
-                    args = ''
-    return name, args
-
 def find_end_of_definition(code_lines, node):
     """
     Finds the end line of a class or function definition in a code file.
@@ -146,13 +85,21 @@ def find_end_of_definition(code_lines, node):
 
 
 
-def insert_docstrings(file_path, docstrings, Model):
+def insert_docstrings(file_path, docstrings, Model, compare=True, source=None):
     """
     Inserts docstrings into a Python file at the appropriate locations.
     
     Args:
         file_path (str): The path to the Python file where docstrings are to be inserted.
         docstrings (str): The string of docstrings to be inserted.
+        Model (str): The GPT model used to compare new docstrings to already existing ones.
+        compare (bool, optional): If False, existing docstrings are replaced without comparing them
+            to the new ones (e.g. for docstrings reused from the last run). Defaults to True.
+        source (ParsedSource, optional): The parsed current code of the file. Defaults to None (the
+            file is read and parsed).
+    
+    Returns:
+        ParsedSource: The parsed code of the file after the insertion.
     
     Note:
         The docstrings are first cleaned by removing the start and end lines. The function then parses 
@@ -200,117 +147,364 @@ def insert_docstrings(file_path, docstrings, Model):
 
 
 #This is attempt in progress to introduce parents to the output of not inserted/generated docstrings 
-    docstrings = remove_start_end_lines(docstrings) #remove "start" and "end"- lines generated by gpt
+    inserter = DocstringInserter(file_path, Model, compare=compare, source=source)
+    inserter.add(docstrings)
+    return inserter.finish()
 
-    dict_nodes_doc = []
-    dict_inserted_nodes = []
-    #get amout of new classes and functions in original file:
-    tree_doc = ast.parse(docstrings)
-    assign_parent_to_nodes(tree_doc) #make .parent attribute for nodes in docstring ast
 
+class DocstringInserter:
+    """
+    Inserts docstrings into a Python file part by part, e.g. every class/function of an answer which
+    is still streamed (see `docstring_stream`). Each added part is matched to the code at once. An
+    existing and a new docstring are merged locally if possible (see `docstring_merge`); the other
+    pairs are collected and compared COMPARE_BATCH_SIZE pairs per
+    request (see `compare_docstrings_batch`), at most COMPARE_WORKERS requests at the same time; a
+    full batch is sent in the background at once, so it overlaps with the generation of the rest of
+    the answer, the remaining pairs are sent by `finish`. The code is parsed only once, all
+    insertions are computed for the original line numbers and the file is written once by `finish`
+    after all comparisons are done.
 
-    for node_doc in ast.walk(tree_doc):         #iterate over all nodes in the docstring ast
-        if isinstance(node_doc, (ast.ClassDef, ast.FunctionDef)):
-            if not ast.get_docstring(node_doc):
-                continue
-            dict_nodes_doc.append({"name": node_doc.name, "parents": find_parent_nodes(node_doc, tree_doc)})
+    Args:
+        file_path (str): The path to the Python file where docstrings are to be inserted.
+        Model (str): The GPT model used to compare new docstrings to already existing ones.
+        compare (bool, optional): If False, existing docstrings are replaced without comparing them
+            to the new ones. Defaults to True.
+        source (ParsedSource, optional): The parsed current code of the file. Defaults to None (the
+            file is read and parsed).
+        journal (FileJournal, optional): If given, the results of the comparisons are recorded in the
+            journal of the run (and replayed from it if the run is resumed). Defaults to None.
+        keep (set, optional): Qualified names of classes/functions whose docstrings are kept as they
+            are (e.g. well documented ones, see `docstring_quality`); generated docstrings for them are
+            ignored and not compared. Defaults to None.
+    """
+    def __init__(self, file_path, Model, compare=True, source=None, journal=None, keep=None):
+        self.file_path = file_path
+        self.Model = Model
+        self.compare = compare
+        self.source = source if source is not None else ParsedSource.from_file(file_path)
+        self.lines_code = list(self.source.lines)
+        self.keep = set(keep or ())
+        self.index_code = {qualname: node for qualname, node in self.source.definitions.items()
+                           if qualname not in self.keep} #qualified name (e.g. 'Class.method') -> node
+        self.index_doc = {} #qualified name in the docstrings -> node with docstring
+        self.matches = {} #qualified name in the docstrings -> qualified name in the code
+        self.edits = {} #qualified name in the code -> qualified name in the docstrings
+        self.pending = {} #(old docstring, new docstring) -> qualified name in the code, waiting for the next compare request
+        self.comparisons = {} #(old docstring, new docstring) -> (future of the compare request, index of the pair)
+        self.merged = {} #(old docstring, new docstring) -> docstring merged without a request
+        self.executor = ThreadPoolExecutor(max_workers=COMPARE_WORKERS)
+        self.error = None #first part which could not be parsed
+        self.journal = journal
+
+    @stage('insert')
+    def add(self, docstrings):
+        """
+        Adds a part of the gpt output (complete classes/functions with docstrings). Nodes which
+        can be matched to the code by their qualified name are inserted at once, the others are
+        matched by `finish`. A later docstring for the same node replaces an earlier one.
+        """
+        if self.error is not None:
+            return
+        try:
+            docstrings = remove_start_end_lines(docstrings) #remove "start" and "end"- lines generated by gpt
+            index = {qualname: node for qualname, node in definitions(ast.parse(docstrings)).items()
+                     if ast.get_docstring(node) and qualname not in self.keep}
+        except SyntaxError as err:
+            self.error = err #raised by finish, like a gpt output which is not valid python as a whole
+            return
+        self.index_doc.update(index)
+        for qualname in index:
+            if qualname in self.index_code:
+                self.submit(qualname, qualname)
+
+    def submit(self, qualname_doc, qualname_code):
+        for other_doc, other_code in list(self.matches.items()):
+            if other_code == qualname_code and other_doc != qualname_doc:
+                del self.matches[other_doc]
+        self.matches[qualname_doc] = qualname_code
+        self.edits[qualname_code] = qualname_doc
+        pair = (ast.get_docstring(self.index_code[qualname_code]), ast.get_docstring(self.index_doc[qualname_doc]))
+        if self.compare and pair[0] is not None and pair[0].strip() != pair[1].strip() and pair not in self.comparisons:
+            merged = merge_docstrings(*pair, params=documented_parameters(self.index_code[qualname_code]))
+            if merged is not None:
+                self.merged[pair] = merged
+                return
+            self.pending[pair] = qualname_code
+            if len(self.pending) >= COMPARE_BATCH_SIZE:
+                self.flush()
+
+    def flush(self):
+        """
+        Sends the collected pairs of docstrings to be compared (in the background).
+        """
+        if not self.pending:
+            return
+        pairs = list(self.pending.items())
+        self.pending = {}
+        future = self.executor.submit(in_output_group(self.compare_pairs), pairs) #printed with the output of the file
+        for index, (pair, _) in enumerate(pairs):
+            self.comparisons[pair] = (future, index)
+
+    @stage('compare') #runs in a thread of the executor
+    def compare_pairs(self, pairs):
+        """
+        Compares pairs of docstrings ([((old docstring, new docstring), qualified name)]) with one
+        request. Results recorded in the journal are replayed, pairs missing in the answer are
+        compared one by one.
+
+        Returns:
+            list: The compared docstrings (or the error of a pair which could not be compared).
+        """
+        model = compare_model(self.Model)
+        keys = [self.journal.key(model, old, new) if self.journal is not None else None for (old, new), _ in pairs]
+        results = [self.journal.comparison(key) if self.journal is not None else None for key in keys]
+        todo = [i for i, result in enumerate(results) if result is None]
+        if len(todo) > 1:
             try:
-                insertion_successful, node_info = insert_1_docstring(node_doc, tree_doc, file_path, Model) #insert docstring one by one into the code
-                if insertion_successful:
-                    dict_inserted_nodes.append({"name": node_info[0].name, "parents": node_info[1]})
-                elif not insertion_successful:
-                    continue
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                traceback.print_exc()
-                print(f'insertion did not work for node: {node_doc.name}, (parents: {find_parent_nodes(node_doc, tree_doc)}, node: {node_doc}')
-
-    with open(file_path, "r") as file:
-        code = file.read()
-    tree_code = ast.parse(code)
-    assign_parent_to_nodes(tree_code)
-    dict_nodes_code = [{"name": node.name, "parents": find_parent_nodes(node, tree_code)} for node in ast.walk(tree_code) if isinstance(node, (ast.ClassDef, ast.FunctionDef))]
-
-    not_inserted = [dict_node for dict_node in dict_nodes_doc if dict_node not in dict_inserted_nodes]
-    not_generated = [dict_node for dict_node in dict_nodes_code if dict_node not in [dict_doc for dict_doc in dict_nodes_doc]]  #the nodes are from different trees -> not comparable/identical
-
-    if len(dict_inserted_nodes) != len(dict_nodes_code):
-        print(f'    {len(dict_nodes_code)} new classes/functions in original file')
-        print(f'    {len(dict_nodes_doc)} docstrings generated (can be found in gpt_output)')
-        print(f'    {len(not_generated)} docstrings not generated:')
-        for dict in not_generated:
-            name = dict["name"]
-            parents = ", ".join(dict["parents"]) if dict["parents"] else " --- "
-            print("    "*2,f"{name} (Parents: {parents}); ")
-        print(f'    {len(not_inserted)} of {len(dict_nodes_doc)} generated docstrings not inserted:')
-        for dict in not_inserted:
-            name = dict["name"]
-            parents = ", ".join(dict["parents"]) if dict["parents"] else " --- "
-            print("    "*2,f"{name} (Parents: {parents}); ")
-    print(f' -> {len(dict_inserted_nodes)}/{len(dict_nodes_code)} docstrings generated and inserted')
-
-
-def insert_1_docstring(node_doc, tree_doc, file_path, Model):
+                for i, result in zip(todo, compare_docstrings_batch([pairs[i][0] for i in todo], self.Model)):
+                    results[i] = result
+            except Exception as err:
+                print(f'    The docstrings could not be compared in one request ({err}), they are compared one by one.')
+        for i in todo:
+            (old, new), qualname = pairs[i]
+            try:
+                if results[i] is None:
+                    results[i] = remove_start_end_lines(compare_docstrings(old, new, self.Model)).strip()
+                if self.journal is not None:
+                    self.journal.compared(keys[i], results[i], node=qualname)
+            except Exception as err:
+                results[i] = err
+        return results
+
+    def comparison(self, qualname_doc, qualname_code):
+        """
+        Waits for the comparison of the docstrings of two matched nodes.
+
+        Returns:
+            str: The compared docstring or None, if the docstrings were not compared.
+        """
+        pair = (ast.get_docstring(self.index_code[qualname_code]), ast.get_docstring(self.index_doc[qualname_doc]))
+        if pair in self.merged:
+            return self.merged[pair]
+        if pair not in self.comparisons:
+            return None
+        future, index = self.comparisons[pair]
+        result = future.result()[index]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """
+        Stops the comparisons without inserting anything (e.g. if the request failed).
+        """
+        self.executor.shutdown(cancel_futures=True)
+
+    @stage('insert')
+    def finish(self):
+        """
+        Matches the remaining nodes (see `match_nodes`), waits for the comparisons, applies all
+        insertions and writes the file.
+
+        Returns:
+            ParsedSource: The parsed code of the file after the insertion.
+
+        Raises:
+            SyntaxError: If a part of the gpt output is not valid python.
+        """
+        try:
+            if self.error is not None:
+                raise self.error
+            unmatched_doc = {qualname: node for qualname, node in self.index_doc.items() if qualname not in self.matches}
+            unmatched_code = {qualname: node for qualname, node in self.index_code.items() if qualname not in self.edits}
+            for qualname_doc, qualname_code in match_nodes(unmatched_doc, unmatched_code).items():
+                self.submit(qualname_doc, qualname_code)
+            self.flush()
+
+            edits = [] #(start, end, text): lines_code[start:end] is replaced by text
+            inserted = []
+            for qualname_code, qualname_doc in self.edits.items():
+                try:
+                    compared = self.comparison(qualname_doc, qualname_code)
+                    edits.append(insert_1_docstring(self.index_doc[qualname_doc], self.index_code[qualname_code], self.lines_code,
+                                                    self.Model, self.compare, self.journal, qualname_code, compared=compared))
+                    inserted.append(qualname_doc)
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    traceback.print_exc()
+                    print(f'insertion did not work for node: {qualname_doc} (matched to {qualname_code})')
+        finally:
+            self.executor.shutdown()
+
+        #apply all insertions bottom-up (so the line numbers of the remaining ones stay valid) and write the file once
+        lines_code = list(self.lines_code)
+        for start, end, text in sorted(edits, key=lambda edit: (edit[0], edit[1]), reverse=True):
+            lines_code[start:end] = [text]
+        if edits:
+            write_file_atomic(self.file_path, ''.join(lines_code))
+            source_after = ParsedSource(''.join(lines_code), self.file_path)
+        else:
+            source_after = self.source
+
+        index_doc, index_code = self.index_doc, self.index_code
+        not_inserted = [qualname for qualname in index_doc if qualname not in inserted]
+        not_generated = [qualname for qualname in index_code if qualname not in self.matches.values()]
+
+        if len(inserted) != len(index_code):
+            print(f'    {len(index_code)} new classes/functions in original file')
+            print(f'    {len(index_doc)} docstrings generated (can be found in gpt_output)')
+            print(f'    {len(not_generated)} docstrings not generated:')
+            for qualname in not_generated:
+                print("    "*2, qualname_info(qualname))
+            print(f'    {len(not_inserted)} of {len(index_doc)} generated docstrings not inserted:')
+            for qualname in not_inserted:
+                print("    "*2, qualname_info(qualname))
+        if self.merged:
+            print(f'    {len(self.merged)} docstrings were merged with the old ones without a request.')
+        print(f' -> {len(inserted)}/{len(index_code)} docstrings generated and inserted')
+        return source_after
+
+
+def qualname_info(qualname):
+    """
+    Formats a qualified name for the console output, e.g. 'method (Parents: Class); '.
+    """
+    *parents, name = qualname.split('.')
+    parents = ", ".join(parents) if parents else " --- "
+    return f"{name} (Parents: {parents}); "
+
+
+def match_nodes(index_doc, index_code):
+    """
+    Matches the nodes of the gpt output to the nodes of the code by their qualified names (see
+    `definitions`). Names are compared directly (O(1) lookup); for the remaining nodes a fuzzy
+    match is tried, since GPT sometimes renames or re-nests a class/function:
+    1. the name of the node is unique among the not yet matched nodes of the code (re-nested),
+    2. one qualified name ends with the other one (enclosing class added or dropped),
+    3. a very similar name with the same nesting depth (e.g. a typo in the name, see `similar_name`).
+    Every node of the code is matched at most once.
+
+    Args:
+        index_doc (dict): Qualified names of the gpt output mapped to their nodes.
+        index_code (dict): Qualified names of the code mapped to their nodes.
+
+    Returns:
+        dict: Qualified names of the gpt output mapped to the qualified names of the code.
+    """
+    matches = {qualname: qualname for qualname in index_doc if qualname in index_code}
+    unmatched_code = [qualname for qualname in index_code if qualname not in matches]
+
+    for qualname_doc in index_doc:
+        if qualname_doc in matches or not unmatched_code:
+            continue
+        name = qualname_doc.split('.')[-1]
+        same_name = [qualname for qualname in unmatched_code if qualname.split('.')[-1] == name]
+        suffix = [qualname for qualname in same_name
+                  if qualname.endswith('.' + qualname_doc) or qualname_doc.endswith('.' + qualname)]
+        depth = qualname_doc.count('.')
+        similar = [qualname for qualname in unmatched_code
+                   if qualname.count('.') == depth and similar_name(name, qualname.split('.')[-1])]
+        if len(same_name) == 1:
+            match = same_name[0]
+        elif len(suffix) == 1:
+            match = suffix[0]
+        elif len(similar) == 1:
+            match = similar[0]
+        else:
+            continue
+        matches[qualname_doc] = match
+        unmatched_code.remove(match)
+    return matches
+
+
+def name_tokens(name):
+    """
+    Splits a name into its lowercase words (snake_case and CamelCase), e.g. 'getValue' -> ['get', 'value'].
     """
-    Inserts a single docstring into a Python file.
+    return [part.lower() for part in re.split(r'_+|(?<=[a-z0-9])(?=[A-Z])', name) if part]
+
+
+def edit_distance(a, b):
+    """
+    Returns the Levenshtein distance of two strings.
+    """
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def similar_name(name_doc, name_code):
+    """
+    Returns True if two names of classes/functions differ only by a typo: the same words, the first
+    one (e.g. the verb: 'set_value' never matches 'get_value') identical, the others with typos of
+    at most MAX_NAME_EDITS edits altogether, and only in words of at least 4 characters (so
+    'get_x' does not match 'get_y').
+    """
+    tokens_doc, tokens_code = name_tokens(name_doc), name_tokens(name_code)
+    if not tokens_doc or len(tokens_doc) != len(tokens_code) or tokens_doc[0] != tokens_code[0]:
+        return False
+    distance = 0
+    for token_doc, token_code in zip(tokens_doc[1:], tokens_code[1:]):
+        if token_doc != token_code:
+            if min(len(token_doc), len(token_code)) < 4:
+                return False
+            distance += edit_distance(token_doc, token_code)
+    return 0 < distance <= MAX_NAME_EDITS
+
+
+def insert_1_docstring(node_doc, node_code, lines_code, Model, compare=True, journal=None, qualname=None, compared=None):
+    """
+    Computes the insertion of a single docstring into the code (without changing the code).
     
     Args:
-        node_doc (ast.AST): A node from the docstring AST.
-        file_path (str): The path to the Python file where the docstring is to be inserted.
+        node_doc (ast.AST): The node of the gpt output containing the new docstring.
+        node_code (ast.AST): The matching node of the original code.
+        lines_code (list): The lines of the original code.
+        Model (str): The GPT model used to compare the new docstring to an existing one.
+        compare (bool, optional): If False, an existing docstring is replaced without comparison. 
+            Defaults to True.
+        journal (FileJournal, optional): Records the result of the comparison (or replays it). Defaults to None.
+        qualname (str, optional): The qualified name of the node (only recorded in the journal). Defaults to None.
+        compared (str, optional): The result of the comparison, if the docstrings were already compared
+            (e.g. in a batch by `DocstringInserter`). Defaults to None.
+    
+    Returns:
+        tuple: The edit (start, end, text): the lines lines_code[start:end] are to be replaced by text.
     
     Note:
-        The function reads the Python file and parses it into an AST. It then iterates over all nodes 
-        in the code AST. For each class or function definition, it checks if the name and parent nodes
-        matches the name of the docstring node. If a match is found, it gets the docstring from the 
-        docstring node and checks if the code node already has a docstring. If it does, the old 
-        docstring is removed and the new one is inserted. If it doesn't, the new docstring is 
-        inserted at the appropriate location. The function then writes the modified code back to 
-        the Python file.
+        If the code node already has a docstring, the old docstring is to be replaced by the new one 
+        (after comparing both). If it doesn't, the new docstring is to be inserted after the 
+        definition line(s). All line numbers refer to the original code, the edits are applied 
+        bottom-up by `insert_docstrings`.
     """
-    with open(file_path, "r") as file:
-        code = file.read()
-        file.seek(0)
-        lines_code = file.readlines()
-    tree_code = ast.parse(code) #need to be updated after each insertion since linelno of nodes change
-
-    assign_parent_to_nodes(tree_code) #make .parent attribute for nodes in code ast
-    parents_doc = find_parent_nodes(node_doc, tree_doc)
-
-    for node_code in ast.walk(tree_code):
-        if isinstance(node_code, (ast.ClassDef, ast.FunctionDef)):
-            name_doc, args_doc = get_name_args(node_doc)
-            name_code, args_code = get_name_args(node_code)
-            parents_code = find_parent_nodes(node_code, tree_code)
-            if name_code == name_doc and parents_doc == parents_code: # and args_code == args_doc    #sometimes additional info in agrs (e.g. type) is added by gpt -> not comparable
-                docstring = ast.get_docstring(node_doc)
-                if ast.get_docstring(node_code) is not None:
-                    docstring = remove_start_end_lines(compare_docstrings(ast.get_docstring(node_code), docstring, Model)).strip()
-                    #docstring = remove_start_end_lines(ast.get_docstring(node_code)).strip() #comment out above and enable this line to prevent comparison of old docstrings
-                    start = node_code.body[0].__dict__['lineno'] #start line of old docstring
-                    end = node_code.body[0].__dict__['end_lineno'] #end line of old docstring
-                    for i in range(end-start+1):
-                        del lines_code[start-1] #delete old docstring
-                    indent = node_code.body[0].col_offset
-                    shifted_docstring = shift_docstring(docstring, indent)
-                    lines_code.insert(start-1, shifted_docstring)
-                elif ast.get_docstring(node_code) is None:
-                    start = find_end_of_definition(lines_code, node_code) - 1
-                    indent = node_code.body[0].col_offset
-                    shifted_docstring = shift_docstring(docstring, indent)
-                    lines_code.insert(start, shifted_docstring)
-                with open(file_path, "w") as file:
-                    file.truncate()
-                    file.write(''.join(lines_code))
-                return True, (node_doc, parents_doc)
-    return False, None
+    docstring = ast.get_docstring(node_doc)
+    indent = node_code.body[0].col_offset
+    if ast.get_docstring(node_code) is not None:
+        if compare and compared is not None:
+            docstring = compared
+        elif compare:
+            old_docstring = ast.get_docstring(node_code)
+            key = journal.key(compare_model(Model), old_docstring, docstring) if journal is not None else None
+            compared = journal.comparison(key) if journal is not None else None
+            if compared is None:
+                compared = remove_start_end_lines(compare_docstrings(old_docstring, docstring, Model,
+                                                                     params=documented_parameters(node_code))).strip()
+                if journal is not None:
+                    journal.compared(key, compared, node=qualname)
+            docstring = compared
+        #docstring = remove_start_end_lines(ast.get_docstring(node_code)).strip() #comment out above and enable this line to prevent comparison of old docstrings
+        start = node_code.body[0].__dict__['lineno'] - 1 #start line of old docstring
+        end = node_code.body[0].__dict__['end_lineno'] #end line of old docstring
+    elif ast.get_docstring(node_code) is None:
+        start = find_end_of_definition(lines_code, node_code) - 1
+        end = start
+    return start, end, shift_docstring(docstring, indent)
    
-def compare_docstrings(old_docstring, new_docstring, Model):
-    if old_docstring.strip() == new_docstring.strip():
-        return new_docstring
-    else:
-        if Model != 'gpt-4-1106-preview':
-            Model = 'gpt-4' 
-        command = f'''
+COMMAND_COMPARE = '''
 I want to replace the old docstring with a new one generated by GPT. 
 However, it may be that the generated one does not contain all the 
 information of the old docstring. Therefore, compare both versions 
@@ -330,10 +524,101 @@ old docstring:
 generated docstring:
 {new_docstring}
 '''
-        edited_docstring = gpt_compare(command, Model=Model, temperature=0.8)
+
+
+MAX_NAME_EDITS = 2 #max. edit distance of names matched as typos (see `similar_name`)
+COMPARE_BATCH_SIZE = 8 #max. number of pairs of docstrings compared in one request
+COMPARE_WORKERS = 4 #compare requests of a file sent at the same time
+DOCSTRING_START = '#### start of docstring'
+DOCSTRING_END = '#### end of docstring'
+
+#used to compare several pairs of docstrings in one request
+COMMAND_COMPARE_BATCH = '''
+I want to replace old docstrings with new ones generated by GPT. 
+However, it may be that a generated one does not contain all the 
+information of the old docstring. Therefore, compare both versions of 
+every numbered pair below and update the new docstring. If the information 
+is conflicting, use the information from the old docstring. If there is no 
+difference, simply return the new docstring - without further notification. 
+The output docstrings should have a maximum of 90 characters per line.
+
+Output the updated docstrings of all pairs in the same order. Every docstring starts with a line
+"{start} <number of the pair>" and ends with a line "{end} <number of the pair>"
+(dont indent your output because of this and no """):
+{start} 1
+updated generated docstring...
+{end} 1
+
+
+{pairs}
+'''
+
+
+def compare_model(Model):
+    """
+    Returns the model used to compare docstrings (gpt-4, or gpt-4-1106-preview if that is the main model).
+    """
+    return Model if Model == 'gpt-4-1106-preview' else 'gpt-4'
+
+
+@stage('compare')
+def compare_docstrings(old_docstring, new_docstring, Model, params=None):
+    """
+    Compares an existing and a generated docstring. They are merged locally (see `merge_docstrings`)
+    unless their free texts conflict; only then the model is asked.
+    """
+    if old_docstring.strip() == new_docstring.strip():
+        return new_docstring
+    merged = merge_docstrings(old_docstring, new_docstring, params=params)
+    if merged is not None:
+        return merged
+    else:
+        command = COMMAND_COMPARE.format(old_docstring=old_docstring, new_docstring=new_docstring)
+        edited_docstring = gpt_compare(command, Model=compare_model(Model), temperature=0.8)
         return edited_docstring
 
 
+@stage('compare')
+def compare_docstrings_batch(pairs, Model):
+    """
+    Compares several pairs of docstrings with one request (see `compare_docstrings`).
+
+    Args:
+        pairs (list): The pairs (old docstring, new docstring).
+        Model (str): The GPT model used for docstring generation (see `compare_model`).
+
+    Returns:
+        list: The compared docstrings in the order of the pairs (None for pairs missing in the answer).
+    """
+    text = '\n'.join(f'pair {i}:\nold docstring:\n{old}\ngenerated docstring:\n{new}\n'
+                     for i, (old, new) in enumerate(pairs, start=1))
+    command = COMMAND_COMPARE_BATCH.format(start=DOCSTRING_START, end=DOCSTRING_END, pairs=text)
+    answer = gpt_compare(command, Model=compare_model(Model), temperature=0.8)
+    return split_compare_answer(answer, len(pairs))
+
+
+def split_compare_answer(answer, number):
+    """
+    Splits the answer to a batched comparison into the docstrings of the pairs (see
+    `compare_docstrings_batch`); docstrings which are missing or not closed by their end line are None.
+    """
+    results = [None] * number
+    current = None #index of the pair which is read at the moment
+    lines = []
+    for line in answer.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith(DOCSTRING_START):
+            number_pair = stripped[len(DOCSTRING_START):].strip()
+            current = int(number_pair) - 1 if number_pair.isdigit() and 0 < int(number_pair) <= number else None
+            lines = []
+        elif current is not None and stripped == f'{DOCSTRING_END} {current+1}':
+            results[current] = remove_start_end_lines('\n'.join(lines)).strip() or None
+            current = None
+        elif current is not None:
+            lines.append(line)
+    return results
+
+
 
 
 # #MANUALLY INSERT DOCSTRINGS INTO CODE:
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import json
+import time
+import asyncio
+import threading
+import httpx
+from autodocumentation_python.resilience import RetryPolicy, CircuitBreaker, parse_retry_after, can_fall_back, describe
+from autodocumentation_python.tokens import count_tokens, count_message_tokens
+from autodocumentation_python.run_metrics import get_metrics, record_request
+
+DEFAULT_BASE_URL = 'https://api.openai.com/v1'
+
+
+class LLMError(Exception):
+    """
+    Raised if the chat completions endpoint answers with an error.
+
+    Args:
+        message (str): Description of the error (including the body of the response).
+        status_code (int, optional): The HTTP status code of the response. Defaults to None.
+        retry_after (float, optional): Waiting time [s] requested by the server. Defaults to None.
+    """
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class LLMClient:
+    """
+    Client for OpenAI compatible chat completions endpoints. All calls share one connection pool
+    (HTTP keep-alive), so the workers reuse warm connections instead of opening a new one per
+    request. The client is thread safe; `create`/`chat` block, `acreate`/`achat` are the asyncio
+    versions of the same calls and `stream` yields the answer while it is generated.
+
+    Every request is retried on rate limits, server errors and timeouts (see `RetryPolicy`), and all
+    requests share one `CircuitBreaker`, which pauses them while the endpoint is failing. If a model
+    still fails, the request is sent to its fallback models (in the given order). Every attempt and
+    every cache hit is recorded in the metrics of the run, if any (see `run_metrics`).
+
+    Args:
+        api_key (str): The API key sent as bearer token.
+        base_url (str, optional): Base URL of the API (e.g. of a proxy or a local server).
+            Defaults to the OpenAI API.
+        max_connections (int, optional): Maximum number of open connections. Defaults to 20.
+        timeout (float, optional): Timeout [s] for reading a response (per request, for a streamed
+            response per part). Defaults to 600.
+        cache (ResponseCache, optional): If given, responses are looked up in/stored to this cache.
+            Defaults to None.
+        retry (RetryPolicy, optional): Retries of failed requests. Defaults to RetryPolicy().
+        breaker (CircuitBreaker, optional): Defaults to CircuitBreaker().
+        fallback_models (dict, optional): Models mapped to the list of models used if they fail, e.g.
+            {'gpt-4-1106-preview': ['gpt-4']}. Defaults to None.
+        limiter (RateLimiter, optional): If given, every request (and every retry) waits for the rate
+            limiter, which may be shared with other processes. Defaults to None.
+    """
+    def __init__(self, api_key: str, base_url: str = None, max_connections: int = 20, timeout: float = 600,
+                 cache=None, retry: RetryPolicy = None, breaker: CircuitBreaker = None, fallback_models: dict = None,
+                 limiter=None):
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip('/')
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.timeout = httpx.Timeout(timeout, connect=30)
+        self.http = httpx.Client(base_url=self.base_url, headers=self.headers, limits=self.limits, timeout=self.timeout)
+        self.async_clients = {} #event loop -> AsyncClient (an AsyncClient is bound to the loop it is used in)
+        self.lock = threading.Lock()
+        self.cache = cache
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback_models = fallback_models or {}
+        self.limiter = limiter
+
+    def _get_async_http(self):
+        # one AsyncClient per event loop, so threads with their own loops don't replace each other's client
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            for other in [other for other in self.async_clients if other.is_closed()]:
+                del self.async_clients[other] #loop ended without `aclose` (its connections are gone with it)
+            if loop not in self.async_clients:
+                self.async_clients[loop] = httpx.AsyncClient(base_url=self.base_url, headers=self.headers,
+                                                             limits=self.limits, timeout=self.timeout)
+            return self.async_clients[loop]
+
+    async def aclose(self):
+        """
+        Closes the connection pool of the asyncio calls of the running event loop.
+        """
+        with self.lock:
+            http = self.async_clients.pop(asyncio.get_running_loop(), None)
+        if http is not None:
+            await http.aclose()
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine with asyncio calls of the client in a new event loop (like `asyncio.run`) and
+        closes the connection pool of the loop afterwards.
+        """
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await self.aclose()
+        return asyncio.run(main())
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            raise LLMError(f'{response.status_code} error from chat completions endpoint: {response.text}',
+                           status_code=response.status_code, retry_after=parse_retry_after(response.headers))
+        return response.json()
+
+    def models(self, model: str) -> list:
+        """
+        Returns the model followed by its fallback models.
+        """
+        return [model] + [fallback for fallback in self.fallback_models.get(model, []) if fallback != model]
+
+    def _tokens(self, model: str, messages: list) -> int:
+        """
+        Returns the prompt tokens of a request for the rate limiter (only counted if tokens are limited).
+        """
+        if self.limiter is None or not self.limiter.tpm:
+            return 0
+        return count_message_tokens(messages, model)
+
+    @staticmethod
+    def _record(model: str, messages: list, start: float, usage: dict = None, content: str = None, error=None):
+        """
+        Records an attempt of a request in the metrics of the run (the tokens are counted if the
+        response has no usage, e.g. a streamed one).
+        """
+        if get_metrics() is None:
+            return
+        counted = error is None and not usage
+        if counted:
+            usage = {'prompt_tokens': count_message_tokens(messages, model), 'completion_tokens': count_tokens(content or '', model)}
+        status = 'ok' if error is None else str(getattr(error, 'status_code', None) or type(error).__name__)
+        record_request(model, seconds=time.perf_counter() - start, status=status, usage=usage, counted=counted)
+
+    @staticmethod
+    def _content(response: dict) -> str:
+        return ((response.get('choices') or [{}])[0].get('message') or {}).get('content') or ''
+
+    def _resilient(self, model: str, request, tokens: int = 0):
+        """
+        Calls `request(model)` with retries; if the model still fails, the fallback models are tried.
+        Every attempt waits for the rate limiter (if any) first.
+        """
+        def attempt(current):
+            if self.limiter is not None:
+                self.limiter.acquire(tokens)
+            return request(current)
+
+        models = self.models(model)
+        for i, current in enumerate(models):
+            try:
+                return self.retry.call(lambda: attempt(current), self.breaker)
+            except Exception as err:
+                if i == len(models) - 1 or not can_fall_back(err):
+                    raise
+                print(f'    {current} failed ({describe(err)}), the request is sent to {models[i+1]}.')
+
+    async def _aresilient(self, model: str, request, tokens: int = 0):
+        """
+        Asyncio version of `_resilient` (`request(model)` returns an awaitable).
+        """
+        async def attempt(current):
+            if self.limiter is not None:
+                await self.limiter.aacquire(tokens)
+            return await request(current)
+
+        models = self.models(model)
+        for i, current in enumerate(models):
+            try:
+                return await self.retry.acall(lambda: attempt(current), self.breaker)
+            except Exception as err:
+                if i == len(models) - 1 or not can_fall_back(err):
+                    raise
+                print(f'    {current} failed ({describe(err)}), the request is sent to {models[i+1]}.')
+
+    def create(self, model: str, messages: list, temperature: float = 0.2) -> dict:
+        """
+        Sends a chat completions request and returns the decoded response (or the cached response
+        of an identical earlier request). Failed requests are retried and sent to the fallback models.
+
+        Args:
+            model (str): The GPT model.
+            messages (list): The messages ({"role": ..., "content": ...}) of the request.
+            temperature (float, optional): The sampling temperature. Defaults to 0.2.
+
+        Returns:
+            dict: The response of the endpoint.
+
+        Raises:
+            LLMError: If the endpoint answers with an error status code (after all retries and fallbacks).
+            httpx.TransportError: If the endpoint can not be reached (after all retries and fallbacks).
+        """
+        key = self.cache.key(model, messages, temperature) if self.cache else None
+        response = self.cache.get(key) if self.cache else None
+        if response is None:
+            def request(current):
+                payload = {"model": current, "messages": messages, "temperature": temperature}
+                start = time.perf_counter()
+                try:
+                    response = self._check(self.http.post('/chat/completions', json=payload))
+                except Exception as err:
+                    self._record(current, messages, start, error=err)
+                    raise
+                self._record(current, messages, start, usage=response.get('usage'), content=self._content(response))
+                return response
+            response = self._resilient(model, request, self._tokens(model, messages))
+            if self.cache:
+                self.cache.put(key, response)
+        else:
+            record_request(model, cached=True)
+        return response
+
+    async def acreate(self, model: str, messages: list, temperature: float = 0.2) -> dict:
+        """
+        Asyncio version of `create`.
+        """
+        key = self.cache.key(model, messages, temperature) if self.cache else None
+        response = self.cache.get(key) if self.cache else None
+        if response is None:
+            http = self._get_async_http()
+            async def request(current):
+                payload = {"model": current, "messages": messages, "temperature": temperature}
+                start = time.perf_counter()
+                try:
+                    response = self._check(await http.post('/chat/completions', json=payload))
+                except Exception as err:
+                    self._record(current, messages, start, error=err)
+                    raise
+                self._record(current, messages, start, usage=response.get('usage'), content=self._content(response))
+                return response
+            response = await self._aresilient(model, request, self._tokens(model, messages))
+            if self.cache:
+                self.cache.put(key, response)
+        else:
+            record_request(model, cached=True)
+        return response
+
+    def stream(self, model: str, messages: list, temperature: float = 0.2):
+        """
+        Sends a chat completions request with streaming (server-sent events) and yields the content
+        of the answer piece by piece while it is generated. The complete answer is cached like the
+        one of `create` (same key), a cached answer is yielded at once. The request is retried (and
+        sent to the fallback models) until the answer starts; an error while it is streamed is raised.
+
+        Args:
+            model (str): The GPT model.
+            messages (list): The messages ({"role": ..., "content": ...}) of the request.
+            temperature (float, optional): The sampling temperature. Defaults to 0.2.
+
+        Yields:
+            str: The next part of the answer.
+
+        Raises:
+            LLMError: If the endpoint answers with an error status code.
+        """
+        key = self.cache.key(model, messages, temperature) if self.cache else None
+        response = self.cache.get(key) if self.cache else None
+        if response is not None:
+            record_request(model, cached=True)
+            yield response['choices'][0]['message']['content']
+            return
+        attempt = {} #model and start of the last attempt
+        def request(current):
+            payload = {"model": current, "messages": messages, "temperature": temperature, "stream": True}
+            attempt.update(model=current, start=time.perf_counter())
+            try:
+                response = self.http.send(self.http.build_request('POST', '/chat/completions', json=payload), stream=True)
+                if response.status_code >= 400:
+                    try:
+                        response.read()
+                        self._check(response)
+                    finally:
+                        response.close()
+            except Exception as err:
+                self._record(current, messages, attempt['start'], error=err)
+                raise
+            return response
+        response = self._resilient(model, request, self._tokens(model, messages)) #retried until the answer starts
+        parts = []
+        usage = None #sent by some servers in the last chunk
+        done = False
+        try:
+            for line in response.iter_lines(): #read to the end (also after [DONE]), so the connection is returned to the pool
+                if done or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    done = True
+                    continue
+                chunk = json.loads(data)
+                usage = chunk.get('usage') or usage
+                for choice in chunk.get('choices') or []:
+                    content = (choice.get('delta') or {}).get('content')
+                    if content:
+                        parts.append(content)
+                        yield content
+        except BaseException as err: #also if the answer is not read to its end
+            self._record(attempt['model'], messages, attempt['start'], error=err)
+            raise
+        finally:
+            response.close()
+        self._record(attempt['model'], messages, attempt['start'], usage=usage, content=''.join(parts))
+        if self.cache:
+            self.cache.put(key, {"model": model, "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": ''.join(parts)}}]})
+
+    def chat(self, model: str, messages: list, temperature: float = 0.2) -> str:
+        """
+        Same as `create`, but only returns the content of the answer.
+        """
+        return self.create(model, messages, temperature)['choices'][0]['message']['content']
+
+    async def achat(self, model: str, messages: list, temperature: float = 0.2) -> str:
+        """
+        Asyncio version of `chat`.
+        """
+        response = await self.acreate(model, messages, temperature)
+        return response['choices'][0]['message']['content']
+
+    def close(self):
+        self.http.close()
+
+
+_client = None
+
+
+def configure_client(api_key: str, base_url: str = None, **kwargs) -> LLMClient:
+    """
+    Creates the client shared by all modules of autodoc (replaces a previously configured one).
+
+    Args:
+        api_key (str): The API key.
+        base_url (str, optional): Base URL of the API. Defaults to the OpenAI API.
+        **kwargs: Further arguments of `LLMClient`.
+
+    Returns:
+        LLMClient: The shared client.
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = LLMClient(api_key, base_url=base_url, **kwargs)
+    return _client
+
+
+def get_client() -> LLMClient:
+    """
+    Returns the client configured by `configure_client` (called by `check_config`).
+
+    Raises:
+        RuntimeError: If no client has been configured yet.
+    """
+    if _client is None:
+        raise RuntimeError('No LLM client configured. Call check_config() first.')
+    return _client
@@ -9,19 +9,153 @@ import sys
 import argparse
 from distutils.util import strtobool
 import os
-import openai
 import yaml
 from autodocumentation_python.clone_source import clone_source, copy_py_files, check_path, delete_content_except_one_folder #these are also some helper functions
-from autodocumentation_python.summarize_repo import summarize_repo
-from autodocumentation_python.create_docstrings import create_docstrings
-from autodocumentation_python.insert_docstrings import insert_docstrings
-from autodocumentation_python.check_config import check_config
-from autodocumentation_python.cost_estimator import cost_estimator
+from autodocumentation_python.summarize_repo import summarize_repo, cached_summary
+from autodocumentation_python.create_docstrings import create_docstrings, CHEAP_MODEL
+from autodocumentation_python.insert_docstrings import insert_docstrings, DocstringInserter
+from autodocumentation_python.check_config import check_config, load_config
+from autodocumentation_python.llm_client import get_client
+from autodocumentation_python.cost_estimator import cost_estimator, load_prices
+from autodocumentation_python.tokens import context_window, count_tokens
+from autodocumentation_python.batch_docstrings import plan_batches, create_docstrings_batch, COMMAND_BATCH
+from autodocumentation_python.parallel import run_pool, largest_first
+from autodocumentation_python.scan_repository import scan_repository, python_files, doc_files
+from autodocumentation_python.repo_context import RepoContext
+from autodocumentation_python.run_manifest import RunManifest, manifest_path, docstring_skeleton
+from autodocumentation_python.parsed_source import ParsedSource
+from autodocumentation_python.run_journal import RunJournal, JOURNAL_NAME
+from autodocumentation_python.docstring_quality import well_documented, QUALITY_THRESHOLD
+from autodocumentation_python.run_metrics import RunMetrics, configure_metrics, stage
 import traceback
 #from autodocumentation_python.filename_of_personal_repository_info import name_of_repository_info_function
 
 
-def main(source_path: str, cost: str, write_gpt_output: bool, max_lno, Model: str, summarize_repository) -> None:
+def document_file(file_path: str, source_path: str, target_dir: str, info_repo: str, max_lno: int, Model: str,
+                  cost: str, write_gpt_output: bool, edit_in_file: bool, manifest: RunManifest = None,
+                  incremental: bool = False, source: ParsedSource = None, docstrings: str = None,
+                  context: RepoContext = None, stream: bool = True, journal: RunJournal = None,
+                  documented: set = None) -> None:
+    """
+    Generates the docstrings for a single Python file and inserts them. This is the work done for
+    every file of the repository and is called concurrently by the worker pool in `main`.
+
+    Args:
+        file_path (str): Path of the file within the 'edited_repository' folder.
+        source_path (str): The URL/path given by the user (needed if the source files are edited).
+        target_dir (str): Path of the 'edited_repository' folder.
+        info_repo (str): The summary of the repository used as additional info.
+        max_lno (int): The maximum number of lines from which a code is split into snippets.
+        Model (str): The GPT model used for docstring generation.
+        cost (str): 'cheap' or 'expensive' (see `create_docstrings`).
+        write_gpt_output (bool): If True, the GPT output is written into the 'gpt_output' folder.
+        edit_in_file (bool): If True, the docstrings are inserted into the source files.
+        manifest (RunManifest, optional): The manifest in which the result is recorded. Defaults to None.
+        incremental (bool, optional): If True, only classes/functions which are new or modified since the
+            last run (recorded in `manifest`) are sent to the model. Defaults to False.
+        source (ParsedSource, optional): The parsed code of the file, if already parsed (e.g. by
+            `scan_repository`). Defaults to None (the file is read and parsed).
+        docstrings (str, optional): Docstrings which were already generated (e.g. by a batch request
+            for several small files). Defaults to None (the docstrings are generated).
+        context (RepoContext, optional): Selects the parts of `info_repo` and of the documentation which are
+            relevant to each request. Defaults to None (`info_repo` is attached to every request).
+        stream (bool, optional): If True, the answers are streamed and every class/function is inserted (and
+            compared to its old docstring) as soon as it has arrived. Defaults to True.
+        journal (RunJournal, optional): The journal of the run, in which answers, comparisons and the
+            insertion are recorded (and from which they are replayed if the run is resumed). Defaults to None.
+        documented (set, optional): Qualified names of the classes/functions whose docstrings are good enough
+            (see `docstring_quality`); they are neither sent to the model nor compared. Defaults to None.
+    """
+    path_dest = os.path.join(target_dir, 'gpt_output') #path to the gpt_output folder
+    rel_path = os.path.relpath(file_path, target_dir)
+    gpt_path = os.path.join(path_dest, rel_path)
+    file_journal = journal.for_file(rel_path) if journal is not None else None
+    insert_path = file_path
+    if edit_in_file:
+        #find path to file which is located in the source directory (but the current analyzed file is selected within the source folder/file copied to the folder cwd/edited_repository)
+        dir_source_diff = os.path.relpath(check_path(source_path), start=os.getcwd()) #dirs from cwd to (user specified) target_dir
+        insert_path = os.path.join(os.getcwd(), dir_source_diff, rel_path)
+    source_before = source if source is not None else ParsedSource.from_file(file_path)
+    source = source_before #current code of the file at insert_path
+    if insert_path != file_path and read_file(insert_path) != source_before.code:
+        source = ParsedSource.from_file(insert_path)
+
+    nodes = None
+    if incremental and manifest is not None:
+        nodes, reuse = manifest.plan(rel_path, source_before)
+        print(f'Incremental: {len(nodes)} new/modified classes/functions, {len(reuse)} docstrings reused from the last run: {file_path}')
+        if reuse:
+            source = insert_docstrings(insert_path, docstring_skeleton(reuse), Model, compare=False, source=source)
+    if documented:
+        nodes = [qualname for qualname in (nodes if nodes is not None else source_before.definitions) if qualname not in documented]
+        print(f'    {len(documented)} well documented classes/functions are kept, {len(nodes)} are sent to the model: {file_path}')
+    if nodes is not None and not nodes:
+        if manifest is not None:
+            manifest.record(rel_path, source_before, source)
+        if file_journal is not None:
+            file_journal.inserted()
+        return
+
+    keep = set(source.definitions) - set(nodes) if nodes is not None else documented #only the requested nodes are updated
+    inserter = DocstringInserter(insert_path, Model, source=source, journal=file_journal, keep=keep)
+    #in the next line the file is analyzed (if file > man_lno), docstrings are generated and saved in gpt_output (if enabled)
+    if docstrings is None:
+        try:
+            docstrings = create_docstrings(file_path, additional_info=info_repo,
+                                           max_lno=max_lno, Model=Model, cost=cost,
+                                           write_gpt_output=write_gpt_output, gpt_path=gpt_path, nodes=nodes,
+                                           source=source_before, context=context,
+                                           on_block=inserter.add if stream else None, #streamed classes/functions are inserted at once
+                                           journal=file_journal)
+        except BaseException:
+            inserter.close()
+            raise
+        if not stream:
+            inserter.add(docstrings)
+    else:
+        inserter.add(docstrings)
+
+    # inserts docstrings
+    try:
+        print('    Compare docstrings to old ones and insert them...')
+        source = inserter.finish()
+    except Exception as err:
+        print(f'    Error: {err}')
+        traceback.print_exc()
+        print('    Could not insert docstrings.')
+        print('    The file will be skipped.')
+        return
+
+    if manifest is not None:
+        manifest.record(rel_path, source_before, source)
+    if file_journal is not None:
+        file_journal.inserted()
+
+
+def print_metrics(report: dict) -> None:
+    """
+    Prints the metrics of a run per stage (see `run_metrics`).
+    """
+    print('\nMetrics per stage:')
+    print(f"    {'stage':<10}{'wall time':>11}{'requests':>10}{'errors':>8}{'cached':>8}{'tokens':>10}{'p95 latency':>13}{'costs':>10}")
+    for name, record in list(report['stages'].items()) + [('total', dict(report['totals'], wall_time=report['duration']))]:
+        p95 = record.get('latency', {}).get('p95')
+        print(f"    {name:<10}{record['wall_time']:>10.1f}s{record['requests']:>10}{record['errors']:>8}{record['cache_hits']:>8}"
+              f"{record['prompt_tokens'] + record['completion_tokens']:>10}{(f'{p95:.2f}s' if p95 is not None else '-'):>13}{record['cost']:>9.2f}$")
+    if report['unknown_models']:
+        print(f"    No price known for {', '.join(report['unknown_models'])} (not included in the costs).")
+
+
+def read_file(file_path: str) -> str:
+    with open(file_path, "r") as file:
+        return file.read()
+
+
+def main(source_path: str, cost: str, write_gpt_output: bool, max_lno, Model: str, summarize_repository, workers: int = 4, base_url: str = None,
+         use_cache: bool = True, refresh_cache: bool = False, incremental: bool = False, full_context: bool = False,
+         stream: bool = True, work_dir: str = None, assume_yes: bool = False, edit_in_file: bool = None,
+         limiter=None, resume: bool = False, quality_threshold: float = QUALITY_THRESHOLD, metrics_path: str = None,
+         prometheus_path: str = None) -> dict:
     """
     Orchestrates the process of generating and inserting docstrings into a given repository.
     
@@ -39,11 +173,49 @@ def main(source_path: str, cost: str, write_gpt_output: bool, max_lno, Model: st
             Defaults to True.
         detailed_repo_summary (bool, optional): If True, generates a detailed summary of the repository. 
             Defaults to True.
-        max_lno (int, optional): The maximum number of lines to split the code. Defaults to 1200.
+        max_lno (int, optional): The maximum number of lines to split the code. If None, files and snippets
+            are sized by their tokens to fit into the context window of the model.
         Model (str, optional): The GPT model used for docstring generation. Defaults to 'gpt-4-32k'.
+        workers (int, optional): The number of files which are documented at the same time. Defaults to 4.
+        base_url (str, optional): Base URL of an OpenAI compatible API. Defaults to None (value of the
+            config file or OpenAI API).
+        use_cache (bool, optional): If True, API responses are cached on disk and identical requests
+            are answered from the cache. Defaults to True.
+        refresh_cache (bool, optional): If True, cached responses are ignored and overwritten. Defaults
+            to False.
+        incremental (bool, optional): If True, only classes/functions which are new or modified since
+            the last run of the same source are sent to the model. Defaults to False.
+        full_context (bool, optional): If True, the whole summary of the repository is attached to every
+            request. By default only the passages of the summary and of the .md/.rst files which are
+            relevant to the code of a request are attached. Defaults to False.
+        stream (bool, optional): If True, the answers are streamed and docstrings are inserted while the
+            rest of an answer is still generated. Defaults to True.
+        work_dir (str, optional): The directory in which the 'edited_repository' folder is created. Defaults
+            to None (current working directory).
+        assume_yes (bool, optional): If True, the run does not ask for confirmations (an existing
+            'edited_repository' folder is deleted, the estimated costs are accepted). Defaults to False.
+        edit_in_file (bool, optional): If True, the docstrings are also inserted into the source files. Defaults
+            to None (the user is asked).
+        limiter (RateLimiter, optional): Rate limiter of all API calls (e.g. shared by the repositories of
+            a batch run). Defaults to None.
+        resume (bool, optional): If True, an interrupted run in the 'edited_repository' folder is continued:
+            files which are done are skipped and answers/comparisons recorded in its journal (JOURNAL_NAME in
+            the work directory, deleted when a run finishes) are replayed instead of sending the requests
+            again. Defaults to False.
+        quality_threshold (float, optional): Classes/functions whose existing docstrings score at least this
+            (0-1, see `docstring_quality.score_docstring`) are kept as they are and not sent to the model.
+            Defaults to QUALITY_THRESHOLD (None or values above 1: all classes/functions are sent).
+        metrics_path (str, optional): Path of the json report of the metrics of the run (wall time, requests,
+            latencies, tokens, cache hits and costs per stage, see `run_metrics`). Defaults to None
+            ('autodoc_metrics.json' in the work directory).
+        prometheus_path (str, optional): If given, the metrics are also written to this textfile in the
+            Prometheus format (e.g. for the textfile collector of the node exporter). Defaults to None.
     
     Returns:
-        None
+        dict: 'target_dir' (the 'edited_repository' folder), 'files' (number of documented files), 'skipped'
+            (files without classes/functions), 'resumed' (files already documented by the interrupted run),
+            'documented' (files which are already well documented), 'cache' (statistics of the response cache or None)
+            and 'metrics' (path of the report of the metrics, requests and costs of the run).
     """
     # CHECK INPUT
 
@@ -57,28 +229,49 @@ def main(source_path: str, cost: str, write_gpt_output: bool, max_lno, Model: st
     #     sys.stdout = output_file
     #     sys.stderr = output_file
 
-    if max_lno == None:
-        if Model == 'gpt-4-32k':
-            max_lno = 1200
-        elif Model == 'gpt-4':
-            max_lno = 300
-        elif Model == 'gpt-4-1106-preview':
-            max_lno = 700
-        else:
-            max_lno = 300
+    metrics = configure_metrics(RunMetrics()) #wall time, requests, tokens and costs per stage
 
     # CLONE SOURCE
-    target_dir = os.path.join(os.getcwd(), "edited_repository")
-    clone_source(source_path, target_dir)
-    path_dest = os.path.join(target_dir, 'gpt_output') #path to the gpt_output folder
+    target_dir = os.path.join(work_dir or os.getcwd(), "edited_repository")
+    journal_path = os.path.join(work_dir or os.getcwd(), JOURNAL_NAME) #not in the output folder
+    resumed = resume and os.path.isfile(journal_path) and os.path.isdir(target_dir)
+    with stage('clone'):
+        if resumed:
+            print(f'Resuming the interrupted run in {target_dir}')
+        else:
+            if resume:
+                print(f'No interrupted run found in {target_dir}, a new run is started.')
+            clone_source(source_path, target_dir, assume_yes=assume_yes)
+        repo_files = scan_repository(target_dir) #one pass over all .py/.md/.rst files, shared by all following stages
+    journal = RunJournal(journal_path, resume=resume) #records the progress, so an interrupted run can be resumed
+    for entry in python_files(repo_files):
+        if entry['source'] is not None:
+            entry['documented'] = well_documented(entry['source'], quality_threshold) #kept as they are
+    fully_documented = {entry['path'] for entry in python_files(repo_files)
+                        if entry.get('documented') and len(entry['documented']) == len(entry['source'].definitions)}
+    pending_files = {rel_path: entry for rel_path, entry in repo_files.items()
+                     if not journal.is_inserted(rel_path) and entry['path'] not in fully_documented}
+
+    info_repo = journal.summary if summarize_repository else None
+    if info_repo is None and summarize_repository and use_cache and not refresh_cache: #unchanged documentation: reuse the stored summary (of either model)
+        info_repo = cached_summary(repo_files, ['gpt-4-1106-preview', 'gpt-3.5-turbo-16k'], cache_dir=load_config().get('cache_dir'))
+
+    manifest = RunManifest(manifest_path(source_path, load_config().get('cache_dir'))) #hashes and docstrings of the last run (for --incremental)
 
     # ESTIMATE COSTS
-    detailed_repo_summary = cost_estimator(max_lno = max_lno, target_dir = target_dir, model = Model, cost = cost) #also checks if combinded .md/.rst files are too long for gpt-3.5-16k
+    with stage('estimate'):
+        cost_estimator(max_lno = max_lno, target_dir = target_dir, model = Model, cost = cost, repo_files = pending_files,
+                       summarize_repository = summarize_repository, workers = workers, full_context = full_context,
+                       summary_cached = info_repo is not None, assume_yes = assume_yes,
+                       cleanup = not resumed, #the work of an interrupted run is never deleted
+                       manifest = manifest if incremental else None)
 
 
     # CHECK CONFIG
-    check_config() #and get api_key
-    edit_in_file = True if input("Do you want to edit your current files (y) or leaving them untouched and create a new folder called 'edited_repository' including the edited files (n)? (y/n): ") == 'y' else False
+    config = check_config(base_url=base_url, max_connections=max(20, 2*workers), use_cache=use_cache, refresh_cache=refresh_cache,
+                          limiter=limiter) #and configure the client shared by all api calls
+    if edit_in_file is None:
+        edit_in_file = True if input("Do you want to edit your current files (y) or leaving them untouched and create a new folder called 'edited_repository' including the edited files (n)? (y/n): ") == 'y' else False
 
 
     # PRINT PARAMETERS
@@ -87,62 +280,127 @@ def main(source_path: str, cost: str, write_gpt_output: bool, max_lno, Model: st
     print(f'    cost: {cost}')
     print(f'    write gpt output: {write_gpt_output}')
     print(f'    summarize .md & .rst files: {summarize_repository}')
-    print(f'    max. snippet length: {max_lno} lines')
+    if max_lno is not None:
+        print(f'    max. snippet length: {max_lno} lines')
+    else:
+        print(f'    max. snippet size: by tokens (context window of {Model}: {context_window(Model)} tokens)')
     print(f'    Model: {Model}')
+    print(f'    workers: {workers}')
+    print(f'    response cache: {"refresh" if use_cache and refresh_cache else use_cache}')
+    print(f'    incremental: {incremental}')
+    print(f'    repository info per request: {"whole summary" if full_context else "relevant passages"}')
+    print(f'    stream answers: {stream}')
+    print(f'    resume: {resume}')
+    print(f'    keep docstrings with a score of at least: {quality_threshold}')
 
 
     # INFO ABOUT REPOSITORY
     #info_repo = f'info about repository:\n{read_SyConn_info()}'    #if you want to add your own info about the repository: make a file and function which returns a string with the info
                                                                     #and comment out the next code block (try/except) as remove comment in line 21
-    try:
-        info_repo = summarize_repo(target_dir, summarize_repository, Model='gpt-4-1106-preview', detailed=detailed_repo_summary)
-    except Exception:
-        info_repo = summarize_repo(target_dir, summarize_repository, Model='gpt-3.5-turbo-16k', detailed=False)
+    summary_cache = dict(cache_dir=config.get('cache_dir'), use_cache=use_cache, refresh=refresh_cache)
+    if info_repo is None:
+        with stage('summarize'):
+            try:
+                info_repo = summarize_repo(target_dir, summarize_repository, Model='gpt-4-1106-preview', repo_files=repo_files, concurrency=workers, **summary_cache)
+            except Exception:
+                info_repo = summarize_repo(target_dir, summarize_repository, Model='gpt-3.5-turbo-16k', repo_files=repo_files, concurrency=workers, **summary_cache)
+    if info_repo is not None and journal.summary is None:
+        journal.record('summary', summary=info_repo)
+
+
+    context = None
+    if info_repo is not None and not full_context:
+        context = RepoContext(doc_files(repo_files), info_repo) #index of the summary and the .md/.rst files
 
 
     # CREATE DOCSTRINGS
-    print('\nAnalyzing files:')
-    for root, dirs , files in os.walk(target_dir):
-        if 'gpt_output' in dirs:
-            dirs.remove('gpt_output') #exlude gpt_output folder from analysis
-        for file in files:
-            if file.endswith(".py"):
-                file_path = os.path.join(root, file)
-                gpt_path = os.path.join(path_dest, os.path.relpath(file_path, target_dir))
-
-                #in the next line the file is analyzed (if file > man_lno), docstrings are generated and saved in gpt_output (if enabled)
-                docstrings = create_docstrings(file_path, additional_info=info_repo, 
-                                              max_lno=max_lno, Model=Model, cost=cost,
-                                              write_gpt_output=write_gpt_output, gpt_path=gpt_path)
-
-                # inserts docstrings
-                try:
-                    print('    Compare docstrings to old ones and insert them...')
-                    if edit_in_file:
-                        #find path to file which is located in the source directory (but the current analyzed file is selected within the source folder/file copied to the folder cwd/edited_repository)
-                        dir_source_diff = os.path.relpath(check_path(source_path), start=os.getcwd()) #dirs from cwd to (user specified) target_dir
-                        file_diff = os.path.relpath(file_path, start=os.path.join(os.getcwd(),'edited_repository')) #path from edited_repository to analyzed file
-                        file_path = os.path.join(os.getcwd(), dir_source_diff, file_diff)
-                    insert_docstrings(file_path, docstrings, Model) 
-                except Exception as err:
-                    print(f'    Error: {err}')
-                    traceback.print_exc()
-                    print('    Could not insert docstrings.')
-                    print('    The file will be skipped.')
-                    continue
-                
+    print(f'\nAnalyzing files (workers: {workers}):')
+    entries = {entry['path']: entry for entry in python_files(repo_files) if entry['has_defs']}
+    skipped = len(python_files(repo_files)) - len(entries)
+    if skipped:
+        print(f'    {skipped} files without class- or function-definitions are skipped.')
+    done = [path for path, entry in entries.items() if journal.is_inserted(entry['rel_path'])]
+    if done:
+        print(f'    {len(done)} files were already documented by the interrupted run and are skipped.')
+        for path in done:
+            del entries[path]
+    well_documented_files = [path for path in entries if path in fully_documented]
+    if well_documented_files:
+        print(f'    {len(well_documented_files)} files are already well documented and are skipped.')
+        for path in well_documented_files:
+            del entries[path]
+
+    def process_file(file_path, docstrings=None):
+        document_file(file_path, source_path=source_path, target_dir=target_dir, info_repo=info_repo,
+                      max_lno=max_lno, Model=Model, cost=cost, write_gpt_output=write_gpt_output,
+                      edit_in_file=edit_in_file, manifest=manifest, incremental=incremental,
+                      source=entries[file_path]['source'], docstrings=docstrings, context=context, stream=stream,
+                      journal=journal, documented=entries[file_path].get('documented'))
+
+    def process_batch(file_paths):
+        #one request for several small files, files missing in the answer are documented on their own
+        files = [(path, entries[path]['rel_path'], os.path.join(target_dir, 'gpt_output', entries[path]['rel_path']),
+                  entries[path]['source'].code) for path in file_paths]
+        additional_info = context.for_code('\n'.join(code for _, _, _, code in files)) if context is not None else info_repo
+        journals = {path: journal.for_file(rel_path) for path, rel_path, _, _ in files}
+        keys = {path: journal.key(CHEAP_MODEL, COMMAND_BATCH, code) for path, _, _, code in files}
+        answers = {path: journals[path].answer(keys[path]) for path in file_paths
+                   if journals[path].answer(keys[path]) is not None} #answers of the interrupted run
+        files = [file for file in files if file[0] not in answers]
+        try:
+            if files:
+                generated = create_docstrings_batch(files, additional_info=additional_info, write_gpt_output=write_gpt_output)
+                for path, answer in generated.items():
+                    journals[path].generated(keys[path], answer, part='batch')
+                answers.update(generated)
+        except Exception as err:
+            print(f'    Error: {err}')
+            print('    The files are documented one by one.')
+        for path in file_paths:
+            try:
+                process_file(path, docstrings=answers.get(path))
+            except Exception as err:
+                print(f'    Error while processing {path}: {err}')
+                traceback.print_exc()
+
+    # small files are packed into batches in cheap mode (not in incremental mode, where only parts of files are sent)
+    batches = []
+    if cost == 'cheap' and not incremental:
+        info_tokens = context.max_tokens if context is not None else (count_tokens(info_repo, CHEAP_MODEL) if info_repo else 0)
+        batches = [tuple(entry['path'] for entry in batch)
+                   for batch in plan_batches(list(entries.values()), Model, max_lno, info_tokens)]
+        if batches:
+            print(f'    {sum(len(batch) for batch in batches)} small files are packed into {len(batches)} request(s).')
+    batched = {path for batch in batches for path in batch}
+    jobs = batches + [path for path in entries if path not in batched]
+    sizes = {path: entry['size'] for path, entry in entries.items()}
+    sizes.update({batch: sum(sizes[path] for path in batch) for batch in batches})
+    run_pool(largest_first(jobs, sizes), lambda job: process_batch(job) if isinstance(job, tuple) else process_file(job),
+             workers=workers) #largest files first, so they don't start last
+    manifest.save()
+
     #also copy info_repo in gpt_output
     if write_gpt_output and info_repo != None:
         dest_path = os.path.join(target_dir, 'gpt_output')
+        os.makedirs(dest_path, exist_ok=True)
         with open(os.path.join(dest_path, 'info_repo'), "w") as file:
             file.write(info_repo)
     if edit_in_file:
-        delete_content_except_one_folder(os.path.join(os.getcwd(), 'edited_repository'), 'gpt_output')
+        delete_content_except_one_folder(target_dir, 'gpt_output')
+    journal.remove() #the run is finished
 
 
 
+    cache_stats = get_client().cache.stats() if get_client().cache is not None else None
+    if cache_stats is not None:
+        print(f'\nResponse cache: {cache_stats}')
+    metrics_path = metrics_path or os.path.join(work_dir or os.getcwd(), 'autodoc_metrics.json')
+    report = metrics.write(metrics_path, prometheus_path, prices=load_prices(config), labels={'source': source_path})
+    configure_metrics(None)
+    print_metrics(report)
+    print(f'    Report: {metrics_path}' + (f' (Prometheus: {prometheus_path})' if prometheus_path else ''))
     print('\nFinished!')
-    print('You can see your edited repository in the folder "edited_repository" of your current working directory')
+    print(f'You can see your edited repository in the folder {target_dir}')
     # if save_terminal_output:
     #     # Reset the standard output and error streams
     #     sys.stdout = original_stdout
@@ -151,6 +409,9 @@ def main(source_path: str, cost: str, write_gpt_output: bool, max_lno, Model: st
     #     output_file.close()
     #     print(f'The terminal output was saved in the file {output_file_path} in the folder "edited_repository" of your cwd')
 
+    return {'target_dir': target_dir, 'files': len(entries), 'skipped': skipped, 'resumed': len(done),
+            'documented': len(well_documented_files), 'cache': cache_stats, 'metrics': metrics_path}
+
 
 
 
@@ -166,9 +427,20 @@ def execute():
     # Optional arguments
     parser.add_argument("--cost", type=str, default='expensive', help="('expensive'/'cheap'); expensive: always uses gpt-4-32k; cheap: uses gpt-3.5-turbo-16k for files < 300 lines and gpt-4-32k for files > 300 lines")
     parser.add_argument("--write_gpt_output", dest='write_gpt_output', type=lambda x: bool(strtobool(x)), default=True, help="(True/False); writes the GPT output/docstrings into a folder 'gpt-output' within the folder eddited repository ")
-    parser.add_argument("--max_lno", type=int, help="(int_number); length [in lines] from which a code is split into snippets (max_lno is also approx. the length of the snippets)")
+    parser.add_argument("--max_lno", type=int, help="(int_number); length [in lines] from which a code is split into snippets (max_lno is also approx. the length of the snippets). By default files and snippets are sized by tokens to fit into the context window of the model")
     parser.add_argument("--Model", type=str, default='gpt-4-1106-preview', help="(gpt-4-32k/gpt-4); gpt-model used for docstring generation (if cost = 'expensive' for all files, if cost = 'cheap' only for ones > 300 lines) ")
     parser.add_argument("--summarize_repository", dest='summarize_repository', type=lambda x: bool(strtobool(x)), default=True, help="(True/False); generates a detailed summary of all .md & .rst files of the repository")
+    parser.add_argument("--workers", type=int, default=4, help="(int_number); number of files which are documented at the same time (largest files first)")
+    parser.add_argument("--base_url", type=str, default=None, help="(URL); base URL of an OpenAI compatible API (default: 'base_url' of config_autodoc.yaml or the OpenAI API)")
+    parser.add_argument("--no_cache", dest='use_cache', action='store_false', help="do not use the on-disk cache of API responses (~/.cache/autodoc)")
+    parser.add_argument("--refresh", dest='refresh_cache', action='store_true', help="ignore cached API responses and replace them with new ones")
+    parser.add_argument("--incremental", action='store_true', help="only send classes/functions which are new or modified since the last run of the same source to the model")
+    parser.add_argument("--full_context", action='store_true', help="attach the whole summary of the repository to every request (default: only the passages of the summary and .md/.rst files relevant to the code)")
+    parser.add_argument("--quality_threshold", dest='quality_threshold', type=float, default=QUALITY_THRESHOLD, help="(0-1); classes/functions whose existing docstrings reach this score (summary, Args/Returns/Raises sections, length) are kept as they are and not sent to the model; values above 1 send all")
+    parser.add_argument("--resume", action='store_true', help="continue an interrupted run in 'edited_repository' (done files are skipped, recorded answers are replayed)")
+    parser.add_argument("--no_stream", dest='stream', action='store_false', help="wait for complete answers instead of streaming them (for APIs without streaming)")
+    parser.add_argument("--metrics", dest='metrics_path', type=str, default=None, help="(path); json report of the metrics per stage: wall time, requests, latencies, tokens, cache hits and costs (default: autodoc_metrics.json in the cwd)")
+    parser.add_argument("--prometheus", dest='prometheus_path', type=str, default=None, help="(path); also write the metrics as Prometheus textfile (e.g. for the node exporter)")
     #parser.add_argument("--save_terminal_output", dest='save_terminal_output', type=lambda x: bool(strtobool(x)), default=True, help="(True/False); saves the terminal output in a file 'terminal_output.txt' in the folder 'edited_repository'")
 
     args = parser.parse_args()
@@ -180,6 +452,17 @@ def execute():
         max_lno=args.max_lno,
         Model=args.Model,
         summarize_repository=args.summarize_repository,
+        workers=args.workers,
+        base_url=args.base_url,
+        use_cache=args.use_cache,
+        refresh_cache=args.refresh_cache,
+        incremental=args.incremental,
+        full_context=args.full_context,
+        stream=args.stream,
+        resume=args.resume,
+        quality_threshold=args.quality_threshold,
+        metrics_path=args.metrics_path,
+        prometheus_path=args.prometheus_path,
         #save_terminal_output=args.save_terminal_output,
     )
 
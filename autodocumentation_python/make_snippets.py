@@ -5,55 +5,64 @@
 # Max-Planck-Institute of biological Intelligence, Munich, Germany
 # Authors: Karl Heggenberger, Joergen Kornfeld
 
-import os
-import ast
-import astunparse
+import itertools
+from autodocumentation_python.parsed_source import ParsedSource
+from autodocumentation_python.tokens import count_tokens
 
 
-def make_snippets(file_path: str, max_lno: int = 300):
+def make_snippets(file_path: str, max_lno: int = None, code: str = None, max_tokens: int = None, model: str = None,
+                  source: ParsedSource = None):
     """
-    Generates code snippets from a file based on the maximum number of lines. This function is used to 
-    break down a large code file into smaller snippets for easier analysis and docstring generation.
+    Generates code snippets from a file. This function is used to break down a large code file into
+    smaller snippets, each of which fits into one request to the model. The top-level statements are
+    packed one after another into a snippet as long as it does not exceed the budget; a class or
+    function that is larger than the budget on its own is split between its children. A snippet
+    never starts in the middle of a decorator list.
     
     Args:
         file_path (str): The path to the file from which code snippets are to be generated.
-        max_lno (int, optional): The maximum number of lines for each snippet. Defaults to 300.
+        max_lno (int, optional): The maximum number of lines of each snippet. Only used if `max_tokens`
+            is None. Defaults to None (300 lines).
+        code (str, optional): The code to be split. Defaults to None (the code of the file is read).
+        max_tokens (int, optional): The maximum number of tokens of each snippet (see
+            `tokens.code_token_budget`). Defaults to None (snippets are sized by lines).
+        model (str, optional): The model whose tokenizer is used to count the tokens. Defaults to None.
+        source (ParsedSource, optional): The parsed code. Defaults to None (`code` or the file is parsed).
     
     Returns:
         list: A list of dictionaries. Each dictionary contains a code snippet (str) ['code'] and its respective 
         line count (int) ['lines'].
     """
+    if source is None:
+        if code is None:
+            with open(file_path, "r") as file:
+                code = file.read()
+        source = ParsedSource(code, file_path)
+    lines = source.lines
+    tree = source.tree
 
-    def length_of_node(node):
+    if max_tokens is not None:
+        limit = max_tokens
+        line_sizes = [count_tokens(line, model) for line in lines]
+    else:
+        limit = max_lno or 300
+        line_sizes = [1] * len(lines)
+    cumulative_sizes = [0] + list(itertools.accumulate(line_sizes))
+
+    def size(first_line, last_line):
         """
-        Calculates the length of a node in terms of lines of code. This function is used to determine the 
-        size of a code snippet based on the number of lines in the node.
-        
-        Args:
-            node (ast.AST): The node to calculate the length of.
-        
-        Returns:
-            int: The length of the node in terms of lines of code.
+        Calculates the size (tokens or lines) of the lines first_line to last_line (1-based, inclusive).
         """
-        return node.end_lineno - node.lineno + 1
-    
-    with open(file_path, "r") as file:
-        code = file.read()
-        file.seek(0)
-        lines = file.readlines()
-
-    tree = ast.parse(code)
+        return cumulative_sizes[last_line] - cumulative_sizes[first_line-1]
 
     cutted_file = []
-    current_snippet = ''
-    current_snippet_length = 0
     current_snippet_start = 1
+    headers_end = 0 #the current snippet only contains definition lines of enclosing classes/functions up to this line
 
     def evaluate_node(node):
         """
         Evaluates a node to determine if it should be included in the current snippet or start a new one. 
-        This function is used to ensure that the size of each code snippet does not exceed the maximum 
-        number of lines specified.
+        This function is used to ensure that the size of each code snippet does not exceed the budget.
         
         Args:
             node (ast.AST): The node to evaluate.
@@ -61,49 +70,32 @@ def make_snippets(file_path: str, max_lno: int = 300):
         Returns:
             None
         """
-        nonlocal current_snippet
-        nonlocal current_snippet_length
         nonlocal current_snippet_start
-        if length_of_node(node) + current_snippet_length <= max_lno:
-            current_snippet_length = node.end_lineno + 1 - current_snippet_start
-        else:
-            # end current snippet
-            text_node = astunparse.unparse(node).strip()
-            if text_node.startswith('@'):
-                current_snippet_list = lines[current_snippet_start-1 : node.lineno-2]
-                current_snippet_length = len(current_snippet_list)
-                current_snippet = ''.join(current_snippet_list)
-            elif not text_node.startswith('@'):
-                current_snippet_list = lines[current_snippet_start-1 : node.lineno-1]
-                current_snippet_length = len(current_snippet_list)
-                current_snippet = ''.join(current_snippet_list)
-            dict_current_snippet = {'code': current_snippet, 'lines': current_snippet_length}
-            cutted_file.append(dict_current_snippet)
-            current_snippet = ''
-            current_snippet_length = 0
+        nonlocal headers_end
+        if size(current_snippet_start, node.end_lineno) <= limit:
+            return #node is added to the current snippet
 
-            # start new snippet now
-            if text_node.startswith('@'):
-                current_snippet_start = node.lineno - 1
-            elif not text_node.startswith('@'):
-                current_snippet_start = node.lineno
-            
-            if length_of_node(node) <= max_lno:
-                current_snippet_length = node.end_lineno + 1 - current_snippet_start
-            elif length_of_node(node) > max_lno:
-                children = node.body
-                for child in children:
-                    evaluate_node(child)
+        # end current snippet before the node (and its decorators), unless the snippet only consists of
+        # the definition lines of the enclosing classes/functions, which are kept with their first child
+        start = source.span(node)[0]
+        if start > current_snippet_start and headers_end < start - 1:
+            current_snippet_list = lines[current_snippet_start-1 : start-1]
+            cutted_file.append({'code': ''.join(current_snippet_list), 'lines': len(current_snippet_list)})
+            current_snippet_start = start
+            headers_end = start - 1
 
+        # a node larger than the budget is split between its children
+        if size(start, node.end_lineno) > limit and isinstance(getattr(node, 'body', None), list):
+            if headers_end >= start - 1:
+                headers_end = source.span(node.body[0])[0] - 1
+            for child in node.body:
+                evaluate_node(child)
 
     for node in tree.body:
         evaluate_node(node)
 
     # end last snippet
     current_snippet_list = lines[current_snippet_start-1 :]
-    current_snippet_length = len(current_snippet_list)
-    current_snippet = ''.join(current_snippet_list)
-    dict_current_snippet = {'code': current_snippet, 'lines': current_snippet_length}
-    cutted_file.append(dict_current_snippet)
+    cutted_file.append({'code': ''.join(current_snippet_list), 'lines': len(current_snippet_list)})
 
     return cutted_file
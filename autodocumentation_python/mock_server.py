@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import re
+import ast
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import http.server
+from autodocumentation_python.tokens import count_tokens, count_message_tokens
+from autodocumentation_python.create_docstrings import COMMAND_WHOLE_CODE
+from autodocumentation_python.batch_docstrings import FILE_START, FILE_END
+from autodocumentation_python.insert_docstrings import DOCSTRING_START, DOCSTRING_END
+
+LATENCIES = ('fixed', 'uniform', 'exponential', 'lognormal')
+CHUNK_CHARS = 40 #characters per streamed chunk
+
+
+def mock_docstring(node) -> str:
+    """
+    Returns a deterministic google style docstring for a class/function (derived from its name,
+    parameters and return statements).
+    """
+    kind = 'Class' if isinstance(node, ast.ClassDef) else 'Function'
+    lines = [f'{kind} {node.name} (mock documentation).']
+    function = node
+    if isinstance(node, ast.ClassDef):
+        function = next((child for child in node.body if isinstance(child, ast.FunctionDef) and child.name == '__init__'), None)
+    params = [arg.arg for arg in function.args.args + function.args.kwonlyargs if arg.arg not in ('self', 'cls')] if function else []
+    if params:
+        lines += ['', 'Args:'] + [f'    {param}: The parameter {param}.' for param in params]
+    if isinstance(node, ast.FunctionDef) and any(isinstance(child, ast.Return) and child.value is not None
+                                                 for child in ast.walk(node)):
+        lines += ['', 'Returns:', f'    The result of {node.name}.']
+    return '\n'.join(lines)
+
+
+def mock_skeleton(code: str) -> str:
+    """
+    Answers COMMAND_DOCSTRINGS/COMMAND_SNIPPETS: the definitions of the code with docstrings.
+    """
+    out = []
+
+    def visit(node, depth):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                indent = '    ' * depth
+                definition = 'class' if isinstance(child, ast.ClassDef) else 'def'
+                out.append(f'{indent}{definition} {child.name}():')
+                out.extend(f'{indent}    {line}'.rstrip() for line in ['"""', *mock_docstring(child).split('\n'), '"""'])
+                visit(child, depth + 1)
+            else:
+                visit(child, depth)
+
+    visit(ast.parse(code), 0)
+    return 'start\n' + '\n'.join(out) + '\nend'
+
+
+def mock_code(code: str) -> str:
+    """
+    Answers COMMAND_WHOLE_CODE: the code with docstrings (unparsed, so comments are lost).
+    """
+    tree = ast.parse(code)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            docstring = ast.Expr(ast.Constant(mock_docstring(node)))
+            if ast.get_docstring(node) is not None:
+                node.body[0] = docstring
+            else:
+                node.body.insert(0, docstring)
+    return ast.unparse(tree)
+
+
+def mock_answer(messages: list) -> str:
+    """
+    Builds the deterministic answer to a request of autodoc from its command and code.
+    """
+    command = messages[1]['content'] if len(messages) > 1 else ''
+    code = messages[-1]['content'].split('code to be edited:\n', 1)[-1]
+    try:
+        if FILE_START in command: #several small files
+            files = re.findall(rf'^{re.escape(FILE_START)} (.+)\n(.*?)^{re.escape(FILE_END)} \1$', code, re.M | re.S)
+            return '\n'.join(f'{FILE_START} {path}\n{mock_code(text)}\n{FILE_END} {path}' for path, text in files)
+        if command == COMMAND_WHOLE_CODE:
+            return mock_code(code)
+        if 'code to be edited:' in messages[-1]['content']:
+            return mock_skeleton(code)
+    except SyntaxError:
+        return 'start\nend'
+    if DOCSTRING_START in command: #batched comparison: the generated docstrings are kept
+        pairs = re.findall(r'^pair (\d+):\nold docstring:\n.*?\ngenerated docstring:\n(.*?)\n(?=pair \d+:|\Z)', command, re.M | re.S)
+        return '\n'.join(f'{DOCSTRING_START} {number}\n{new.strip()}\n{DOCSTRING_END} {number}' for number, new in pairs)
+    if 'generated docstring:' in command:
+        return 'start\n' + command.split('generated docstring:', 1)[1].strip() + '\nend'
+    digest = hashlib.sha256(json.dumps(messages).encode('utf-8')).hexdigest()[:8]
+    return f'Mock summary {digest} of the documentation of the repository.'
+
+
+class MockServer:
+    """
+    Local stand-in for an OpenAI compatible chat completions API (POST .../chat/completions, with
+    and without streaming), e.g. to measure the pipeline without costs (see `benchmark`). The
+    answers are deterministic and derived from the code of the requests (see `mock_answer`). The
+    latency of the answers follows a configurable distribution; errors (500) and rate limits (429
+    with Retry-After) can be injected with a given probability.
+
+    Args:
+        port (int, optional): The port. Defaults to 0 (a free port).
+        latency (str, optional): Distribution of the time to the first token: 'fixed', 'uniform'
+            (0 to 2*mean), 'exponential' or 'lognormal'. Defaults to 'lognormal'.
+        latency_mean (float, optional): Mean time [s] to the first token. Defaults to 0.2.
+        tokens_per_second (float, optional): Speed of the generation (streamed answers are sent in
+            chunks at this pace, other answers are delayed accordingly). Defaults to None (instantly).
+        error_rate (float, optional): Probability of an error 500. Defaults to 0.
+        rate_limit_rate (float, optional): Probability of an error 429. Defaults to 0.
+        retry_after (float, optional): The Retry-After header [s] of the 429 answers. Defaults to 1.
+        seed (int, optional): Seed of the random latencies and errors. Defaults to 0.
+    """
+    def __init__(self, port: int = 0, latency: str = 'lognormal', latency_mean: float = 0.2,
+                 tokens_per_second: float = None, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1, seed: int = 0):
+        if latency not in LATENCIES:
+            raise ValueError(f"Unknown latency distribution '{latency}' (one of {', '.join(LATENCIES)})")
+        self.port = port
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'answered': 0, 'errors': 0, 'rate_limited': 0, 'streamed': 0,
+                      'prompt_tokens': 0, 'completion_tokens': 0}
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+
+    def start(self) -> str:
+        """
+        Starts the server in a background thread.
+
+        Returns:
+            str: The base URL of the API (e.g. for `--base_url`).
+        """
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+                    return
+                mock.handle(self, json.loads(body))
+
+            def send_json(self, status, data, headers=None):
+                out = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sample(self) -> tuple:
+        """
+        Draws the latency [s] and the outcome ('ok', 'error' or 'rate_limited') of a request.
+        """
+        with self.lock:
+            mean = self.latency_mean
+            if self.latency == 'fixed':
+                latency = mean
+            elif self.latency == 'uniform':
+                latency = self.random.uniform(0, 2 * mean)
+            elif self.latency == 'exponential':
+                latency = self.random.expovariate(1 / mean) if mean > 0 else 0
+            else: #lognormal with sigma 0.5 and the given mean
+                latency = self.random.lognormvariate(0, 0.5) * mean / 1.1331 if mean > 0 else 0
+            draw = self.random.random()
+        if draw < self.error_rate:
+            return latency, 'error'
+        if draw < self.error_rate + self.rate_limit_rate:
+            return latency, 'rate_limited'
+        return latency, 'ok'
+
+    def count(self, **numbers) -> None:
+        with self.lock:
+            for name, number in numbers.items():
+                self.stats[name] += number
+
+    def handle(self, handler, body: dict) -> None:
+        """
+        Answers one chat completions request.
+        """
+        self.count(requests=1)
+        latency, outcome = self.sample()
+        time.sleep(latency)
+        if outcome == 'rate_limited':
+            self.count(rate_limited=1)
+            handler.send_json(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'rate_limit'}},
+                              headers={'retry-after': f'{self.retry_after:g}'})
+            return
+        if outcome == 'error':
+            self.count(errors=1)
+            handler.send_json(500, {'error': {'message': 'Internal error (mock)', 'type': 'server_error'}})
+            return
+
+        model, messages = body.get('model', 'gpt-4'), body.get('messages', [])
+        try:
+            answer = mock_answer(messages)
+        except Exception as err: #a malformed request must not leave the client waiting
+            self.count(errors=1)
+            handler.send_json(500, {'error': {'message': f'{type(err).__name__}: {err} (mock)', 'type': 'server_error'}})
+            return
+        usage = {'prompt_tokens': count_message_tokens(messages, model), 'completion_tokens': count_tokens(answer, model)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        self.count(answered=1, prompt_tokens=usage['prompt_tokens'], completion_tokens=usage['completion_tokens'])
+        pace = (CHUNK_CHARS / 4) / self.tokens_per_second if self.tokens_per_second else 0 #about 4 characters per token
+
+        if not body.get('stream'):
+            time.sleep(pace * len(answer) / CHUNK_CHARS)
+            handler.send_json(200, {'id': 'mock', 'object': 'chat.completion', 'model': model, 'usage': usage,
+                                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                                 'message': {'role': 'assistant', 'content': answer}}]})
+            return
+        self.count(streamed=1)
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+
+        def send(data):
+            data = f'data: {data}\n\n'.encode('utf-8')
+            handler.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+            handler.wfile.flush()
+
+        for start in range(0, len(answer), CHUNK_CHARS):
+            send(json.dumps({'id': 'mock', 'object': 'chat.completion.chunk', 'model': model,
+                             'choices': [{'index': 0, 'delta': {'content': answer[start:start+CHUNK_CHARS]}}]}))
+            time.sleep(pace)
+        send('[DONE]')
+        handler.wfile.write(b'0\r\n\r\n')
+        handler.wfile.flush()
+
+
+def execute():
+    """
+    Command line entry point: runs the mock server until it is stopped (Ctrl-C).
+    """
+    parser = argparse.ArgumentParser(description="Local mock of an OpenAI compatible API for autodoc (no costs, deterministic answers).")
+    parser.add_argument("--port", type=int, default=8000, help="port of the server")
+    parser.add_argument("--latency", type=str, default='lognormal', choices=LATENCIES, help="distribution of the time to the first token")
+    parser.add_argument("--latency_mean", dest='latency_mean', type=float, default=0.2, help="mean time to the first token [s]")
+    parser.add_argument("--tokens_per_second", dest='tokens_per_second', type=float, default=None, help="speed of the generation (default: instantly)")
+    parser.add_argument("--error_rate", dest='error_rate', type=float, default=0.0, help="probability of an error 500")
+    parser.add_argument("--rate_limit_rate", dest='rate_limit_rate', type=float, default=0.0, help="probability of an error 429")
+    parser.add_argument("--retry_after", dest='retry_after', type=float, default=1, help="Retry-After of the 429 answers [s]")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random latencies and errors")
+    args = parser.parse_args()
+
+    server = MockServer(**vars(args))
+    print(f'Mock API running at {server.start()} (use it with --base_url), stop with Ctrl-C.')
+    try:
+        while True:
+            time.sleep(60)
+            print(f'    {server.stats}')
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    execute()
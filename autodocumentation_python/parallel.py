@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import io
+import os
+import sys
+import threading
+import traceback
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class GroupedStream:
+    """
+    Replacement for sys.stdout/sys.stderr that keeps the console output of worker threads together.
+    Text written by a thread inside of `OutputGroups.group()` is buffered and only written to the
+    real stream once the group is closed. Text written outside of a group is passed through directly.
+
+    Args:
+        stream (io.TextIOBase): The real stream the text is finally written to.
+        local (threading.local): Thread local storage shared by the stdout and stderr replacement, so
+            that both end up in the same buffer.
+        lock (threading.Lock): Lock shared by all replacements to avoid interleaved writes.
+    """
+    def __init__(self, stream, local, lock):
+        self.stream = stream
+        self.local = local
+        self.lock = lock
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is not None:
+            return buffer.write(text)
+        with self.lock:
+            return self.stream.write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class OutputGroups:
+    """
+    Installs GroupedStream objects as sys.stdout and sys.stderr and hands out output groups for
+    the worker threads.
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def group(self):
+        """
+        Buffers everything the current thread prints until the block is left and then writes it
+        to the console in one piece.
+        """
+        self.local.buffer = io.StringIO()
+        try:
+            yield
+        finally:
+            text = self.local.buffer.getvalue()
+            self.local.buffer = None
+            with self.lock:
+                self.stdout.stream.write(text)
+                self.stdout.stream.flush()
+
+    def __enter__(self):
+        self.stdout = GroupedStream(sys.stdout, self.local, self.lock)
+        self.stderr = GroupedStream(sys.stderr, self.local, self.lock)
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout, sys.stderr = self.stdout.stream, self.stderr.stream
+        return False
+
+
+def in_output_group(function):
+    """
+    Wraps a function which is called in another thread (e.g. of an executor started by a worker), so
+    its console output goes to the output group of the calling thread (see `OutputGroups.group`)
+    instead of being interleaved with the output of other files.
+
+    Returns:
+        callable: The wrapped function (the function itself if the caller is not in a group).
+    """
+    stream = sys.stdout
+    buffer = getattr(stream.local, 'buffer', None) if isinstance(stream, GroupedStream) else None
+    if buffer is None:
+        return function
+
+    @functools.wraps(function)
+    def call(*args, **kwargs):
+        previous = getattr(stream.local, 'buffer', None)
+        stream.local.buffer = buffer
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stream.local.buffer = previous
+    return call
+
+
+def largest_first(file_paths, sizes: dict = None):
+    """
+    Sorts file paths by file size (largest first). Large files take the longest to document, so
+    starting them first keeps them from becoming the stragglers at the end of a run.
+
+    Args:
+        file_paths (list): Paths of the files to be processed.
+        sizes (dict, optional): Known sizes of the files (path -> size), e.g. from the manifest of the
+            repository. Defaults to None (the sizes are looked up on the file system).
+
+    Returns:
+        list: The file paths sorted by descending size.
+    """
+    if sizes is None:
+        sizes = {path: os.path.getsize(path) for path in file_paths}
+    return sorted(file_paths, key=lambda path: sizes[path], reverse=True)
+
+
+def run_pool(items, function, workers: int = 4):
+    """
+    Calls `function(item)` for every item using a bounded pool of worker threads. The items are
+    submitted in the given order and the console output of every call is printed as one block once
+    the call is finished. Exceptions are printed and do not stop the remaining items.
+
+    Args:
+        items (list): The items to be processed (e.g. file paths, sorted with `largest_first`).
+        function (callable): The function called for each item.
+        workers (int, optional): Maximum number of items processed at the same time. Defaults to 4.
+
+    Returns:
+        dict: The return value of `function` for every item (None if the call raised an exception).
+    """
+    results = {}
+    if workers <= 1:
+        for item in items:
+            try:
+                results[item] = function(item)
+            except Exception as err:
+                print(f'    Error while processing {item}: {err}')
+                traceback.print_exc()
+                results[item] = None
+        return results
+
+    with OutputGroups() as groups:
+        def grouped_call(item):
+            with groups.group():
+                return function(item)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(grouped_call, item): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    results[item] = future.result()
+                except Exception as err:
+                    print(f'    Error while processing {item}: {err}')
+                    traceback.print_exc()
+                    results[item] = None
+    return results
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import ast
+from autodocumentation_python.summarize_file import definitions, node_start, code_info, code_of_nodes
+
+
+class ParsedSource:
+    """
+    The code of a python file parsed once. It carries everything the stages of autodoc need to know
+    about the structure of the code (abstract syntax tree, lines, classes/functions and their spans
+    including decorators, skeleton of the file), so the file is not parsed again by every stage.
+    The object is not changed by the stages; if the code is edited (docstrings inserted), a new
+    object is built from the new code.
+
+    Args:
+        code (str): The code.
+        path (str, optional): The path of the file (only used for messages). Defaults to None.
+
+    Raises:
+        SyntaxError: If the code can not be parsed.
+    """
+    def __init__(self, code: str, path: str = None):
+        self.code = code
+        self.path = path
+        self.lines = code.splitlines(keepends=True) #line i (1-based) is self.lines[i-1]
+        self.tree = ast.parse(code)
+        self.definitions = definitions(self.tree) #qualified name -> class-/function-node
+        self.nodes = [node for node in ast.walk(self.tree) if isinstance(node, (ast.ClassDef, ast.FunctionDef))]
+        self._skeleton = None
+
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path, "r") as file:
+            return cls(file.read(), path)
+
+    @property
+    def has_definitions(self) -> bool:
+        return bool(self.nodes)
+
+    @staticmethod
+    def span(node) -> tuple:
+        """
+        Returns the first (including decorators) and the last line of a node (1-based, inclusive).
+        """
+        return node_start(node), node.end_lineno
+
+    def segment(self, node) -> str:
+        """
+        Returns the code of a node including its decorators (whole lines).
+        """
+        start, end = self.span(node)
+        return ''.join(self.lines[start-1 : end])
+
+    def nodes_between(self, first_line: int, last_line: int) -> list:
+        """
+        Returns all class-/function-nodes defined within the lines first_line to last_line (1-based, inclusive).
+        """
+        return [node for node in self.nodes if first_line <= node.lineno <= last_line]
+
+    @property
+    def skeleton(self) -> str:
+        """
+        The definitions and docstrings of all classes/functions of the file (see `code_info`).
+        """
+        if self._skeleton is None:
+            self._skeleton = code_info(self.path, code=self.code, tree=self.tree)
+        return self._skeleton
+
+    def code_of_nodes(self, qualnames: list) -> str:
+        """
+        Extracts the code of some classes/functions (see `summarize_file.code_of_nodes`).
+        """
+        return code_of_nodes(self.code, qualnames, tree=self.tree)
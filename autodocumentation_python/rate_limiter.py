@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import time
+import asyncio
+import threading
+
+
+class RateLimiter:
+    """
+    Limits the requests per minute and the (prompt) tokens per minute of all API calls with two
+    token buckets, which refill continuously and hold at most one minute of requests/tokens. The
+    state of the buckets can live in a `multiprocessing.Manager` (see `shared`), so several
+    processes (e.g. the repositories of a batch run) stay within the limits of one API key together.
+
+    Args:
+        rpm (float): Requests per minute (None or 0: not limited).
+        tpm (float, optional): Tokens per minute. Defaults to None (not limited).
+        state (dict, optional): The state of the buckets (a dict proxy for a shared limiter). Defaults to None.
+        lock (optional): The lock protecting the state (a lock proxy for a shared limiter). Defaults to None.
+    """
+    def __init__(self, rpm: float, tpm: float = None, state=None, lock=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state = state if state is not None else {}
+        self.lock = lock if lock is not None else threading.Lock()
+
+    @classmethod
+    def shared(cls, manager, rpm: float, tpm: float = None):
+        """
+        Creates a limiter whose state is kept by `manager` (a started `multiprocessing.Manager`). The
+        limiter can be passed to other processes.
+        """
+        return cls(rpm, tpm, state=manager.dict(), lock=manager.Lock())
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Takes one request and `tokens` tokens from the buckets if they are available.
+
+        Returns:
+            float: 0 if the request may be sent, otherwise the time [s] to wait before trying again.
+        """
+        tokens = min(tokens, self.tpm) if self.tpm else 0 #a request larger than the bucket waits for a full bucket
+        if not self.rpm and not self.tpm:
+            return 0.0
+        with self.lock:
+            now = time.time()
+            updated = self.state.get('updated', now)
+            requests = min(self.rpm, self.state.get('requests', self.rpm) + (now - updated) * self.rpm / 60) if self.rpm else 1
+            available = min(self.tpm, self.state.get('tokens', self.tpm) + (now - updated) * self.tpm / 60) if self.tpm else 0
+            if requests >= 1 and available >= tokens:
+                requests -= 1 if self.rpm else 0
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = max((1 - requests) * 60 / self.rpm if self.rpm else 0,
+                           (tokens - available) * 60 / self.tpm if self.tpm else 0, 0.01)
+            self.state.update({'updated': now, 'requests': requests, 'tokens': available})
+        return wait
+
+    def acquire(self, tokens: int = 0) -> None:
+        """
+        Blocks until a request with `tokens` tokens may be sent.
+        """
+        wait = self.reserve(tokens)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.reserve(tokens)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """
+        Asyncio version of `acquire`.
+        """
+        wait = self.reserve(tokens)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.reserve(tokens)
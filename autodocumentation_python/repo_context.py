@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import re
+import math
+import keyword
+import builtins
+from collections import Counter
+from autodocumentation_python.tokens import count_tokens, truncate_tokens
+
+TOP_K = 4 #number of passages attached to a request
+MAX_CONTEXT_TOKENS = 800 #max. tokens of the context attached to a request
+PASSAGE_TOKENS = 250 #max. tokens of a passage (longer sections are split between paragraphs)
+OVERVIEW_TOKENS = 250 #max. tokens of the overview (a longer first paragraph of the summary is shortened)
+PASSAGES_HEADER = 'relevant parts of the documentation:'
+SUMMARY_HEADER = 'info about repository:'
+
+RST_UNDERLINE = re.compile(r'^([=\-~^"\'*+#`:.])\1{2,}\s*$')
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+STOPWORDS = set(keyword.kwlist) | set(dir(builtins)) | {
+    'self', 'cls', 'args', 'kwargs', 'the', 'and', 'for', 'this', 'that', 'with', 'are', 'from', 'can',
+    'be', 'is', 'of', 'to', 'in', 'it', 'an', 'as', 'on', 'or', 'by', 'at', 'if', 'we', 'you', 'use',
+}
+
+
+def terms(text: str) -> list:
+    """
+    Splits a text (documentation or code) into lowercase search terms. Identifiers are kept as a
+    whole and additionally split into their parts (snake_case and CamelCase), so 'make_snippets'
+    also matches a section about 'snippets'. Python keywords, builtins and very common words are
+    dropped.
+    """
+    result = []
+    for word in IDENTIFIER.findall(text):
+        parts = [part for part in re.split(r'_+|(?<=[a-z0-9])(?=[A-Z])', word) if part]
+        for term in {word.lower()} | {part.lower() for part in parts}:
+            if len(term) > 2 and term not in STOPWORDS:
+                result.append(term)
+    return result
+
+
+def sections(text: str) -> list:
+    """
+    Splits a markdown or reStructuredText document into its sections.
+
+    Returns:
+        list: Tuples (heading, text) of the sections (the heading of the text before the first
+            heading is '').
+    """
+    result = []
+    heading = ''
+    lines = []
+    in_code_block = False #'#' starts a comment within a fenced code block, not a heading
+    text_lines = text.splitlines()
+    for i, line in enumerate(text_lines):
+        next_line = text_lines[i+1] if i + 1 < len(text_lines) else ''
+        if line.lstrip().startswith('```'):
+            in_code_block = not in_code_block
+            lines.append(line)
+        elif in_code_block:
+            lines.append(line)
+        elif line.startswith('#') or (line.strip() and RST_UNDERLINE.match(next_line) and not RST_UNDERLINE.match(line)):
+            result.append((heading, '\n'.join(lines).strip()))
+            heading, lines = line.strip('# ').strip(), []
+        elif RST_UNDERLINE.match(line):
+            continue
+        else:
+            lines.append(line)
+    result.append((heading, '\n'.join(lines).strip()))
+    return [(heading, body) for heading, body in result if body]
+
+
+def paragraphs_of(text: str) -> list:
+    """
+    Splits a text at empty lines.
+    """
+    return [paragraph.strip() for paragraph in re.split(r'\n\s*\n', text) if paragraph.strip()]
+
+
+def split_passages(text: str, max_tokens: int = PASSAGE_TOKENS) -> list:
+    """
+    Splits a text into passages of whole paragraphs with at most `max_tokens` tokens each (longer
+    paragraphs, e.g. long lists, are split between their lines).
+    """
+    paragraphs = []
+    for paragraph in paragraphs_of(text):
+        if count_tokens(paragraph) > max_tokens:
+            paragraphs += [line.strip() for line in paragraph.splitlines() if line.strip()]
+        else:
+            paragraphs.append(paragraph)
+
+    passages = []
+    current = []
+    current_tokens = 0
+    for paragraph in paragraphs:
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            passages.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        passages.append('\n\n'.join(current))
+    return passages
+
+
+class BM25Index:
+    """
+    Lexical search index (Okapi BM25) over a list of documents.
+
+    Args:
+        documents (list): The documents (lists of terms, see `terms`).
+        k1 (float, optional): Saturation of the term frequency. Defaults to 1.5.
+        b (float, optional): Normalization by the length of the documents. Defaults to 0.75.
+    """
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(documents) if documents else 0
+        document_frequencies = Counter(term for frequencies in self.frequencies for term in frequencies)
+        number = len(documents)
+        self.idf = {term: math.log(1 + (number - frequency + 0.5) / (frequency + 0.5))
+                    for term, frequency in document_frequencies.items()}
+
+    def search(self, query: list, k: int) -> list:
+        """
+        Returns the indices of the (at most) k best matching documents for the query terms (documents
+        without any matching term are left out).
+        """
+        query = set(term for term in query if term in self.idf)
+        scores = []
+        for i, frequencies in enumerate(self.frequencies):
+            score = 0
+            for term in query:
+                frequency = frequencies.get(term, 0)
+                if frequency:
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.average_length or 1))
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            if score > 0:
+                scores.append((score, i))
+        return [i for _, i in sorted(scores, key=lambda item: (-item[0], item[1]))[:k]]
+
+
+class RepoContext:
+    """
+    Selects the information about the repository which is attached to a request. Instead of the
+    whole summary of the repository, every request gets the first paragraph of the summary (an
+    overview) and the passages of the summary and of the .md/.rst files which are most relevant to
+    the code of the request (BM25 on the identifiers of the code).
+
+    Args:
+        doc_entries (list): The entries of the .md and .rst files (see `scan_repository`).
+        summary (str, optional): The summary of the repository (see `summarize_repo`). Defaults to None.
+        top_k (int, optional): The maximum number of passages per request. Defaults to TOP_K.
+        max_tokens (int, optional): The maximum number of tokens of the context. Defaults to MAX_CONTEXT_TOKENS.
+    """
+    def __init__(self, doc_entries: list, summary: str = None, top_k: int = TOP_K, max_tokens: int = MAX_CONTEXT_TOKENS):
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.overview = None
+        self.passages = [] #(source, text)
+        if summary:
+            paragraphs = paragraphs_of(summary.replace(SUMMARY_HEADER, '', 1))
+            if paragraphs:
+                self.overview = truncate_tokens(paragraphs[0], min(OVERVIEW_TOKENS, max_tokens // 2))
+                rest = paragraphs[1:] if self.overview == paragraphs[0] else paragraphs #a shortened overview is also searchable in full
+                self.passages += [('summary', passage) for passage in split_passages('\n\n'.join(rest))]
+        for entry in doc_entries:
+            for heading, text in sections(entry['content']):
+                source = f"{entry['rel_path']}: {heading}" if heading else entry['rel_path']
+                self.passages += [(source, passage) for passage in split_passages(text)]
+        self.index = BM25Index([terms(f'{source}\n{text}') for source, text in self.passages])
+
+    def for_code(self, code: str) -> str:
+        """
+        Builds the context for a request.
+
+        Args:
+            code (str): The code sent with the request.
+
+        Returns:
+            str: The overview and the most relevant passages with at most `max_tokens` tokens together
+                (None if there is no information about the repository).
+        """
+        parts = []
+        tokens = count_tokens(PASSAGES_HEADER) + 2 #the header of the passages and the separators
+        if self.overview:
+            parts.append(f'{SUMMARY_HEADER}\n{self.overview}')
+            tokens += count_tokens(parts[0])
+        passages = []
+        for i in self.index.search(terms(code), self.top_k):
+            source, text = self.passages[i]
+            passage = f'[{source}]\n{text}'
+            passage_tokens = count_tokens(passage) + 1
+            if tokens + passage_tokens > self.max_tokens:
+                continue
+            passages.append(passage)
+            tokens += passage_tokens
+        if passages:
+            parts.append(f'{PASSAGES_HEADER}\n' + '\n\n'.join(passages))
+        context = '\n\n'.join(parts) if parts else None
+        return truncate_tokens(context, self.max_tokens) if context else None #tokens of joined texts may differ slightly
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import time
+import random
+import asyncio
+import threading
+import email.utils
+import httpx
+
+RETRY_STATUS_CODES = {408, 409, 425, 429} #besides all 5xx errors
+FALLBACK_STATUS_CODES = {404} #e.g. the model is not available for the API key
+
+
+def status_code(err) -> int:
+    return getattr(err, 'status_code', None)
+
+
+def is_retryable(err) -> bool:
+    """
+    Returns True for errors which are worth another attempt: rate limits, server errors, timeouts
+    and broken connections.
+    """
+    if isinstance(err, httpx.TransportError): #includes all timeouts
+        return True
+    code = status_code(err)
+    return code is not None and (code in RETRY_STATUS_CODES or code >= 500)
+
+
+def can_fall_back(err) -> bool:
+    """
+    Returns True if another model may succeed where the model of the request failed.
+    """
+    return is_retryable(err) or status_code(err) in FALLBACK_STATUS_CODES
+
+
+def parse_retry_after(headers) -> float:
+    """
+    Reads the waiting time requested by the server from the 'retry-after-ms' or 'retry-after'
+    header (seconds or HTTP date).
+
+    Returns:
+        float: The waiting time [s] or None.
+    """
+    if headers is None:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Shared by all requests of the client (all worker threads and asyncio tasks). After `threshold`
+    failed requests in a row the endpoint is considered to be failing and the circuit opens: every
+    new request waits until `cooldown` seconds have passed, so the workers pause instead of
+    hammering the API. Then requests are let through again; a success closes the circuit, another
+    failure opens it again with a doubled cooldown (up to `max_cooldown`).
+
+    Args:
+        threshold (int, optional): Failures in a row which open the circuit. Defaults to 5.
+        cooldown (float, optional): First pause [s]. Defaults to 30.
+        max_cooldown (float, optional): Longest pause [s]. Defaults to 300.
+    """
+    def __init__(self, threshold: int = 5, cooldown: float = 30, max_cooldown: float = 300):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """
+        Returns how long [s] requests still have to wait (0 if the circuit is closed).
+        """
+        with self.lock:
+            return max(0.0, self.open_until - time.monotonic())
+
+    def wait(self) -> None:
+        while self.remaining() > 0:
+            time.sleep(self.remaining())
+
+    async def await_(self) -> None:
+        while self.remaining() > 0:
+            await asyncio.sleep(self.remaining())
+
+    def success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.threshold or self.open_until > time.monotonic():
+                return
+            self.open_until = time.monotonic() + self.cooldown
+            print(f'    The API failed {self.failures} times in a row, all requests are paused for {self.cooldown:g}s.')
+            self.cooldown = min(2 * self.cooldown, self.max_cooldown)
+
+
+class RetryPolicy:
+    """
+    Retries failed requests with exponential backoff and full jitter (a random waiting time up to
+    `base_delay * 2**attempt`, at most `max_delay`), so workers which failed at the same moment do
+    not retry at the same moment. A waiting time requested by the server (Retry-After) is honoured.
+    Only retryable errors (see `is_retryable`) are retried and counted by the circuit breaker.
+
+    Args:
+        retries (int, optional): The number of retries after the first attempt. Defaults to 6.
+        base_delay (float, optional): Base of the waiting time [s]. Defaults to 1.
+        max_delay (float, optional): Longest waiting time [s] (unless requested by the server). Defaults to 60.
+    """
+    def __init__(self, retries: int = 6, base_delay: float = 1, max_delay: float = 60):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, err) -> float:
+        """
+        Returns the waiting time [s] before the next attempt.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = getattr(err, 'retry_after', None)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def call(self, request, breaker: CircuitBreaker):
+        """
+        Calls `request()` until it succeeds or the retries are used up.
+
+        Returns:
+            The result of `request`.
+
+        Raises:
+            Exception: The last error (or the first one which is not retryable).
+        """
+        for attempt in range(self.retries + 1):
+            breaker.wait()
+            try:
+                result = request()
+            except Exception as err:
+                if not is_retryable(err):
+                    raise
+                breaker.failure()
+                if attempt == self.retries:
+                    raise
+                delay = self.delay(attempt, err)
+                print(f'    Request failed ({describe(err)}), retry {attempt+1}/{self.retries} in {delay:.1f}s ...')
+                time.sleep(delay)
+            else:
+                breaker.success()
+                return result
+
+    async def acall(self, request, breaker: CircuitBreaker):
+        """
+        Asyncio version of `call` (`request()` returns an awaitable).
+        """
+        for attempt in range(self.retries + 1):
+            await breaker.await_()
+            try:
+                result = await request()
+            except Exception as err:
+                if not is_retryable(err):
+                    raise
+                breaker.failure()
+                if attempt == self.retries:
+                    raise
+                delay = self.delay(attempt, err)
+                print(f'    Request failed ({describe(err)}), retry {attempt+1}/{self.retries} in {delay:.1f}s ...')
+                await asyncio.sleep(delay)
+            else:
+                breaker.success()
+                return result
+
+
+def describe(err) -> str:
+    """
+    Returns a short description of an error for the console output.
+    """
+    code = status_code(err)
+    if code is not None:
+        return f'status {code}'
+    return f'{type(err).__name__}: {err}' if str(err) else type(err).__name__
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "autodoc")
+
+
+def write_file_atomic(path: str, text: str) -> None:
+    """
+    Writes a text file. The text is first written to a temporary file which then replaces the
+    destination, so that concurrent readers (or a crash) never see a half written file. The
+    permissions of an existing file are kept.
+
+    Args:
+        path (str): Destination of the file.
+        text (str): The content of the file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(text)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(path: str, data) -> None:
+    """
+    Writes data as json file (atomically, see `write_file_atomic`).
+    """
+    write_file_atomic(path, json.dumps(data))
+
+
+class ResponseCache:
+    """
+    Persistent cache of chat completions responses. Each response is stored as json file named by
+    the sha256 hash of model, messages and temperature, so identical requests of later runs (e.g. a
+    rerun after a crash) are answered from disk instead of the API. Entries older than `max_age_days`
+    (since they were stored: the modification time of the file) are evicted, and if the cache is
+    larger than `max_mb` the least recently used entries (access time, set by every hit) are removed.
+
+    Args:
+        directory (str, optional): Directory of the cache. Defaults to ~/.cache/autodoc.
+        max_mb (float, optional): Maximum size of the cache [MB]. Defaults to 500.
+        max_age_days (float, optional): Maximum age of an entry [days]. Defaults to 30.
+        refresh (bool, optional): If True, existing entries are ignored (but overwritten with the
+            new responses). Defaults to False.
+    """
+    def __init__(self, directory: str = None, max_mb: float = 500, max_age_days: float = 30, refresh: bool = False):
+        self.directory = os.path.join(directory or DEFAULT_CACHE_DIR, 'responses')
+        self.max_bytes = max_mb * 1024**2
+        self.max_age = max_age_days * 24 * 3600
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, messages: list, temperature: float) -> str:
+        """
+        Returns the hash identifying a request.
+        """
+        request = json.dumps({"model": model, "messages": messages, "temperature": temperature}, sort_keys=True)
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key: str):
+        """
+        Returns the cached response for the key or None (cache miss).
+        """
+        path = self.path(key)
+        response = None
+        if not self.refresh and os.path.isfile(path):
+            if time.time() - os.path.getmtime(path) <= self.max_age:
+                try:
+                    with open(path, "r") as file:
+                        response = json.load(file)
+                    os.utime(path, (time.time(), os.path.getmtime(path))) #mark as recently used (the mtime stays the time it was stored)
+                except (OSError, ValueError):
+                    response = None
+        with self.lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, key: str, response: dict) -> None:
+        write_json_atomic(self.path(key), response)
+
+    def evict(self) -> int:
+        """
+        Removes entries which are too old and, if the cache is still too large, the least recently
+        used entries.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_atime, stat.st_size, path))
+
+        removed = 0
+        now = time.time()
+        total_size = 0
+        kept = []
+        for mtime, atime, size, path in entries:
+            if now - mtime > self.max_age:
+                removed += self._remove(path)
+            else:
+                kept.append((max(atime, mtime), size, path))
+                total_size += size
+        for last_used, size, path in sorted(kept): #least recently used first
+            if total_size <= self.max_bytes:
+                break
+            removed += self._remove(path)
+            total_size -= size
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = f' ({100 * self.hits / total:.0f}% hits)' if total else ''
+        return f'{self.hits} hits, {self.misses} misses{rate}'
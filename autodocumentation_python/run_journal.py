@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import json
+import hashlib
+import threading
+
+JOURNAL_NAME = '.autodoc_journal.jsonl' #stored in the work directory, next to (not in) the 'edited_repository' folder
+
+
+class RunJournal:
+    """
+    Journal of a run, so that a run which died (network error, Ctrl-C, out of memory) can be resumed
+    (`--resume`) without losing the work done so far. Every step is appended as one json line and
+    flushed to disk at once:
+    - 'summary': the summary of the repository,
+    - 'generated': the answer of the model to a request for a file (whole file, snippet or batch),
+    - 'compared': the result of the comparison of an old and a new docstring,
+    - 'inserted': the docstrings of a file have been inserted (the file is done).
+    Answers and comparisons are identified by a hash of everything that was sent (see `key`), so
+    they are only replayed for the very same request. A line which was cut off by a crash is ignored.
+    The journal holds the raw answers of the model, so it is deleted once the run is finished (see `remove`).
+
+    Args:
+        path (str): Path of the journal file.
+        resume (bool, optional): If True, the existing journal is loaded and continued, otherwise a
+            new journal is started. Defaults to False.
+    """
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.summary = None
+        self.answers = {} #(relative path, key) -> answer
+        self.comparisons = {} #(relative path, key) -> docstring
+        self.inserted = set() #relative paths
+        if resume and os.path.isfile(path):
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        self.load(json.loads(line))
+                    except ValueError:
+                        continue
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    def load(self, entry: dict) -> None:
+        event, rel_path = entry.get('event'), entry.get('file')
+        if event == 'summary':
+            self.summary = entry['summary']
+        elif event == 'generated':
+            self.answers[(rel_path, entry['key'])] = entry['answer']
+        elif event == 'compared':
+            self.comparisons[(rel_path, entry['key'])] = entry['docstring']
+        elif event == 'inserted':
+            self.inserted.add(rel_path)
+
+    @staticmethod
+    def key(*parts) -> str:
+        """
+        Returns the hash identifying a request (e.g. model, messages and temperature).
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def record(self, event: str, rel_path: str = None, **data) -> None:
+        """
+        Appends an entry to the journal (flushed to disk before returning).
+        """
+        entry = {'event': event, 'file': rel_path, **data}
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            self.load(entry)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def remove(self) -> None:
+        """
+        Deletes the journal file (the run is finished, there is nothing left to resume).
+        """
+        with self.lock:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def is_inserted(self, rel_path: str) -> bool:
+        return rel_path in self.inserted
+
+    def for_file(self, rel_path: str):
+        """
+        Returns the view of the journal for one file (passed to the stages which document it).
+        """
+        return FileJournal(self, rel_path)
+
+
+class FileJournal:
+    """
+    The part of a `RunJournal` which belongs to one file.
+    """
+    def __init__(self, journal: RunJournal, rel_path: str):
+        self.journal = journal
+        self.rel_path = rel_path
+        self.key = journal.key
+
+    def answer(self, key: str) -> str:
+        """
+        Returns the answer to the request identified by `key` if it was generated before, else None.
+        """
+        return self.journal.answers.get((self.rel_path, key))
+
+    def generated(self, key: str, answer: str, part: str = None) -> None:
+        self.journal.record('generated', self.rel_path, key=key, part=part, answer=answer)
+
+    def comparison(self, key: str) -> str:
+        """
+        Returns the result of the comparison identified by `key` if it was done before, else None.
+        """
+        return self.journal.comparisons.get((self.rel_path, key))
+
+    def compared(self, key: str, docstring: str, node: str = None) -> None:
+        self.journal.record('compared', self.rel_path, key=key, node=node, docstring=docstring)
+
+    def inserted(self) -> None:
+        self.journal.record('inserted', self.rel_path)
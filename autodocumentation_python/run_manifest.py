@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import ast
+import copy
+import json
+import hashlib
+import threading
+from autodocumentation_python.response_cache import DEFAULT_CACHE_DIR, write_json_atomic
+from autodocumentation_python.parsed_source import ParsedSource
+
+
+def strip_docstrings(tree):
+    """
+    Removes the docstrings of all modules, classes and functions of an abstract syntax tree (in
+    place), so that the hash of the code does not change if only docstrings are inserted.
+
+    Args:
+        tree (ast.AST): The tree (or node) to be stripped.
+
+    Returns:
+        ast.AST: The stripped tree.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            if ast.get_docstring(node, clean=False) is not None:
+                node.body = node.body[1:] or [ast.Pass()]
+    return tree
+
+
+def hash_node(node) -> str:
+    """
+    Hashes the code of a class or function without its docstrings (and without line numbers, so
+    moving a node does not change its hash). The hash of a class only covers the class itself
+    (bases, decorators, class variables, ...) and not the code of its methods, which are hashed
+    separately.
+
+    Args:
+        node (ast.AST): A class- or function-node.
+
+    Returns:
+        str: The sha256 hash of the node.
+    """
+    node = strip_docstrings(copy.deepcopy(node))
+    if isinstance(node, ast.ClassDef):
+        node.body = [ast.Name(id=child.name) if isinstance(child, (ast.ClassDef, ast.FunctionDef)) else child
+                     for child in node.body]
+    return hashlib.sha256(ast.dump(node).encode('utf-8')).hexdigest()
+
+
+def hash_code(tree) -> str:
+    """
+    Hashes the code of a file (its parsed tree) without its docstrings.
+    """
+    tree = strip_docstrings(copy.deepcopy(tree))
+    return hashlib.sha256(ast.dump(tree).encode('utf-8')).hexdigest()
+
+
+def manifest_path(source_path: str, cache_dir: str = None) -> str:
+    """
+    Returns the path of the manifest of a source (stored in the 'manifests' folder of the cache
+    directory, since the 'edited_repository' folder is deleted by every run).
+
+    Args:
+        source_path (str): The URL/path given by the user.
+        cache_dir (str, optional): The cache directory ('cache_dir' of the config file). Defaults to None
+            (~/.cache/autodoc).
+    """
+    if os.path.exists(source_path):
+        source_path = os.path.abspath(source_path)
+    name = hashlib.sha256(source_path.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, 'manifests', f'{name}.json')
+
+
+class RunManifest:
+    """
+    Records for every file of a source the hash of the code and for every class/function its hash,
+    its docstring before the run and the docstring produced by autodoc. In incremental mode the
+    manifest of the last run is used to only send new or modified nodes to the model.
+
+    The manifest is a json file of the form
+    {"files": {relative_path: {"hash": ..., "nodes": {qualname: {"hash": ..., "source_docstring": ...,
+    "docstring": ...}}}}}.
+
+    Args:
+        path (str): Path of the json file (see `manifest_path`).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.files = {}
+        if os.path.isfile(path):
+            with open(path, "r") as file:
+                self.files = json.load(file).get('files', {})
+
+    def plan(self, rel_path: str, source: ParsedSource):
+        """
+        Compares the code of a file to the last run.
+
+        Args:
+            rel_path (str): Path of the file relative to the repository.
+            source (ParsedSource): The current code of the file.
+
+        Returns:
+            tuple: The qualified names of the nodes which are new or modified (code changed or
+                docstring edited by the user) and a dict of the unchanged nodes whose docstring of
+                the last run is not present in the code (qualified name -> docstring), which can be
+                reinserted without asking the model.
+        """
+        with self.lock:
+            entry = self.files.get(rel_path, {'hash': None, 'nodes': {}})
+        changed = []
+        reuse = {}
+        for qualname, node in source.definitions.items():
+            old = entry['nodes'].get(qualname)
+            docstring = ast.get_docstring(node)
+            if old is None or old['hash'] != hash_node(node):
+                changed.append(qualname)
+            elif docstring not in (old['docstring'], old['source_docstring']):
+                changed.append(qualname) #docstring was edited by hand since the last run
+            elif old['docstring'] is None:
+                changed.append(qualname) #no docstring could be generated in the last run
+            elif docstring != old['docstring']:
+                reuse[qualname] = old['docstring']
+        return changed, reuse
+
+    def record(self, rel_path: str, source_before: ParsedSource, source_after: ParsedSource) -> None:
+        """
+        Records a file after the docstrings were inserted.
+
+        Args:
+            rel_path (str): Path of the file relative to the repository.
+            source_before (ParsedSource): The code before the docstrings were inserted.
+            source_after (ParsedSource): The code after the docstrings were inserted.
+        """
+        nodes_before = source_before.definitions
+        nodes = {}
+        for qualname, node in source_after.definitions.items():
+            node_before = nodes_before.get(qualname)
+            nodes[qualname] = {
+                'hash': hash_node(node),
+                'source_docstring': ast.get_docstring(node_before) if node_before is not None else None,
+                'docstring': ast.get_docstring(node),
+            }
+        with self.lock:
+            self.files[rel_path] = {'hash': hash_code(source_after.tree), 'nodes': nodes}
+
+    def save(self) -> None:
+        with self.lock:
+            write_json_atomic(self.path, {'files': self.files})
+
+
+def docstring_skeleton(docstrings: dict) -> str:
+    """
+    Builds a string of class/function definitions with docstrings (the format of the gpt output
+    which is read by `insert_docstrings`) from stored docstrings.
+
+    Args:
+        docstrings (dict): Qualified names mapped to docstrings (in the order of the code).
+
+    Returns:
+        str: The definitions with docstrings. All nodes are written as 'def name():' since only
+            names and nesting are used for the insertion. Enclosing classes/functions are defined as
+            well (with an empty body if they have no stored docstring).
+    """
+    lines = []
+    defined = set()
+    for qualname in docstrings:
+        parts = qualname.split('.')
+        for depth in range(len(parts)):
+            name = '.'.join(parts[:depth+1])
+            if name in defined:
+                continue
+            defined.add(name)
+            indent = '    ' * depth
+            lines.append(f'{indent}def {parts[depth]}():')
+            if name in docstrings:
+                lines.append(f'{indent}    """')
+                docstring = docstrings[name].replace('"""', '\\"\\"\\"')
+                lines.extend(f'{indent}    {line}' if line else '' for line in docstring.split('\n'))
+                lines.append(f'{indent}    """')
+            else:
+                lines.append(f'{indent}    pass')
+    return '\n'.join(lines) + '\n'
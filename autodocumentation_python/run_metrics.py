@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import re
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from autodocumentation_python.response_cache import write_file_atomic, write_json_atomic
+
+STAGES = ('clone', 'estimate', 'summarize', 'snippet', 'generate', 'compare', 'insert')
+OTHER_STAGE = 'other' #requests outside of all stages
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300) #upper bounds [s] of the latency histograms
+
+_stage = contextvars.ContextVar('autodoc_stage', default=None) #stage of the current thread/task
+
+
+class RunMetrics:
+    """
+    Collects the metrics of a run per stage (see STAGES): the wall time of the stage (time in which
+    at least one thread was in the stage; nested stages are included, e.g. the insertion of streamed
+    docstrings in 'generate') and its busy time (summed over the threads), and for the API requests
+    of the stage their number and status, latencies, prompt/completion tokens (from the `usage` of
+    the responses; counted locally if a response has none, e.g. a streamed one) and cache hits. Every
+    attempt of a request (also a retried or failed one) is recorded. The metrics are thread safe.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.intervals = {} #stage -> [(start, end)] (perf_counter)
+        self.requests = {} #(stage, model) -> counters
+        self.latencies = {} #stage -> [latency of each answered request]
+
+    def add_interval(self, stage: str, start: float, end: float) -> None:
+        with self.lock:
+            self.intervals.setdefault(stage, []).append((start, end))
+
+    def record_request(self, model: str, seconds: float = None, status: str = 'ok', usage: dict = None,
+                       cached: bool = False, counted: bool = False) -> None:
+        """
+        Records one request (attempt) in the current stage.
+
+        Args:
+            model (str): The model the request was sent to.
+            seconds (float, optional): The latency (until the answer was complete). Defaults to None.
+            status (str, optional): 'ok' or the error (HTTP status code or name of the exception). Defaults to 'ok'.
+            usage (dict, optional): 'prompt_tokens' and 'completion_tokens' of the answer. Defaults to None.
+            cached (bool, optional): True if the answer came from the response cache (no request). Defaults to False.
+            counted (bool, optional): True if the tokens were counted locally. Defaults to False.
+        """
+        stage = _stage.get() or OTHER_STAGE
+        with self.lock:
+            counters = self.requests.setdefault((stage, model), {'requests': 0, 'errors': 0, 'statuses': {}, 'cache_hits': 0,
+                                                                 'prompt_tokens': 0, 'completion_tokens': 0, 'counted_tokens': 0})
+            if cached:
+                counters['cache_hits'] += 1
+                return
+            counters['requests'] += 1
+            counters['statuses'][status] = counters['statuses'].get(status, 0) + 1
+            if status != 'ok':
+                counters['errors'] += 1
+            if usage:
+                counters['prompt_tokens'] += usage.get('prompt_tokens') or 0
+                counters['completion_tokens'] += usage.get('completion_tokens') or 0
+                counters['counted_tokens'] += int(counted)
+            if seconds is not None and status == 'ok':
+                self.latencies.setdefault(stage, []).append(seconds)
+
+    def report(self, prices: dict = None, labels: dict = None) -> dict:
+        """
+        Sums up the metrics per stage and model.
+
+        Args:
+            prices (dict, optional): The price table [$ per 1000 tokens] (see `cost_estimator.load_prices`).
+                Defaults to None (no costs).
+            labels (dict, optional): Additional information about the run (e.g. the source). Defaults to None.
+
+        Returns:
+            dict: 'started', 'duration' [s], 'labels', 'stages' (stage -> 'wall_time', 'busy_time', counters,
+                'cost' [$] and 'latency' (count, sum, mean, p50, p95, max and the cumulative histogram 'buckets')),
+                'models' (model -> counters and 'cost'), 'totals' and 'unknown_models' (models without price).
+        """
+        prices = prices or {}
+        with self.lock:
+            intervals = {stage: list(spans) for stage, spans in self.intervals.items()}
+            requests = {key: dict(counters, statuses=dict(counters['statuses'])) for key, counters in self.requests.items()}
+            latencies = {stage: sorted(values) for stage, values in self.latencies.items()}
+
+        def empty():
+            return {'requests': 0, 'errors': 0, 'statuses': {}, 'cache_hits': 0, 'prompt_tokens': 0,
+                    'completion_tokens': 0, 'counted_tokens': 0, 'cost': 0.0}
+
+        def add(total, counters, cost):
+            for name, value in counters.items():
+                if name == 'statuses':
+                    for status, number in value.items():
+                        total['statuses'][status] = total['statuses'].get(status, 0) + number
+                else:
+                    total[name] += value
+            total['cost'] += cost or 0
+
+        used = {stage for stage, _ in requests} | set(intervals)
+        stages = {stage: {'wall_time': round(wall_time(intervals.get(stage, [])), 3),
+                          'busy_time': round(sum(end - start for start, end in intervals.get(stage, [])), 3),
+                          **empty(), 'latency': latency_summary(latencies.get(stage, []))}
+                  for stage in list(STAGES) + sorted(used - set(STAGES))}
+        models = {}
+        totals = empty()
+        unknown = set()
+        for (stage, model), counters in sorted(requests.items()):
+            cost = None
+            if model in prices:
+                cost = (counters['prompt_tokens'] * prices[model]['input']
+                        + counters['completion_tokens'] * prices[model]['output']) / 1000
+            elif counters['requests']:
+                unknown.add(model)
+            add(stages[stage], counters, cost)
+            add(models.setdefault(model, empty()), counters, cost)
+            add(totals, counters, cost)
+        for record in list(stages.values()) + list(models.values()) + [totals]:
+            record['cost'] = round(record['cost'], 4)
+        return {'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+                'duration': round(time.time() - self.started, 3), 'labels': labels or {},
+                'stages': stages, 'models': models, 'totals': totals, 'unknown_models': sorted(unknown)}
+
+    def write(self, path: str = None, prometheus_path: str = None, prices: dict = None, labels: dict = None) -> dict:
+        """
+        Writes the report (see `report`) as json file and/or as textfile for the Prometheus node
+        exporter (see `prometheus_text`).
+
+        Returns:
+            dict: The report.
+        """
+        report = self.report(prices, labels)
+        if path:
+            write_json_atomic(path, report)
+        if prometheus_path:
+            write_file_atomic(prometheus_path, prometheus_text(report))
+        return report
+
+
+def wall_time(intervals: list) -> float:
+    """
+    Returns the length of the union of time intervals ([(start, end)]).
+    """
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def latency_summary(latencies: list) -> dict:
+    """
+    Summarizes sorted latencies [s]: count, sum, mean, p50, p95, max and the cumulative histogram
+    (upper bound of the bucket -> number of requests, see LATENCY_BUCKETS).
+    """
+    def percentile(share):
+        return round(latencies[min(len(latencies) - 1, int(share * len(latencies)))], 3) if latencies else None
+
+    buckets = {f'{bound:g}': sum(latency <= bound for latency in latencies) for bound in LATENCY_BUCKETS}
+    buckets['+Inf'] = len(latencies)
+    return {'count': len(latencies), 'sum': round(sum(latencies), 3),
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1), 'buckets': buckets}
+
+
+def prometheus_text(report: dict) -> str:
+    """
+    Formats a report (see `RunMetrics.report`) in the Prometheus text format (e.g. for the textfile
+    collector of the node exporter). The labels of the report are added to every sample.
+    """
+    def labels(**values):
+        values = {**report['labels'], **values}
+        text = ','.join(re.sub(r'[^a-zA-Z0-9_]', '_', name) + '="'
+                        + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                        for name, value in values.items())
+        return '{' + text + '}' if text else ''
+
+    lines = []
+    def metric(name, kind, description, samples):
+        lines.append(f'# HELP autodoc_{name} {description}')
+        lines.append(f'# TYPE autodoc_{name} {kind}')
+        for suffix, sample_labels, value in samples:
+            lines.append(f'autodoc_{name}{suffix}{labels(**sample_labels)} {value:g}')
+
+    stages = report['stages']
+    metric('run_duration_seconds', 'gauge', 'Duration of the run.', [('', {}, report['duration'])])
+    metric('run_cost_dollars', 'gauge', 'Cost of the requests of the run (models with a known price).',
+           [('', {}, report['totals']['cost'])])
+    metric('stage_wall_seconds', 'gauge', 'Wall time of a stage.',
+           [('', {'stage': stage}, record['wall_time']) for stage, record in stages.items()])
+    metric('stage_busy_seconds', 'gauge', 'Time of a stage summed over all threads.',
+           [('', {'stage': stage}, record['busy_time']) for stage, record in stages.items()])
+    metric('requests_total', 'counter', 'Requests (attempts) sent to the API.',
+           [('', {'stage': stage, 'status': status}, number) for stage, record in stages.items()
+            for status, number in sorted(record['statuses'].items())])
+    metric('cache_hits_total', 'counter', 'Requests answered by the response cache.',
+           [('', {'stage': stage}, record['cache_hits']) for stage, record in stages.items()])
+    metric('tokens_total', 'counter', 'Prompt and completion tokens of the answered requests.',
+           [('', {'stage': stage, 'kind': kind}, record[f'{kind}_tokens']) for stage, record in stages.items()
+            for kind in ('prompt', 'completion')])
+    metric('cost_dollars', 'gauge', 'Cost of the requests of a stage.',
+           [('', {'stage': stage}, record['cost']) for stage, record in stages.items()])
+    metric('request_latency_seconds', 'histogram', 'Latency of the answered requests.',
+           [('_bucket', {'stage': stage, 'le': bound}, number) for stage, record in stages.items()
+            for bound, number in record['latency']['buckets'].items()]
+           + [(suffix, {'stage': stage}, record['latency'][key]) for stage, record in stages.items()
+              for suffix, key in (('_sum', 'sum'), ('_count', 'count'))])
+    return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+
+
+def configure_metrics(metrics: RunMetrics = None) -> RunMetrics:
+    """
+    Sets the metrics which record all stages and requests of the process (None: nothing is recorded).
+    """
+    global _metrics
+    _metrics = metrics
+    return metrics
+
+
+def get_metrics() -> RunMetrics:
+    """
+    Returns the metrics set by `configure_metrics` (or None).
+    """
+    return _metrics
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Context manager (or decorator) which assigns the time and the requests of the enclosed code to
+    a stage. The stage is set per thread/asyncio task (threads of a pool have to set it themselves).
+    """
+    token = _stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        if _metrics is not None:
+            _metrics.add_interval(name, start, time.perf_counter())
+
+
+def record_request(model: str, **kwargs) -> None:
+    """
+    Records a request in the metrics of the process, if any (see `RunMetrics.record_request`).
+    """
+    if _metrics is not None:
+        _metrics.record_request(model, **kwargs)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import re
+import hashlib
+from autodocumentation_python.tokens import count_tokens
+from autodocumentation_python.parsed_source import ParsedSource
+
+SCANNED_TYPES = (".py", ".md", ".rst")
+EXCLUDED_DIRS = ('gpt_output', '.git')
+
+
+def parse_source(content: str, file_path: str):
+    """
+    Parses the code of a .py file (None if the code is not valid python).
+    """
+    try:
+        return ParsedSource(content, file_path)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def scan_file(file_path: str, directory: str) -> dict:
+    """
+    Reads a file once and collects everything the stages of autodoc need to know about it.
+
+    Args:
+        file_path (str): The path to the file.
+        directory (str): The root directory of the repository.
+
+    Returns:
+        dict: The entry of the file with the keys 'path', 'rel_path', 'size' [bytes], 'mtime',
+            'sha256', 'content', 'lines' (all lines), 'code_lines' (non-empty lines), 'words',
+            'tokens' (cl100k_base), 'source' (the parsed code of .py files, see `ParsedSource`; None
+            for other files and invalid code) and 'has_defs' (only True for .py files with
+            classes/functions or invalid code, which is handed to the pipeline to report the error).
+            None if the file is not valid UTF-8 (its text could not be written back unchanged).
+    """
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as file:
+        data = file.read()
+    try:
+        content = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    source = parse_source(content, file_path) if file_path.endswith('.py') else None
+    return {
+        'path': file_path,
+        'rel_path': os.path.relpath(file_path, directory),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'content': content,
+        'lines': len(content.splitlines()),
+        'code_lines': sum(1 for line in content.splitlines() if line.strip() != ""),
+        'words': len(re.findall(r'\w+', content)),
+        'tokens': count_tokens(content),
+        'source': source,
+        'has_defs': file_path.endswith('.py') and (source is None or source.has_definitions),
+    }
+
+
+def scan_repository(directory: str) -> dict:
+    """
+    Walks the repository once and builds the manifest of all .py, .md and .rst files, which is
+    shared by all stages (cost estimation, summary of the repository, docstring generation), so that
+    the file system is not walked and read again by every stage. The folders 'gpt_output' and '.git'
+    are excluded. Files which are not valid UTF-8 are reported and left out, so they are never edited.
+
+    Args:
+        directory (str): The root directory of the repository.
+
+    Returns:
+        dict: The relative paths of the files mapped to their entries (see `scan_file`), sorted by path.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        for file in files:
+            if file.endswith(SCANNED_TYPES):
+                entry = scan_file(os.path.join(root, file), directory)
+                if entry is None:
+                    print(f'    {os.path.relpath(os.path.join(root, file), directory)} is not valid UTF-8 and will be skipped.')
+                    continue
+                manifest[entry['rel_path']] = entry
+    return dict(sorted(manifest.items()))
+
+
+def python_files(manifest: dict) -> list:
+    """
+    Returns the entries of all .py files of a manifest.
+    """
+    return [entry for entry in manifest.values() if entry['path'].endswith('.py')]
+
+
+def doc_files(manifest: dict) -> list:
+    """
+    Returns the entries of all .md and .rst files of a manifest.
+    """
+    return [entry for entry in manifest.values() if entry['path'].endswith((".md", ".rst"))]
@@ -6,7 +6,6 @@
 # Authors: Karl Heggenberger, Joergen Kornfeld
 
 import ast
-import astunparse
 import os
 
 
@@ -51,7 +50,7 @@ def node_info(node):
     if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
         if isinstance(node, ast.FunctionDef):
             name = "def " + node.name
-            args = f"({astunparse.unparse(node.args).strip()})"
+            args = f"({ast.unparse(node.args)})"
         if isinstance(node, ast.ClassDef):
             name = "class " + node.name
             args = []
@@ -72,7 +71,7 @@ def node_info(node):
         return node_snippet
 
 
-def code_info(file_path):
+def code_info(file_path, code=None, tree=None):
     """
     Extracts the class and function definitions from a Python file and returns them as a string. 
     It reads the file, parses the code into an abstract syntax tree, and visits each node in the 
@@ -80,14 +79,18 @@ def code_info(file_path):
     
     Args:
         file_path (str): The path to the Python file.
+        code (str, optional): The code of the file, if already read. Defaults to None (the file is read).
+        tree (ast.AST, optional): The parsed code, if already parsed (see `ParsedSource`). Defaults to None.
     
     Returns:
         str: A string containing the class and function definitions from the Python file.
     """
-    with open(file_path, "r") as file:
-        code = file.read()
-
-    parsed_code = ast.parse(code)
+    if tree is None:
+        if code is None:
+            with open(file_path, "r") as file:
+                code = file.read()
+        tree = ast.parse(code)
+    parsed_code = tree
     
     info = ''
 
@@ -105,8 +108,9 @@ def code_info(file_path):
             children.
         """
         nonlocal info
-        if node_info(node) is not None:  #only for class- and funct-nodes
-            info += node_info(node)
+        info_node = node_info(node)
+        if info_node is not None:  #only for class- and funct-nodes
+            info += info_node
             for children in node.body:
                 visit_node(children)
             return info
@@ -116,6 +120,113 @@ def code_info(file_path):
     
     return info
 
+def definitions(tree):
+    """
+    Collects all class and function definitions of an abstract syntax tree by their qualified name
+    (names of the enclosing classes/functions and the name of the node joined by '.', e.g.
+    'Class.method.inner'). If a qualified name occurs more than once, the first definition is kept.
+
+    Args:
+        tree (ast.AST): The parsed code.
+
+    Returns:
+        dict: Qualified names mapped to the class- and function-nodes (in the order of the code).
+    """
+    nodes = {}
+
+    def visit(node, parents):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef)):
+                qualname = '.'.join(parents + [child.name])
+                nodes.setdefault(qualname, child)
+                visit(child, parents + [child.name])
+            else:
+                visit(child, parents)
+
+    visit(tree, [])
+    return nodes
+
+
+def node_start(node):
+    """
+    Returns the first line of a statement node including its decorators.
+    """
+    decorators = getattr(node, 'decorator_list', [])
+    return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+
+def code_of_nodes(code, qualnames, tree=None):
+    """
+    Extracts the code of some classes/functions of a file, e.g. to generate docstrings only for
+    these nodes. The definition lines of enclosing classes are kept (once), so that the nesting and
+    the indentation of the extracted nodes are the same as in the original code. Classes/functions
+    within an extracted node which are not extracted themselves are reduced to their definition
+    lines and their docstring (or '...'), so only the code of the requested nodes is sent in full.
+
+    Args:
+        code (str): The code of the file.
+        qualnames (list): Qualified names (see `definitions`) of the nodes to be extracted.
+        tree (ast.AST, optional): The parsed code, if already parsed. Defaults to None.
+
+    Returns:
+        str: The extracted code (valid python code).
+    """
+    lines = code.splitlines(keepends=True)
+    nodes = definitions(tree if tree is not None else ast.parse(code))
+    targets = set(qualnames)
+    children = {} #qualified name -> direct child nodes (qualified name, node) in the order of the code
+    for qualname, node in nodes.items():
+        children.setdefault(qualname.rpartition('.')[0], []).append((qualname, node))
+
+    def contains_target(qualname):
+        return any(target.startswith(qualname + '.') for target in targets)
+
+    def header_end(node):
+        #last line of the definition (without the docstring)
+        return max(node.lineno, node_start(node.body[0]) - 1)
+
+    def render(qualname, node):
+        #the lines of a node, nested nodes which are not extracted are reduced to definition and docstring
+        out = []
+        line = node_start(node) #next line to be copied
+        for child_qualname, child in children.get(qualname, []):
+            start = node_start(child)
+            if start < line or child.end_lineno > node.end_lineno:
+                continue
+            out.extend(lines[line-1 : start-1])
+            if child_qualname in targets or contains_target(child_qualname) or child.body[0].lineno == child.lineno:
+                out.extend(render(child_qualname, child))
+            else:
+                docstring = child.body[0]
+                if ast.get_docstring(child) is not None:
+                    out.extend(lines[start-1 : docstring.end_lineno])
+                else:
+                    out.extend(lines[start-1 : header_end(child)])
+                    out.append(' ' * docstring.col_offset + '...\n')
+            line = child.end_lineno + 1
+        out.extend(lines[line-1 : node.end_lineno])
+        return out
+
+    extracted = []
+    emitted_headers = set()
+    covered_until = 0 #last line of the last extracted node
+    for qualname in [qualname for qualname in nodes if qualname in targets]: #order of the code
+        node = nodes[qualname]
+        if node.end_lineno <= covered_until:
+            continue #already part of an extracted node
+        parts = qualname.split('.')
+        for i in range(1, len(parts)):
+            parent_qualname = '.'.join(parts[:i])
+            parent = nodes.get(parent_qualname)
+            if parent is None or parent_qualname in emitted_headers:
+                continue
+            emitted_headers.add(parent_qualname)
+            extracted.extend(lines[parent.lineno-1 : header_end(parent)])
+        extracted.extend(render(qualname, node))
+        covered_until = node.end_lineno
+    return ''.join(extracted)
+
+
 # test_file_name = '' #must be present in current working directory
 # destination_file_name = ''
 # file_path = os.path.join(os.getcwd(), test_file_name)
@@ -5,111 +5,343 @@
 # Max-Planck-Institute of biological Intelligence, Munich, Germany
 # Authors: Karl Heggenberger, Joergen Kornfeld
 
-import openai
 import os
+import json
+import time
+import asyncio
+import hashlib
+from autodocumentation_python.scan_repository import scan_repository, doc_files
+from autodocumentation_python.gptapi import agpt_chat, run_async
+from autodocumentation_python.tokens import count_tokens, context_window
+from autodocumentation_python.repo_context import split_passages
+from autodocumentation_python.response_cache import DEFAULT_CACHE_DIR, write_json_atomic
 
-def summarize_repo(file_path: str, summarize_repository, Model: str = 'gpt-3.5-turbo-16k', detailed: bool = True) -> str:
+SUMMARY_TOKENS = 1000 #length of a summary (as requested by the commands)
+PROMPT_TOKENS = 200 #tokens of a command (and message overhead)
+SUMMARY_MAX_AGE_DAYS = 90 #stored summaries which have not been used for this time are removed
+RETRY_ROUNDS = 1 #parts which failed (after all retries of their requests) are summarized again this often
+
+#used if all .md/.rst files fit into one request
+COMMAND_DETAILED = """
+Generate a very detailed summary for this repository given its documentation.
+Focus especially on details in the methodologies.
+It is later used to provide additional information when analyzing the repository`s code to
+generate docstrings using the gptAPI.
+The summary should not be longer than 1000 tokens or 750 words.
+Just output the summary.
+"""
+#used for the chunks of the documentation (map) and for groups of summaries (intermediate reduce)
+COMMAND_CHUNK = """Generate a detailed summary for this part of the documentation of a repository. Just output the summary."""
+COMMAND_SUMMARIES = """Combine these summaries of parts of the documentation of a repository into one detailed summary. Just output the summary."""
+#used for the final reduce
+COMMAND_REPOSITORY = """
+Generate a detailed summary for this repository. It is later used
+to provide additional information when analyzing the code to
+generate docstrings using the gptAPI.
+The summary should not be longer than 1000 tokens or 750 words.
+Just output the summary.
+"""
+
+
+def chunk_budget(Model: str) -> int:
+    """
+    Returns the maximum number of tokens of documentation per request (context window minus command
+    and summary).
+    """
+    return context_window(Model) - PROMPT_TOKENS - SUMMARY_TOKENS
+
+
+def pack(sizes: list, budget: int) -> list:
+    """
+    Packs consecutive items into groups whose total size stays within the budget (an item larger than
+    the budget forms its own group).
+
+    Args:
+        sizes (list): The sizes (tokens) of the items.
+        budget (int): The maximum size of a group.
+
+    Returns:
+        list: The groups (lists of indices of the items).
+    """
+    groups = []
+    total = 0
+    for i, size in enumerate(sizes):
+        if groups and total + size <= budget:
+            groups[-1].append(i)
+            total += size
+        else:
+            groups.append([i])
+            total = size
+    return groups
+
+
+def document_chunks(entries: list, budget: int, Model: str = None) -> list:
+    """
+    Splits the .md/.rst files into chunks of at most `budget` tokens. Files are kept as a whole and
+    in their order where possible, larger files are split between paragraphs.
+
+    Args:
+        entries (list): The entries of the .md/.rst files (see `scan_repository`).
+        budget (int): The maximum number of tokens per chunk.
+        Model (str, optional): The model whose tokenizer is used. Defaults to None.
+
+    Returns:
+        list: The chunks (str).
+    """
+    pieces = []
+    for entry in entries:
+        content = entry['content'].strip()
+        if not content:
+            continue
+        text = f"file {entry['rel_path']}:\n{content}"
+        if count_tokens(text, Model) <= budget:
+            pieces.append(text)
+        else:
+            parts = split_passages(content, budget - 50)
+            pieces += [f"file {entry['rel_path']} (part {i+1}/{len(parts)}):\n{part}" for i, part in enumerate(parts)]
+    sizes = [count_tokens(piece, Model) for piece in pieces]
+    return ["\n\n".join(pieces[i] for i in group) for group in pack(sizes, budget)]
+
+
+def reduce_levels(number: int, budget: int, summary_tokens: int = SUMMARY_TOKENS) -> list:
+    """
+    Plans the tree reduction of `number` summaries of about `summary_tokens` tokens (used by the
+    cost estimator).
+
+    Returns:
+        list: The number of requests of every reduce level (the last level is the final summary).
+    """
+    levels = []
+    while number * summary_tokens > budget:
+        number = len(pack([summary_tokens] * number, budget))
+        levels.append(number)
+    levels.append(1)
+    return levels
+
+
+def summary_mode(chunks: list) -> str:
+    """
+    Returns how the documentation is summarized: 'single' (one request) or 'map_reduce'.
+    """
+    return 'single' if len(chunks) == 1 else 'map_reduce'
+
+
+def summary_key(chunks: list, Model: str) -> str:
+    """
+    Returns the hash identifying a summary: the exact documentation sent to the model (paths and
+    content of the .md/.rst files, as split into chunks), the summary mode, the commands and the
+    model. The key only changes if one of them changes.
+    """
+    mode = summary_mode(chunks)
+    commands = [COMMAND_DETAILED] if mode == 'single' else [COMMAND_CHUNK, COMMAND_SUMMARIES, COMMAND_REPOSITORY]
+    data = json.dumps({"model": Model, "mode": mode, "commands": commands,
+                       "chunks": [hashlib.sha256(chunk.encode('utf-8')).hexdigest() for chunk in chunks]})
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def summary_path(key: str, cache_dir: str = None) -> str:
+    """
+    Returns the path of a stored summary (in ~/.cache/autodoc/summaries by default).
+    """
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, 'summaries', f'{key}.json')
+
+
+def load_summary(path: str) -> str:
+    """
+    Returns a stored summary or None (not stored yet or not readable).
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r") as file:
+            summary = json.load(file)['summary']
+        os.utime(path) #mark as recently used
+    except (OSError, ValueError, KeyError):
+        return None
+    return summary
+
+
+def store_summary(path: str, summary: str, chunks: list, Model: str, entries: list) -> None:
+    """
+    Stores a summary together with the files it was generated from and removes stored summaries
+    which have not been used for SUMMARY_MAX_AGE_DAYS (e.g. of documentation which has changed since).
+    """
+    directory = os.path.dirname(path)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            old_path = os.path.join(directory, name)
+            try:
+                if time.time() - os.path.getmtime(old_path) > SUMMARY_MAX_AGE_DAYS * 24 * 3600:
+                    os.remove(old_path)
+            except OSError:
+                pass
+    docs = {entry['rel_path']: hashlib.sha256(entry['content'].encode('utf-8')).hexdigest() for entry in entries}
+    write_json_atomic(path, {"model": Model, "mode": summary_mode(chunks), "docs": docs,
+                             "created": time.strftime('%Y-%m-%d %H:%M:%S'), "summary": summary})
+
+
+def cached_summary(repo_files: dict, Models: list, cache_dir: str = None) -> str:
+    """
+    Looks up a stored summary of the current documentation for any of the models (in this order),
+    without sending a request.
+
+    Args:
+        repo_files (dict): The manifest of the repository (see `scan_repository`).
+        Models (list): The models whose summaries are accepted.
+        cache_dir (str, optional): Directory of the cache. Defaults to None (~/.cache/autodoc).
+
+    Returns:
+        str: The summary of the repository (see `summarize_repo`) or None.
+    """
+    entries = doc_files(repo_files)
+    for Model in Models:
+        chunks = document_chunks(entries, chunk_budget(Model), Model)
+        if not chunks:
+            return None
+        summary = load_summary(summary_path(summary_key(chunks, Model), cache_dir))
+        if summary is not None:
+            print(f'\nSummary of the .md & .rst files loaded from the cache (unchanged documentation, Model: {Model}).')
+            return f'info about repository:\n{summary}'
+    return None
+
+
+async def summarize_text(command: str, text: str, Model: str, semaphore: asyncio.Semaphore = None) -> str:
+    """
+    Summarizes a text with one request (failed requests are retried by the client, see `RetryPolicy`).
+
+    Args:
+        command (str): The command of the request.
+        text (str): The text to be summarized.
+        Model (str): The GPT model.
+        semaphore (asyncio.Semaphore, optional): Limits the number of concurrent requests. Defaults to None.
+
+    Returns:
+        str: The summary.
+    """
+    messages = [
+        {"role": "user", "content": command},
+        {"role": "user", "content": text},
+    ]
+    if semaphore is None:
+        return await agpt_chat(messages, Model=Model, temperature=0.4)
+    async with semaphore:
+        return await agpt_chat(messages, Model=Model, temperature=0.4)
+
+
+async def summarize_all(command: str, texts: list, Model: str, semaphore: asyncio.Semaphore, stage: str) -> tuple:
+    """
+    Summarizes texts concurrently and reports the progress. Texts which could not be summarized
+    (after all retries of their requests) are summarized again in up to RETRY_ROUNDS further rounds
+    and left out if they still fail.
+
+    Returns:
+        tuple: The summaries (list, in the order of the texts) and the number of texts which were left out.
+    """
+    done = 0
+
+    async def summarize(text):
+        nonlocal done
+        try:
+            return await summarize_text(command, text, Model, semaphore)
+        finally:
+            done += 1
+            print(f'    {stage}: {done}/{len(texts)}')
+
+    results = await asyncio.gather(*[summarize(text) for text in texts], return_exceptions=True)
+    for _ in range(RETRY_ROUNDS):
+        failed = [i for i, result in enumerate(results) if isinstance(result, BaseException)]
+        if not failed:
+            break
+        print(f'    {len(failed)} of {len(texts)} parts could not be summarized and are summarized again.')
+        retried = await asyncio.gather(*[summarize_text(command, texts[i], Model, semaphore) for i in failed],
+                                       return_exceptions=True)
+        for i, result in zip(failed, retried):
+            results[i] = result
+    failed = [result for result in results if isinstance(result, BaseException)]
+    if len(failed) == len(results):
+        raise failed[0]
+    if failed:
+        print(f'    {len(failed)} of {len(texts)} parts could not be summarized and are left out ({failed[0]}).')
+    return [result for result in results if not isinstance(result, BaseException)], len(failed)
+
+
+async def map_reduce(chunks: list, Model: str, concurrency: int) -> tuple:
+    """
+    Summarizes the chunks concurrently (map) and combines the summaries in a tree (groups of
+    summaries which fit into one request are summarized again) until all summaries fit into the
+    final request.
+
+    Returns:
+        tuple: The summary (str) and True if parts of the documentation were left out (see `summarize_all`).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    budget = chunk_budget(Model)
+    summaries, left_out = await summarize_all(COMMAND_CHUNK, chunks, Model, semaphore, stage='summarized parts')
+    level = 1
+    while sum(count_tokens(summary, Model) for summary in summaries) > budget and len(summaries) > 1:
+        groups = pack([count_tokens(summary, Model) for summary in summaries], budget)
+        if len(groups) == len(summaries):
+            break #the summaries can not be combined any further
+        texts = ["\n\n".join(summaries[i] for i in group) for group in groups]
+        summaries, failed = await summarize_all(COMMAND_SUMMARIES, texts, Model, semaphore, stage=f'combined summaries (level {level})')
+        left_out += failed
+        level += 1
+    return await summarize_text(COMMAND_REPOSITORY, "\n\n".join(summaries), Model, semaphore), left_out > 0
+
+
+def summarize_repo(file_path: str, summarize_repository, Model: str = 'gpt-3.5-turbo-16k', repo_files: dict = None,
+                   concurrency: int = 4, cache_dir: str = None, use_cache: bool = True, refresh: bool = False) -> str:
     """
     Analyzes a repository and generates a summary using the GPT API.
-    
-    This function takes in the path of a repository, a model, and a boolean indicating whether a detailed 
-    analysis is required. It reads all .md and .rst files in the repository, feeds them into the GPT API, 
-    and generates a summary. If the detailed flag is set to True, all files are combined into a single 
-    string and fed into the GPT API. If the detailed flag is set to False, each file is summarized 
-    individually and the summaries are combined into a final summary.
-    
+
+    This function reads all .md and .rst files of the repository. If they fit into the context window
+    of the model, they are summarized with a single request. Otherwise they are split into chunks
+    (map-reduce): the chunks are summarized concurrently and the summaries are combined in a tree
+    until they fit into one final request. Failed requests are retried per chunk (and failed chunks
+    once more, see `summarize_all`). The summary is stored with a hash of the documentation, the summary mode and the model (see
+    `summary_key`), so later runs with unchanged documentation reuse it without any request. A summary
+    in which parts of the documentation are missing is not stored.
+
     Args:
         file_path (str): The path of the repository to be analyzed.
         Model (str): The model to be used by the GPT API for generating the summary.
-        detailed (bool, optional): A flag indicating whether a detailed analysis is required. 
-                                   Defaults to True.
-    
+        repo_files (dict, optional): The manifest of the repository (see `scan_repository`), which
+                                     contains the .md and .rst files. Defaults to None (the repository is scanned).
+        concurrency (int, optional): The maximum number of concurrent requests. Defaults to 4.
+        cache_dir (str, optional): Directory of the cache. Defaults to None (~/.cache/autodoc).
+        use_cache (bool, optional): If True, stored summaries are reused and new ones are stored. Defaults to True.
+        refresh (bool, optional): If True, a stored summary is ignored (and replaced). Defaults to False.
+
     Returns:
-        str: The generated summary of the repository. If no additional information about the environment 
+        str: The generated summary of the repository. If no additional information about the environment
              in which the file is embedded is found, None is returned.
     """
     if not summarize_repository:
         return None
     print('\nSummarizing repository using .rst and .md files ...')
-    if detailed:
-        all_content = []
-        for root, _, files in os.walk(file_path):
-            for file in files:
-                if file.endswith((".md", ".rst")):
-                    file_path = os.path.join(root, file)
-                    with open(file_path, "r") as file:
-                        content = file.read()
-                    all_content.append(content)
-        all_content = "\n\n".join(all_content)
-
-        if all_content == "":
-            print('    No additional info about the environment in which the file is embedded.')
-            return None
+    if repo_files is None:
+        repo_files = scan_repository(file_path)
+    entries = doc_files(repo_files)
+    chunks = document_chunks(entries, chunk_budget(Model), Model)
+    if not chunks:
+        print('    No additional info about the environment in which the file is embedded.')
+        return None
 
-        command = """
-Generate a very detailed summary for this repository given its documentation. 
-Focus especially on details in the methodologies.
-It is later used to provide additional information when analyzing the repository`s code to 
-generate docstrings using the gptAPI. 
-The summary should not be longer than 1000 tokens or 750 words.
-Just output the summary.
-"""
-        response = openai.ChatCompletion.create(
-            model=Model,
-            messages=[
-                {"role": "user", "content": command},
-                {"role": "user", "content": all_content},
-            ],
-            temperature=0.4,
-        )
-        summary = response['choices'][0]['message']['content']
-        output = f'info about repository:\n{summary}'
-
-        return output
-    
-
-    if not detailed:
-        summary = []
-        for root, _, files in os.walk(file_path):
-            for file in files:
-                if file.endswith((".md", ".rst")):
-                    file_path = os.path.join(root, file)
-                    with open(file_path, "r") as file:
-                        content = file.read()
-                    
-                    command = """Generate a detailed summary for this file. Just output the summary."""
-                    response = openai.ChatCompletion.create(
-                        model=Model,
-                        messages=[
-                            {"role": "user", "content": command},
-                            {"role": "user", "content": content},
-                        ],
-                        temperature=0.4,
-                    )
-                    answer = response['choices'][0]['message']['content']
-                    summary.append(answer)
-
-        summary = "\n\n".join(summary)
-
-        if summary == "":
-            print('    No additional info about the environment in which the file is embedded.')
-            return None
-        
-        command = """
-Generate a detailed summary for this repository. It is later used 
-to provide additional information when analyzing the code to 
-generate docstrings using the gptAPI.
-Just output the summary.
-"""
-        response = openai.ChatCompletion.create(
-            model=Model,
-            messages=[
-                {"role": "user", "content": command},
-                {"role": "user", "content": summary},
-            ],
-            temperature=0.4,
-        )
-        final_answer = response['choices'][0]['message']['content']
-        output = f'info about repository:\n{final_answer}'
-
-        return output
+    path = summary_path(summary_key(chunks, Model), cache_dir)
+    summary = load_summary(path) if use_cache and not refresh else None
+    if summary is not None:
+        print(f'    Loaded from the cache (unchanged documentation, Model: {Model}).')
+    else:
+        partial = False
+        if len(chunks) == 1:
+            summary = run_async(summarize_text(COMMAND_DETAILED, chunks[0], Model))
+        else:
+            print(f'    The documentation is split into {len(chunks)} parts (Model: {Model}).')
+            summary, partial = run_async(map_reduce(chunks, Model, concurrency))
+        if partial:
+            print('    Parts of the documentation are missing in the summary, so it is not stored in the cache.')
+        elif use_cache:
+            store_summary(path, summary, chunks, Model, entries)
+    output = f'info about repository:\n{summary}'
+
+    return output
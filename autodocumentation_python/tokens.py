@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import functools
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of tokens of a text (one token is roughly 4 characters). Used if
+    no tokenizer is available.
+    """
+    return (len(text) + 3) // 4
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str = None):
+    """
+    Returns the BPE tokenizer (tiktoken) of a model, or None if tiktoken is not installed or the
+    encoding can not be loaded (tiktoken downloads each encoding once and keeps it in its cache
+    directory, set TIKTOKEN_CACHE_DIR to use a pre-filled cache offline).
+
+    Args:
+        model (str, optional): The GPT model. Defaults to None (cl100k_base, used by all gpt-3.5/gpt-4 models).
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding('cl100k_base')
+    except KeyError:
+        return get_encoding(None)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """
+    Counts the tokens of a text with the tokenizer of the model (falls back to `estimate_tokens`).
+
+    Args:
+        text (str): The text.
+        model (str, optional): The GPT model. Defaults to None.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = None) -> str:
+    """
+    Shortens a text to at most `max_tokens` tokens (with the tokenizer of the model, otherwise by the
+    estimate of `estimate_tokens`).
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max(0, 4 * max_tokens - 3)]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def count_message_tokens(messages: list, model: str = None) -> int:
+    """
+    Counts the prompt tokens of chat messages (content plus the few tokens of overhead per message).
+
+    Args:
+        messages (list): The messages ({"role": ..., "content": ...}).
+        model (str, optional): The GPT model. Defaults to None.
+
+    Returns:
+        int: The number of prompt tokens.
+    """
+    return 3 + sum(4 + count_tokens(message["content"], model) for message in messages)
+
+
+# context window [tokens] and maximum length of an answer [tokens] of the models
+CONTEXT_WINDOWS = {
+    'gpt-4-1106-preview': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo-16k': 16385,
+    'gpt-3.5-turbo': 4096,
+}
+MAX_OUTPUT_TOKENS = {
+    'gpt-4-1106-preview': 4096,
+}
+DEFAULT_CONTEXT_WINDOW = 8192 #for unknown models
+OUTPUT_RATIO = 0.5 #expected length of an answer (definitions with docstrings) relative to the code
+
+
+def context_window(model: str) -> int:
+    """
+    Returns the context window of a model (longest matching name in `CONTEXT_WINDOWS`, so e.g.
+    'gpt-4-0613' is treated as 'gpt-4').
+    """
+    names = [name for name in CONTEXT_WINDOWS if model == name or model.startswith(name + '-')]
+    return CONTEXT_WINDOWS[max(names, key=len)] if names else DEFAULT_CONTEXT_WINDOW
+
+
+def max_output_tokens(model: str) -> int:
+    """
+    Returns the maximum length of an answer of a model (the whole context window if not limited).
+    """
+    return MAX_OUTPUT_TOKENS.get(model, context_window(model))
+
+
+def code_token_budget(model: str, prompt_tokens: int = 0, output_ratio: float = OUTPUT_RATIO) -> int:
+    """
+    Calculates how many tokens of code fit into one request: the prompt (command, additional info
+    and code) and the expected answer (`output_ratio` times the code) must fit into the context
+    window, and the answer must not be longer than the maximum answer of the model.
+
+    Args:
+        model (str): The GPT model.
+        prompt_tokens (int, optional): The tokens of the prompt without the code. Defaults to 0.
+        output_ratio (float, optional): Expected length of the answer relative to the code. Defaults to
+            `OUTPUT_RATIO` (the answer only contains definitions and docstrings).
+
+    Returns:
+        int: The maximum number of tokens of code per request.
+    """
+    budget = (context_window(model) - prompt_tokens) / (1 + output_ratio)
+    return max(0, int(min(budget, max_output_tokens(model) / output_ratio)))
@@ -21,10 +21,13 @@ setup(
     author='Karl Heggenberger, Joergen Kornfeld.',
     author_email='Karl_Heggenberger@LinkedIn.com',
     packages = find_packages(),
+    python_requires = '>=3.9',
     install_requires = install_requires,
     entry_points = {
     'console_scripts': [
         'autodoc = autodocumentation_python.main:execute',
+        'autodoc-batch = autodocumentation_python.batch_runner:execute',
+        'autodoc-benchmark = autodocumentation_python.benchmark:execute',
     ]
 }
 )
\ No newline at end of file
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# autodoc - automatic documentation for Python code
+#
+# Copyright (c) 2023 - now
+# Max-Planck-Institute of biological Intelligence, Munich, Germany
+# Authors: Karl Heggenberger, Joergen Kornfeld
+
+import os
+import pathlib
+import pytest
+from git import Repo
+from autodocumentation_python.clone_source import clone_source, clone_repository, is_valid_url
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+@pytest.fixture
+def bare_repository(tmp_path):
+    """
+    A local bare repository (stand-in for a remote one) with two commits and a binary file.
+    """
+    work = tmp_path / 'work'
+    repo = Repo.init(work)
+    write(str(work / 'package' / 'module.py'), b'def f():\n    return 1\n')
+    write(str(work / 'README.md'), b'# Test\n')
+    repo.index.add(['package/module.py', 'README.md'])
+    repo.index.commit('first commit')
+    write(str(work / 'docs' / 'index.rst'), b'Docs\n====\n')
+    write(str(work / 'assets' / 'image.bin'), bytes(range(256)) * 64)
+    write(str(work / 'setup.cfg'), b'[metadata]\n')
+    repo.index.add(['docs/index.rst', 'assets/image.bin', 'setup.cfg'])
+    repo.index.commit('second commit')
+    bare = tmp_path / 'bare.git'
+    repo.clone(str(bare), bare=True)
+    return bare
+
+
+def checked_out_files(directory):
+    files = set()
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [d for d in dirs if d != '.git']
+        files.update(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/') for name in names)
+    return files
+
+
+def assert_shallow_and_sparse(target_dir):
+    repo = Repo(target_dir)
+    assert repo.git.rev_list('--count', 'HEAD') == '1' #depth 1: only the latest commit
+    assert repo.head.commit.message.strip() == 'second commit'
+    assert checked_out_files(target_dir) == {'package/module.py', 'README.md', 'docs/index.rst'}
+
+
+def test_clone_repository_is_shallow_and_sparse(bare_repository, tmp_path):
+    target_dir = tmp_path / 'clone'
+    os.makedirs(target_dir)
+    clone_repository(bare_repository.as_uri(), str(target_dir))
+    assert_shallow_and_sparse(str(target_dir))
+
+
+def test_clone_source_clones_a_local_bare_repository(bare_repository, tmp_path):
+    target_dir = tmp_path / 'edited_repository'
+    clone_source(str(bare_repository), str(target_dir), assume_yes=True)
+    assert_shallow_and_sparse(str(target_dir))
+
+
+@pytest.mark.parametrize('url', [
+    'https://github.com/StructuralNeurobiologyLab/autodoc',
+    'https://github.com/StructuralNeurobiologyLab/autodoc.git',
+    'http://example.com/repository.git',
+    'ssh://git@github.com/StructuralNeurobiologyLab/autodoc.git',
+    'git://example.com/repository.git',
+    'git@github.com:StructuralNeurobiologyLab/autodoc.git', #scp-like
+    'user@host.example.com:path/to/repository.git',
+])
+def test_is_valid_url_accepts_repository_urls(url):
+    assert is_valid_url(url)
+
+
+def test_is_valid_url_rejects_local_paths(tmp_path):
+    directory = tmp_path / 'repository'
+    os.makedirs(directory)
+    file_path = directory / 'module.py'
+    file_path.write_text('x = 1\n')
+    assert not is_valid_url(str(directory))
+    assert not is_valid_url(str(file_path))
+    assert not is_valid_url('relative/path/to/repository')
+    assert not is_valid_url('module.py')
+    assert not is_valid_url('https://') #no host
+    assert not is_valid_url('C:\\Users\\repository')
+
+
+def test_is_valid_url_checks_file_urls(tmp_path):
+    assert is_valid_url(pathlib.Path(tmp_path).as_uri())
+    assert not is_valid_url((pathlib.Path(tmp_path) / 'missing').as_uri())